@@ -0,0 +1,145 @@
+"""
+Нагрузочный тест отправки ответов на тест (POST /quiz/attempt).
+
+Тест из --questions вопросов, --submissions попыток от разных пользователей в
+--concurrency потоков через TestClient. Печатает попыток/с и число SQL-запросов
+на одну попытку. По умолчанию — временная SQLite в файле; для замера на MySQL
+передайте --database-url (таблицы будут созданы, данные теста — добавлены).
+
+Запуск из каталога server:
+    python benchmarks/bench_quiz_submit.py --questions 50 --submissions 2000 --concurrency 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("JWT_SECRET", "benchmark")
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
+os.environ.setdefault("JWT_EXPIRE_MINUTES", "60")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app import app  # noqa: E402
+from database import Base, get_db  # noqa: E402
+from models_db import Question, Quiz, User  # noqa: E402
+from routes.user_routes import get_current_user  # noqa: E402
+
+
+def seed(Session, questions: int, users: int) -> tuple:
+    db = Session()
+    try:
+        quiz = Quiz(title="Аттестация", is_test=True)
+        db.add(quiz)
+        db.flush()
+        rows = []
+        for index in range(questions):
+            kind = ("single_choice", "multiple_choice", "text")[index % 3]
+            correct = {"single_choice": 1, "multiple_choice": [1, 2], "text": "Ответ"}[kind]
+            rows.append(Question(quiz_id=quiz.id, text=f"Вопрос {index}", question_type=kind, correct_answer=correct, order=index))
+        db.add_all(rows)
+        first_user = (db.query(User.id).order_by(User.id.desc()).limit(1).scalar() or 0) + 1
+        db.add_all([
+            User(id=first_user + i, login=f"bench{first_user + i}", password="x", role_id=1, department_id=1, access_id=1)
+            for i in range(users)
+        ])
+        db.commit()
+        return quiz.id, [(q.id, q.question_type) for q in rows], list(range(first_user, first_user + users))
+    finally:
+        db.close()
+
+
+def payload(quiz_id: int, questions: list, number: int) -> dict:
+    answers = []
+    for question_id, kind in questions:
+        correct = (question_id + number) % 2 == 0
+        if kind == "single_choice":
+            answer = 1 if correct else 2
+        elif kind == "multiple_choice":
+            answer = [1, 2] if correct else [1]
+        else:
+            answer = "ответ" if correct else "нет"
+        answers.append({"question_id": question_id, "answer": answer})
+    return {"quiz_id": quiz_id, "answers": answers}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--submissions", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    temp_dir = None
+    url = args.database_url
+    if url is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(temp_dir.name, 'bench.db')}"
+    connect_args = {"check_same_thread": False, "timeout": 60} if url.startswith("sqlite") else {}
+    engine = create_engine(url, connect_args=connect_args, pool_size=args.concurrency, max_overflow=0)
+    if url.startswith("sqlite"):
+        event.listen(engine, "connect", lambda connection, record: connection.execute("PRAGMA journal_mode=WAL"))
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    quiz_id, questions, user_ids = seed(Session, args.questions, args.users)
+
+    # Отправляет администратор от имени пользователей: проверка прав не зависит от потока
+    admin = User(id=user_ids[0], role_id=1, department_id=1, access_id=1)
+
+    def override_get_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    statements = [0]
+    lock = threading.Lock()
+
+    def count_statement(*args):
+        with lock:
+            statements[0] += 1
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_current_user] = lambda: admin
+    client = TestClient(app)
+
+    def submit(number: int) -> None:
+        user_id = user_ids[number % len(user_ids)]
+        response = client.post(f"/quiz/attempt?user_id={user_id}", json=payload(quiz_id, questions, number))
+        if response.status_code != 201:
+            raise RuntimeError(f"{response.status_code}: {response.text}")
+
+    # Прогрев (импорт, компиляция запросов)
+    for number in range(min(20, args.submissions)):
+        submit(number)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(submit, range(args.submissions)))
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", count_statement)
+
+    print(f"База: {engine.dialect.name}, вопросов: {args.questions}, потоков: {args.concurrency}")
+    print(f"Попыток: {args.submissions} за {elapsed:.2f} с — {args.submissions / elapsed:.1f} попыток/с")
+    print(f"SQL-запросов на попытку: {statements[0] / args.submissions:.1f}")
+
+    app.dependency_overrides.clear()
+    engine.dispose()
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
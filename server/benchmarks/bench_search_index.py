@@ -0,0 +1,111 @@
+"""
+Бенчмарк полнотекстового индекса контента на синтетическом отделе.
+
+Документы: название из 3-6 слов, описание из 10-20 слов, имя файла из 2-3 слов;
+слова берутся из словаря с распределением Ципфа. Запросы — 1-3 слова из случайного
+документа, последнее слово иногда обрезано (ввод по мере набора). Перед поиском
+часть документов обновляется, чтобы запросы проходили и через дельту.
+
+Запуск из каталога server:
+    python benchmarks/bench_search_index.py --documents 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from search_index import ContentSearchIndex, IndexedDocument, tokenize  # noqa: E402
+
+LETTERS = "абвгдежзиклмнопрстуфхцчшэюя"
+
+
+def make_vocabulary(size: int, rng: np.random.Generator) -> list:
+    words = set()
+    while len(words) < size:
+        length = int(rng.integers(3, 12))
+        words.add("".join(rng.choice(list(LETTERS), size=length)))
+    # Частота слова (ранг Ципфа) не должна зависеть от алфавитного порядка
+    return list(rng.permutation(sorted(words)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    ranks = np.minimum(rng.zipf(1.3, size=args.documents * 30), args.vocabulary) - 1
+    position = 0
+
+    def words(count: int) -> str:
+        nonlocal position
+        chunk = ranks[position:position + count]
+        position += count
+        return " ".join(vocabulary[i] for i in chunk)
+
+    documents = [
+        IndexedDocument(
+            id=doc_id,
+            title=words(int(rng.integers(3, 7))),
+            description=words(int(rng.integers(10, 21))),
+            file_path=f"/app/files/ContentForDepartment/1/{words(int(rng.integers(2, 4))).replace(' ', '_')}.pdf",
+            access_level=1,
+            department_id=1,
+            tag_id=None,
+        )
+        for doc_id in range(1, args.documents + 1)
+    ]
+
+    index = ContentSearchIndex()
+    started = time.perf_counter()
+    with index._lock:
+        index._load(documents)
+        index._built_at = time.monotonic()
+    build_seconds = time.perf_counter() - started
+
+    # Изменения после построения попадают в дельту: обновляем часть документов
+    started = time.perf_counter()
+    for doc_id in rng.integers(1, args.documents + 1, args.updates):
+        index.upsert(index._documents[int(doc_id)][0])
+    update_ms = (time.perf_counter() - started) * 1000 / max(args.updates, 1)
+
+    queries = []
+    for doc_id in rng.integers(1, args.documents + 1, args.queries):
+        document = index._documents[int(doc_id)][0]
+        tokens = tokenize(f"{document.title} {document.description}")
+        picked = [tokens[i] for i in rng.choice(len(tokens), size=int(rng.integers(1, 4)), replace=False)]
+        if rng.random() < 0.5:
+            picked[-1] = picked[-1][:max(2, len(picked[-1]) - 2)]
+        queries.append(" ".join(picked))
+
+    latencies, totals = [], []
+    for query in queries:
+        started = time.perf_counter()
+        total, _ = index.search(None, 1, 1, query, limit=20)
+        latencies.append((time.perf_counter() - started) * 1000)
+        totals.append(total)
+
+    latencies = np.array(latencies)
+    print(
+        f"Документов: {args.documents}, терминов: {len(index._partitions[(1, 1)].base.terms)}, "
+        f"построение: {build_seconds:.1f} с, обновление: {update_ms:.3f} мс"
+    )
+    print(
+        f"Поиск: p50 {np.percentile(latencies, 50):.2f} мс, p95 {np.percentile(latencies, 95):.2f} мс, "
+        f"p99 {np.percentile(latencies, 99):.2f} мс, среднее найдено {np.mean(totals):.0f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Бенчмарк двухэтапного поиска (центроиды документов -> чанки) против полного перебора.
+
+Синтетический отдел: документы с собственной "темой", чанки документа — шум вокруг темы.
+Запросы — зашумленные чанки. Recall@k считается относительно полного перебора.
+
+Запуск из каталога server:
+    python benchmarks/bench_two_stage.py --documents 2000 --chunks-per-document 20 --top-docs 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from rag_index import DepartmentIndex, normalize_rows, top_n  # noqa: E402
+
+
+def build_index(documents: int, chunks_per_document: int, dimension: int, spread: float, seed: int) -> DepartmentIndex:
+    rng = np.random.default_rng(seed)
+    topics = normalize_rows(rng.standard_normal((documents, dimension)).astype(np.float32))
+    noise = rng.standard_normal((documents, chunks_per_document, dimension)).astype(np.float32) * spread
+    vectors = normalize_rows((topics[:, None, :] + noise).reshape(-1, dimension))
+    size = documents * chunks_per_document
+    return DepartmentIndex(
+        department_id=0,
+        version_key=(),
+        chunk_ids=np.arange(size, dtype=np.int64),
+        content_ids=np.repeat(np.arange(documents, dtype=np.int64), chunks_per_document),
+        chunk_indexes=np.tile(np.arange(chunks_per_document, dtype=np.int64), documents),
+        vectors=vectors,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--chunks-per-document", type=int, default=20)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--spread", type=float, default=0.08, help="Разброс чанков вокруг темы документа")
+    parser.add_argument("--top-docs", type=int, default=20, help="N документов на первом этапе")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    index = build_index(args.documents, args.chunks_per_document, args.dimension, args.spread, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    sample = rng.integers(0, index.size, args.queries)
+    queries = normalize_rows(index.vectors[sample] + rng.standard_normal((args.queries, args.dimension)).astype(np.float32) * 0.05)
+
+    def run(top_documents):
+        results, started = [], time.perf_counter()
+        for query in queries:
+            rows, scores = index.search(query, top_documents=top_documents)
+            results.append(set(rows[top_n(scores, args.k)].tolist()))
+        return results, (time.perf_counter() - started) / args.queries * 1000
+
+    flat, flat_ms = run(None)
+    two_stage, two_stage_ms = run(args.top_docs)
+    recall = np.mean([len(a & b) / args.k for a, b in zip(flat, two_stage)])
+    scored = args.top_docs * args.chunks_per_document
+
+    print(f"Чанков: {index.size}, документов: {args.documents}, размерность: {args.dimension}")
+    print(f"Полный перебор:  {flat_ms:.3f} мс/запрос, оценено {index.size} чанков")
+    print(f"Двухэтапный:     {two_stage_ms:.3f} мс/запрос, оценено {args.documents} центроидов + {scored} чанков")
+    print(f"Ускорение: x{flat_ms / two_stage_ms:.1f}, recall@{args.k} относительно полного перебора: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
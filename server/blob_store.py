@@ -0,0 +1,137 @@
+"""
+Хранилище файлов контента с адресацией по содержимому (sha256) и дедупликацией
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models_db import Content
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "/app/files/Blobs")
+
+
+class BlobStore:
+    """
+    Каждое уникальное содержимое хранится один раз: root/ab/cd/<sha256>.
+
+    Путь Content.file_path (в каталоге отдела) — жесткая ссылка на блоб, поэтому
+    весь код, читающий файлы по file_path, работает без изменений, а одинаковые
+    файлы в разных отделах занимают место на диске один раз. Если жесткая ссылка
+    невозможна (другой раздел диска), файл копируется.
+
+    Счетчик ссылок — число строк content с этим file_hash: release() удаляет блоб,
+    только когда на него не ссылается ни одна строка. Данные уже созданных ссылок
+    при этом не теряются (у жесткой ссылки свой счетчик в файловой системе).
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    # Сколько раз store() пересоздает блоб, если его удалили между созданием и ссылкой
+    STORE_ATTEMPTS = 3
+
+    def _put(self, temp_path: str, sha256: str) -> str:
+        """Кладет копию (жесткую ссылку) временного файла в хранилище, если такого блоба еще нет"""
+        path = self.path_for(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Жесткая ссылка невозможна — копия под временным именем и атомарная замена
+            fd, copy_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".blob-")
+            os.close(fd)
+            try:
+                shutil.copyfile(temp_path, copy_path)
+                os.replace(copy_path, path)
+            except BaseException:
+                if os.path.exists(copy_path):
+                    os.unlink(copy_path)
+                raise
+        return path
+
+    def store(self, temp_path: str, sha256: str, destination: str) -> str:
+        """
+        Переносит записанный файл в хранилище (если такого блоба еще нет) и ставит
+        destination ссылкой на блоб. Временный файл удаляется только после создания
+        ссылки: если параллельный release() удалил блоб между этими шагами, блоб
+        создается заново из временного файла, и загрузка не теряется.
+        """
+        try:
+            for attempt in range(self.STORE_ATTEMPTS):
+                self._put(temp_path, sha256)
+                try:
+                    return self.link(sha256, destination)
+                except FileNotFoundError:
+                    if attempt == self.STORE_ATTEMPTS - 1:
+                        raise
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def adopt_existing(self, file_path: str, sha256: str) -> None:
+        """Делает существующий файл ссылкой на блоб (перенос старых файлов в хранилище)"""
+        path = self.path_for(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(file_path, path)
+                return
+            except OSError:
+                shutil.copyfile(file_path, path)
+        if not os.path.samefile(file_path, path):
+            self.link(sha256, file_path)
+
+    def link(self, sha256: str, destination: str) -> str:
+        """Атомарно создает (или заменяет) destination ссылкой на блоб"""
+        directory = os.path.dirname(destination)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".link-")
+        os.close(fd)
+        os.unlink(temp_path)
+        try:
+            try:
+                os.link(self.path_for(sha256), temp_path)
+            except FileNotFoundError:
+                # Блоба нет (удален release()) — копировать нечего
+                raise
+            except OSError:
+                shutil.copyfile(self.path_for(sha256), temp_path)
+            os.replace(temp_path, destination)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return destination
+
+    @staticmethod
+    def references(db: Session, sha256: str) -> int:
+        return db.execute(select(func.count(Content.id)).where(Content.file_hash == sha256)).scalar_one()
+
+    def release(self, db: Session, hashes: Iterable[Optional[str]]) -> int:
+        """Удаляет блобы, на которые больше не ссылается ни одна строка content; возвращает их число"""
+        removed = 0
+        for sha256 in set(filter(None, hashes)):
+            if self.references(db, sha256) == 0 and self.exists(sha256):
+                try:
+                    os.unlink(self.path_for(sha256))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+# Глобальный экземпляр хранилища
+blob_store = BlobStore()
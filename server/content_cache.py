@@ -0,0 +1,121 @@
+"""
+Кэш метаданных документов (Content) для RAG и списков контента
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from models_db import Content
+
+
+@dataclass(frozen=True)
+class ContentMeta:
+    id: int
+    title: str
+    file_path: str
+    access_level: int
+    tag_id: Optional[int]
+    department_id: int
+
+
+class ContentMetadataCache:
+    """
+    Процессный кэш метаданных документов, сгруппированный по отделам.
+
+    Метаданные отдела загружаются одним запросом при первом обращении.
+    Любое изменение контента (загрузка, обновление, удаление) должно вызывать
+    invalidate(): это сбрасывает данные затронутых отделов и увеличивает version,
+    по которой зависимые кэши понимают, что их данные устарели.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._departments: Dict[int, Dict[int, ContentMeta]] = {}
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get_department(self, db: Session, department_id: int) -> Dict[int, ContentMeta]:
+        """Возвращает {content_id: ContentMeta} для отдела, загружая его одним запросом"""
+        with self._lock:
+            cached = self._departments.get(department_id)
+            version = self._version
+        if cached is not None:
+            return cached
+
+        rows = db.query(
+            Content.id,
+            Content.title,
+            Content.file_path,
+            Content.access_level,
+            Content.tag_id,
+            Content.department_id,
+        ).filter(Content.department_id == department_id).all()
+        loaded = {row.id: ContentMeta(*row) for row in rows}
+
+        with self._lock:
+            # Если пока шла загрузка кэш инвалидировали, не сохраняем устаревшие данные
+            if version == self._version:
+                self._departments[department_id] = loaded
+        return loaded
+
+    def invalidate(self, department_ids: Optional[Iterable[Optional[int]]] = None) -> None:
+        """Сбрасывает кэш указанных отделов (или весь кэш) и увеличивает версию"""
+        with self._lock:
+            if department_ids is None:
+                self._departments.clear()
+            else:
+                for department_id in department_ids:
+                    if department_id is not None:
+                        self._departments.pop(department_id, None)
+            self._version += 1
+
+
+class ResponseCache:
+    """
+    Ограниченный кэш готовых ответов.
+
+    Ключ должен включать версии данных (content_metadata_cache.version и т.п.):
+    после изменения данных запросы приходят с новым ключом, а старые записи
+    вытесняются по LRU или истекают по TTL. Закэшированные значения нельзя изменять.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at >= self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Глобальный экземпляр кэша
+content_metadata_cache = ContentMetadataCache()
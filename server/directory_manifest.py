@@ -0,0 +1,138 @@
+"""
+Кэш манифестов каталогов файлов: список файлов с размерами, число и общий объем
+"""
+
+import concurrent.futures
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# Как часто сверять mtime каталога (секунды): в промежутке ответ — только поиск в словаре.
+# Загрузка и удаление через API сбрасывают манифест сразу
+MANIFEST_RECHECK_SECONDS = float(os.getenv("MANIFEST_RECHECK_SECONDS", "2"))
+
+
+@dataclass(frozen=True)
+class FileEntry:
+    name: str
+    size: int
+
+
+@dataclass(frozen=True)
+class DirectoryManifest:
+    path: str
+    mtime_ns: int
+    files: Tuple[FileEntry, ...]
+    directories: Tuple[str, ...]
+    total_size: int
+
+    @property
+    def file_count(self) -> int:
+        return len(self.files)
+
+
+def scan_directory(path: str) -> DirectoryManifest:
+    """
+    Один проход os.scandir. mtime берется до чтения каталога: если каталог изменится
+    во время прохода, следующая сверка увидит новое значение и перечитает его.
+    Скрытые файлы (временные файлы загрузки) не учитываются.
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    files = []
+    directories = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir():
+                    directories.append(entry.name)
+                elif entry.is_file():
+                    files.append(FileEntry(entry.name, entry.stat().st_size))
+            except FileNotFoundError:
+                continue
+    files.sort(key=lambda file: file.name)
+    directories.sort()
+    return DirectoryManifest(
+        path=path,
+        mtime_ns=mtime_ns,
+        files=tuple(files),
+        directories=tuple(directories),
+        total_size=sum(file.size for file in files),
+    )
+
+
+class DirectoryManifestCache:
+    """
+    Процессный кэш манифестов по пути каталога.
+
+    Манифест действителен, пока не изменился mtime каталога (добавление, удаление,
+    переименование файла); mtime сверяется не чаще раза в MANIFEST_RECHECK_SECONDS.
+    Загрузка и удаление файлов через API вызывают invalidate(): манифест сбрасывается
+    и перечитывается в фоновом потоке, чтобы следующий запрос застал его готовым.
+    """
+
+    def __init__(self, recheck_seconds: float = MANIFEST_RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        # путь -> (манифест, время последней сверки mtime)
+        self._entries: Dict[str, Tuple[DirectoryManifest, float]] = {}
+        self._versions: Dict[str, int] = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="dir-manifest")
+
+    def get(self, path: str) -> Optional[DirectoryManifest]:
+        """Манифест каталога или None, если каталога нет"""
+        path = os.path.normpath(path)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(path)
+            version = self._versions.get(path, 0)
+        if cached is not None:
+            manifest, checked_at = cached
+            if now - checked_at < self.recheck_seconds:
+                return manifest
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self.invalidate(path, refresh=False)
+                return None
+            if mtime_ns == manifest.mtime_ns:
+                with self._lock:
+                    if self._versions.get(path, 0) == version:
+                        self._entries[path] = (manifest, now)
+                return manifest
+        return self._load(path, version)
+
+    def _load(self, path: str, version: int) -> Optional[DirectoryManifest]:
+        try:
+            manifest = scan_directory(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        with self._lock:
+            # Если во время прохода манифест сбросили, не сохраняем возможно устаревший
+            if self._versions.get(path, 0) == version:
+                self._entries[path] = (manifest, time.monotonic())
+        return manifest
+
+    def invalidate(self, *paths: str, refresh: bool = True) -> None:
+        """Сбрасывает манифесты каталогов и (по умолчанию) перечитывает их в фоне"""
+        for path in paths:
+            path = os.path.normpath(path)
+            with self._lock:
+                self._entries.pop(path, None)
+                version = self._versions.get(path, 0) + 1
+                self._versions[path] = version
+            if refresh:
+                self._executor.submit(self._load, path, version)
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self._entries:
+                self._versions[path] = self._versions.get(path, 0) + 1
+            self._entries.clear()
+
+
+# Глобальный экземпляр кэша
+directory_manifests = DirectoryManifestCache()
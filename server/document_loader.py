@@ -1,176 +1,230 @@
 import os
-from typing import List, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional
 import time
 import concurrent.futures
 import threading
 
-def vec_search(embedding_model, query, db, n_top_cos: int = 10, timeout: int = 20):
+
+class VecSearchResult(NamedTuple):
+    """Результат vec_search: одинаковая форма и при успехе, и при ошибке/таймауте"""
+    chunks: List[str]
+    files: List[str]
+    details: List[Dict[str, Any]]
+
+
+class SearchCancelled(Exception):
+    """Поиск отменен: истек дедлайн или вызывающий перестал ждать результат"""
+
+
+# Общий ограниченный пул для векторного поиска вместо отдельного потока на каждый вызов.
+# Семафор ограничивает число задач в пуле (выполняемые + в очереди), чтобы под нагрузкой
+# запросы не копились бесконечно.
+VEC_SEARCH_WORKERS = int(os.getenv('VEC_SEARCH_WORKERS', '4'))
+_search_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=VEC_SEARCH_WORKERS, thread_name_prefix='vec-search'
+)
+_search_slots = threading.BoundedSemaphore(VEC_SEARCH_WORKERS * 2)
+
+
+def _empty_result() -> VecSearchResult:
+    return VecSearchResult([], [], [])
+
+
+def enhance_query(original_query: str) -> List[str]:
+    """Генерирует дополнительные варианты запроса для лучшего поиска"""
+    queries = [original_query]
+    
+    # Добавляем ключевые слова
+    words = original_query.lower().split()
+    if len(words) > 1:
+        # Добавляем отдельные ключевые слова
+        for word in words:
+            if len(word) > 3:  # Игнорируем короткие слова
+                queries.append(word)
+    
+    # Добавляем варианты без вопросительных слов
+    question_words = ['что', 'как', 'где', 'когда', 'почему', 'какой', 'кто']
+    filtered_query = ' '.join([word for word in words if word not in question_words])
+    if filtered_query and filtered_query != original_query:
+        queries.append(filtered_query)
+    
+    return queries[:2]  # Оптимизация: только 2 варианта вместо 3
+
+
+def _check_deadline(deadline: float, cancel_event: threading.Event) -> float:
+    """Возвращает оставшееся время или прерывает поиск, если он отменен или дедлайн истек"""
+    remaining = deadline - time.monotonic()
+    if cancel_event.is_set() or remaining <= 0:
+        raise SearchCancelled()
+    return remaining
+
+
+def _search_task(embedding_model, query: str, db, n_top_cos: int,
+                 deadline: float, cancel_event: threading.Event) -> VecSearchResult:
+    """Поиск в пуле: между этапами проверяет дедлайн и флаг отмены"""
+    print(f"Начало улучшенного поиска для запроса: {query[:50]}...")
+    
+    # Генерируем варианты запроса
+    query_variants = enhance_query(query)
+    print(f"Сгенерировано {len(query_variants)} вариантов запроса")
+    
+    # Кодируем все варианты одним вызовом модели
+    _check_deadline(deadline, cancel_event)
+    query_embeddings = embedding_model.embed_documents(query_variants)
+    
+    all_results = []
+    seen_content = set()
+    
+    for i, (q, query_emb) in enumerate(zip(query_variants, query_embeddings)):
+        _check_deadline(deadline, cancel_event)
+        print(f"Поиск по варианту {i+1}: {q[:30]}...")
+        
+        # Оптимизированный поиск - только один быстрый метод
+        try:
+            search_result = db.similarity_search_by_vector(query_emb, k=n_top_cos)
+        except Exception as method_error:
+            print(f"Ошибка в поиске: {method_error}")
+            continue
+        
+        for doc in search_result:
+            content = doc.page_content if hasattr(doc, 'page_content') else str(doc)
+            
+            # Создаем уникальный ключ на основе содержимого и метаданных
+            content_preview = content[:100].lower().strip()
+            metadata_key = ""
+            
+            if hasattr(doc, 'metadata') and doc.metadata:
+                # Создаем ключ из метаданных
+                source = doc.metadata.get('source', '')
+                file_path = doc.metadata.get('file', '')
+                chunk_id = doc.metadata.get('chunk_id', '')
+                metadata_key = f"{source}_{file_path}_{chunk_id}"
+            
+            # Проверяем уникальность по содержимому и метаданным
+            combined_key = f"{hash(content_preview)}_{hash(metadata_key)}"
+            
+            if combined_key not in seen_content:
+                seen_content.add(combined_key)
+                all_results.append(doc)
+            else:
+                print(f"Пропущен дубликат: {content_preview[:50]}...")
+    
+    _check_deadline(deadline, cancel_event)
+    
+    # Сортируем результаты и берем топ
+    if len(all_results) > n_top_cos:
+        # Простая сортировка по длине - более длинные фрагменты часто содержат больше контекста
+        all_results.sort(key=lambda x: len(x.page_content) if hasattr(x, 'page_content') else 0, reverse=True)
+        all_results = all_results[:n_top_cos]
+    
+    print(f"Найдено {len(all_results)} уникальных результатов")
+    
+    # Извлечение фрагментов и файлов из метаданных
+    top_chunks = []
+    top_files = []
+    detailed_results = []
+    
+    for x in all_results:
+        chunk_content = ""
+        file_path = ""
+        
+        if hasattr(x, 'page_content') and x.page_content.strip():
+            chunk_content = x.page_content
+            top_chunks.append(chunk_content)
+        elif hasattr(x, 'metadata') and x.metadata:
+            chunk_content = x.metadata.get('chunk')
+            if chunk_content and chunk_content.strip():
+                top_chunks.append(chunk_content)
+            
+        if hasattr(x, 'metadata') and x.metadata:
+            if 'source' in x.metadata and x.metadata.get('source'):
+                file_path = x.metadata.get('source')
+                top_files.append(file_path)
+            elif 'file' in x.metadata and x.metadata.get('file'):
+                file_path = x.metadata.get('file')
+                top_files.append(file_path)
+        
+        # Сохраняем детальную информацию
+        if chunk_content and file_path:
+            detailed_results.append({
+                'chunk_content': chunk_content,
+                'file_path': file_path,
+                'metadata': x.metadata if hasattr(x, 'metadata') else {}
+            })
+    
+    # Удаляем дубликаты из списка файлов
+    top_files = list(set(top_files))
+    
+    # Фильтруем слишком короткие чанки
+    top_chunks = [chunk for chunk in top_chunks if len(chunk.strip()) > 50]
+    
+    print(f"Отфильтровано {len(top_chunks)} содержательных фрагментов из {len(top_files)} файлов")
+    
+    return VecSearchResult(top_chunks, top_files, detailed_results)
+
+
+def vec_search(embedding_model, query, db, n_top_cos: int = 10, timeout: int = 20,
+               cancel_event: Optional[threading.Event] = None) -> VecSearchResult:
     """
     Улучшенный поиск в векторной базе Chroma с множественными стратегиями поиска.
     
+    Поиск выполняется в общем ограниченном пуле потоков. По истечении timeout задача
+    отменяется: если она еще в очереди — снимается с нее, если уже выполняется —
+    останавливается на ближайшей проверке дедлайна между этапами.
+    
     Args:
         embedding_model: Модель для создания эмбеддингов
         query (str): Текст запроса
         db: Векторная база данных
         n_top_cos (int): Количество результатов для возврата
         timeout (int): Таймаут в секундах для операции поиска
+        cancel_event: Внешний флаг отмены (например, клиент отключился)
         
     Returns:
-        tuple: Кортеж из двух списков - топ-фрагменты и топ-файлы
+        VecSearchResult: фрагменты, файлы и детальные результаты;
+        при ошибке, таймауте или отмене — пустые списки
     """
-    start_time = time.time()
-    result = []
-    error = None
+    start_time = time.monotonic()
+    deadline = start_time + timeout
+    cancel_event = cancel_event or threading.Event()
     
-    def enhance_query(original_query: str) -> List[str]:
-        """Генерирует дополнительные варианты запроса для лучшего поиска"""
-        queries = [original_query]
-        
-        # Добавляем ключевые слова
-        words = original_query.lower().split()
-        if len(words) > 1:
-            # Добавляем отдельные ключевые слова
-            for word in words:
-                if len(word) > 3:  # Игнорируем короткие слова
-                    queries.append(word)
-        
-        # Добавляем варианты без вопросительных слов
-        question_words = ['что', 'как', 'где', 'когда', 'почему', 'какой', 'кто']
-        filtered_query = ' '.join([word for word in words if word not in question_words])
-        if filtered_query and filtered_query != original_query:
-            queries.append(filtered_query)
-        
-        return queries[:2]  # Оптимизация: только 2 варианта вместо 3
+    # Ждем свободный слот не дольше общего дедлайна
+    if not _search_slots.acquire(timeout=timeout):
+        print(f"Пул векторного поиска занят, запрос отклонен по таймауту ({timeout} сек)")
+        return _empty_result()
     
-    # Функция для выполнения поиска в отдельном потоке
-    def search_task():
-        nonlocal result, error
-        try:
-            print(f"Начало улучшенного поиска для запроса: {query[:50]}...")
-            
-            # Генерируем варианты запроса
-            query_variants = enhance_query(query)
-            print(f"Сгенерировано {len(query_variants)} вариантов запроса")
-            
-            all_results = []
-            seen_content = set()
-            seen_metadata = set()  # Для отслеживания дубликатов по метаданным
-            
-            for i, q in enumerate(query_variants):
-                print(f"Поиск по варианту {i+1}: {q[:30]}...")
-                
-                # Кодируем запрос в вектор
-                query_emb = embedding_model.embed_documents([q])[0]
-                
-                # Оптимизированный поиск - только один быстрый метод
-                try:
-                    search_result = db.similarity_search_by_vector(query_emb, k=n_top_cos)
-                    for doc in search_result:
-                        content = doc.page_content if hasattr(doc, 'page_content') else str(doc)
-                        
-                        # Создаем уникальный ключ на основе содержимого и метаданных
-                        content_preview = content[:100].lower().strip()
-                        metadata_key = ""
-                        
-                        if hasattr(doc, 'metadata') and doc.metadata:
-                            # Создаем ключ из метаданных
-                            source = doc.metadata.get('source', '')
-                            file_path = doc.metadata.get('file', '')
-                            chunk_id = doc.metadata.get('chunk_id', '')
-                            metadata_key = f"{source}_{file_path}_{chunk_id}"
-                        
-                        # Проверяем уникальность по содержимому и метаданным
-                        content_hash = hash(content_preview)
-                        metadata_hash = hash(metadata_key)
-                        combined_key = f"{content_hash}_{metadata_hash}"
-                        
-                        if combined_key not in seen_content:
-                            seen_content.add(combined_key)
-                            all_results.append(doc)
-                        else:
-                            print(f"Пропущен дубликат: {content_preview[:50]}...")
-                            
-                except Exception as method_error:
-                    print(f"Ошибка в поиске: {method_error}")
-                    continue
-            
-            # Сортируем результаты и берем топ
-            if len(all_results) > n_top_cos:
-                # Простая сортировка по длине - более длинные фрагменты часто содержат больше контекста
-                all_results.sort(key=lambda x: len(x.page_content) if hasattr(x, 'page_content') else 0, reverse=True)
-                all_results = all_results[:n_top_cos]
-            
-            print(f"Найдено {len(all_results)} уникальных результатов")
-            
-            # Извлечение фрагментов и файлов из метаданных
-            top_chunks = []
-            top_files = []
-            detailed_results = []
-            
-            for x in all_results:
-                chunk_content = ""
-                file_path = ""
-                
-                if hasattr(x, 'page_content') and x.page_content.strip():
-                    chunk_content = x.page_content
-                    top_chunks.append(chunk_content)
-                elif hasattr(x, 'metadata') and x.metadata:
-                    chunk_content = x.metadata.get('chunk')
-                    if chunk_content and chunk_content.strip():
-                        top_chunks.append(chunk_content)
-                    
-                if hasattr(x, 'metadata') and x.metadata:
-                    if 'source' in x.metadata and x.metadata.get('source'):
-                        file_path = x.metadata.get('source')
-                        top_files.append(file_path)
-                    elif 'file' in x.metadata and x.metadata.get('file'):
-                        file_path = x.metadata.get('file')
-                        top_files.append(file_path)
-                
-                # Сохраняем детальную информацию
-                if chunk_content and file_path:
-                    detailed_results.append({
-                        'chunk_content': chunk_content,
-                        'file_path': file_path,
-                        'metadata': x.metadata if hasattr(x, 'metadata') else {}
-                    })
-            
-            # Удаляем дубликаты из списка файлов
-            top_files = list(set(top_files))
-            
-            # Фильтруем слишком короткие чанки
-            top_chunks = [chunk for chunk in top_chunks if len(chunk.strip()) > 50]
-            
-            print(f"Отфильтровано {len(top_chunks)} содержательных фрагментов из {len(top_files)} файлов")
-            
-            result = [top_chunks, top_files, detailed_results]
-        except Exception as e:
-            import traceback
-            print(f"Ошибка в vec_search: {e}")
-            print(traceback.format_exc())
-            error = e
-    
-    # Запускаем поиск в отдельном потоке с таймаутом
-    search_thread = threading.Thread(target=search_task)
-    search_thread.daemon = True
-    search_thread.start()
-    search_thread.join(timeout)
+    try:
+        future = _search_executor.submit(
+            _search_task, embedding_model, query, db, n_top_cos, deadline, cancel_event
+        )
+    except Exception:
+        _search_slots.release()
+        raise
+    future.add_done_callback(lambda _: _search_slots.release())
     
-    if search_thread.is_alive():
-        # Если поток все еще выполняется после таймаута
+    try:
+        result = future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except concurrent.futures.TimeoutError:
+        # Снимаем задачу с очереди или просим выполняющуюся остановиться
+        cancel_event.set()
+        future.cancel()
         print(f"Превышен таймаут ({timeout} сек) при выполнении векторного поиска")
-        return [], []
-    
-    if error:
-        print(f"Произошла ошибка при векторном поиске: {error}")
-        return [], []
+        return _empty_result()
+    except SearchCancelled:
+        print("Векторный поиск отменен")
+        return _empty_result()
+    except Exception as e:
+        import traceback
+        print(f"Произошла ошибка при векторном поиске: {e}")
+        print(traceback.format_exc())
+        return _empty_result()
     
-    if not result:
+    if not result.chunks and not result.files:
         print("Векторный поиск не вернул результатов")
-        return [], []
+        return result
     
-    print(f"Улучшенный векторный поиск успешно завершен за {time.time() - start_time:.2f} секунд")
-    return result[0], result[1], result[2] if len(result) > 2 else []
+    print(f"Улучшенный векторный поиск успешно завершен за {time.monotonic() - start_time:.2f} секунд")
+    return result
 
 def load_documents_into_database(model_name: str, documents_path: str, department_id: str, reload: bool = True):
     """
@@ -0,0 +1,315 @@
+"""
+Локальные HTML-превью документов (DOCX, XLSX, PDF, TXT) с кэшем на диске
+"""
+
+import concurrent.futures
+import html
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+from typing import Optional
+
+import docx
+import PyPDF2
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from openpyxl import load_workbook
+
+DOCUMENT_PREVIEW_DIR = os.getenv("DOCUMENT_PREVIEW_DIR", "/app/files/Previews")
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "1"))
+
+# Ограничения объема превью: полный документ открывается скачиванием
+PREVIEW_MAX_PDF_PAGES = int(os.getenv("PREVIEW_MAX_PDF_PAGES", "200"))
+PREVIEW_MAX_SHEET_ROWS = int(os.getenv("PREVIEW_MAX_SHEET_ROWS", "1000"))
+PREVIEW_MAX_TEXT_CHARS = int(os.getenv("PREVIEW_MAX_TEXT_CHARS", str(2 * 1024 * 1024)))
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title} - Просмотр документа</title>
+    <style>
+        body {{
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            line-height: 1.6;
+            margin: 0;
+            background-color: #f8f9fa;
+        }}
+        .header {{
+            background: #fff;
+            padding: 15px 20px;
+            border-bottom: 1px solid #dee2e6;
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+        }}
+        .header h1 {{
+            margin: 0;
+            font-size: 18px;
+            color: #333;
+        }}
+        .btn {{
+            padding: 8px 16px;
+            border-radius: 4px;
+            text-decoration: none;
+            font-size: 14px;
+            margin-left: 10px;
+            color: white;
+        }}
+        .btn-primary {{ background: #007bff; }}
+        .btn-secondary {{ background: #6c757d; }}
+        .container {{
+            max-width: 900px;
+            margin: 20px auto;
+            background-color: white;
+            padding: 30px;
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            overflow-x: auto;
+        }}
+        .docx-heading {{ color: #2c3e50; margin-top: 20px; margin-bottom: 10px; font-weight: 600; }}
+        .docx-paragraph {{ margin-bottom: 12px; text-align: justify; }}
+        .docx-table, .sheet-table {{ width: 100%; margin: 15px 0; border-collapse: collapse; border: 1px solid #ddd; }}
+        .docx-cell, .sheet-cell {{ padding: 8px; border: 1px solid #ddd; vertical-align: top; }}
+        .docx-list {{ margin: 15px 0; padding-left: 20px; }}
+        .docx-list-item {{ margin-bottom: 5px; line-height: 1.6; }}
+        .pdf-page {{ border-bottom: 1px solid #dee2e6; padding-bottom: 20px; margin-bottom: 20px; }}
+        .pdf-page-number, .preview-note {{ color: #6c757d; font-size: 13px; }}
+        pre {{ white-space: pre-wrap; word-wrap: break-word; font-family: inherit; margin: 0; }}
+        del {{ text-decoration: line-through; color: #6c757d; }}
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>{title}</h1>
+        <div>
+            <a href="/content/download-file/{content_id}" class="btn btn-primary">Скачать</a>
+            <a href="javascript:history.back()" class="btn btn-secondary">Назад</a>
+        </div>
+    </div>
+    <div class="container">
+{body}
+    </div>
+</body>
+</html>
+"""
+
+
+def _docx_runs(paragraph: Paragraph) -> str:
+    parts = []
+    for run in paragraph.runs:
+        text = html.escape(run.text)
+        if not text:
+            continue
+        if run.font.strike:
+            text = f"<del>{text}</del>"
+        if run.underline:
+            text = f"<u>{text}</u>"
+        if run.italic:
+            text = f"<em>{text}</em>"
+        if run.bold:
+            text = f"<strong>{text}</strong>"
+        parts.append(text)
+    return "".join(parts)
+
+
+def _render_docx(path: str) -> str:
+    """Абзацы, заголовки, списки и таблицы в порядке следования в документе"""
+    document = docx.Document(path)
+    lines = []
+    in_list = False
+    for element in document.element.body.iterchildren():
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            paragraph = Paragraph(element, document)
+            style = (paragraph.style.name if paragraph.style is not None else "") or ""
+            is_list_item = style.startswith("List") or (paragraph._p.pPr is not None and paragraph._p.pPr.numPr is not None)
+            if in_list and not is_list_item:
+                lines.append("</ul>")
+                in_list = False
+            content = _docx_runs(paragraph)
+            if is_list_item:
+                if not in_list:
+                    lines.append('<ul class="docx-list">')
+                    in_list = True
+                lines.append(f'<li class="docx-list-item">{content}</li>')
+            elif style.startswith("Heading") and style[-1:].isdigit():
+                level = min(int(style[-1]), 6)
+                lines.append(f'<h{level} class="docx-heading">{content}</h{level}>')
+            elif style == "Title":
+                lines.append(f'<h1 class="docx-heading">{content}</h1>')
+            elif content:
+                lines.append(f'<p class="docx-paragraph">{content}</p>')
+        elif tag == "tbl":
+            if in_list:
+                lines.append("</ul>")
+                in_list = False
+            rows = []
+            for row in Table(element, document).rows:
+                cells = "".join(f'<td class="docx-cell">{html.escape(cell.text)}</td>' for cell in row.cells)
+                rows.append(f"<tr>{cells}</tr>")
+            lines.append(f'<table class="docx-table">{"".join(rows)}</table>')
+    if in_list:
+        lines.append("</ul>")
+    return "\n".join(lines)
+
+
+def _render_xlsx(path: str) -> str:
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        lines = []
+        for sheet in workbook.worksheets:
+            lines.append(f'<h2 class="docx-heading">{html.escape(sheet.title)}</h2>')
+            rows = []
+            truncated = False
+            for index, row in enumerate(sheet.iter_rows(values_only=True)):
+                if index >= PREVIEW_MAX_SHEET_ROWS:
+                    truncated = True
+                    break
+                cells = "".join(
+                    f'<td class="sheet-cell">{html.escape("" if value is None else str(value))}</td>' for value in row
+                )
+                rows.append(f"<tr>{cells}</tr>")
+            lines.append(f'<table class="sheet-table">{"".join(rows)}</table>')
+            if truncated:
+                lines.append(f'<p class="preview-note">Показаны первые {PREVIEW_MAX_SHEET_ROWS} строк</p>')
+        return "\n".join(lines)
+    finally:
+        workbook.close()
+
+
+def _render_pdf(path: str) -> str:
+    """Текст PDF постранично"""
+    with open(path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        lines = []
+        for number, page in enumerate(reader.pages, start=1):
+            if number > PREVIEW_MAX_PDF_PAGES:
+                lines.append(f'<p class="preview-note">Показаны первые {PREVIEW_MAX_PDF_PAGES} страниц</p>')
+                break
+            text = html.escape(page.extract_text() or "")
+            lines.append(
+                f'<section class="pdf-page"><div class="pdf-page-number">Страница {number}</div><pre>{text}</pre></section>'
+            )
+        return "\n".join(lines)
+
+
+def _render_txt(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        text = file.read(PREVIEW_MAX_TEXT_CHARS)
+    return f"<pre>{html.escape(text)}</pre>"
+
+
+RENDERERS = {
+    ".docx": _render_docx,
+    ".xlsx": _render_xlsx,
+    ".pdf": _render_pdf,
+    ".txt": _render_txt,
+}
+
+
+class DocumentPreviews:
+    """
+    HTML-превью документов, отрисованные локально и сохраненные на диск.
+
+    Файл превью — root/<content_id>/<отпечаток>.html, где отпечаток зависит от
+    времени изменения и размера файла и от названия документа. Любое изменение
+    дает новый отпечаток, поэтому кэш не нужно явно сбрасывать: устаревшие
+    превью удаляются при отрисовке нового. После загрузки превью рисуются
+    в фоновом пуле (schedule), при промахе — в запросе (get_or_render).
+    """
+
+    def __init__(self, root: str = DOCUMENT_PREVIEW_DIR, workers: int = PREVIEW_WORKERS):
+        self.root = root
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="doc-preview")
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    @staticmethod
+    def supports(file_path: str) -> bool:
+        return os.path.splitext(file_path)[1].lower() in RENDERERS
+
+    @staticmethod
+    def fingerprint(file_path: str, title: str) -> str:
+        stat_result = os.stat(file_path)
+        return f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}-{zlib.crc32(title.encode()):08x}"
+
+    def path_for(self, content_id: int, fingerprint: str) -> str:
+        return os.path.join(self.root, str(content_id), f"{fingerprint}.html")
+
+    def cached(self, content_id: int, file_path: str, title: str) -> Optional[str]:
+        path = self.path_for(content_id, self.fingerprint(file_path, title))
+        return path if os.path.exists(path) else None
+
+    def render(self, content_id: int, file_path: str, title: str) -> str:
+        """Отрисовывает превью (если его еще нет) и возвращает путь к HTML-файлу"""
+        fingerprint = self.fingerprint(file_path, title)
+        path = self.path_for(content_id, fingerprint)
+        if os.path.exists(path):
+            return path
+
+        body = RENDERERS[os.path.splitext(file_path)[1].lower()](file_path)
+        page = PAGE_TEMPLATE.format(title=html.escape(title), content_id=content_id, body=body)
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".html")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as temp_file:
+                temp_file.write(page)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        # Превью прежних версий файла больше не нужны
+        for name in os.listdir(directory):
+            if name.endswith(".html") and name != os.path.basename(path):
+                try:
+                    os.unlink(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+        return path
+
+    def get_or_render(self, content_id: int, file_path: str, title: str) -> str:
+        """Путь к превью; если фоновая отрисовка уже идет — дожидается ее"""
+        with self._lock:
+            future = self._in_flight.get(content_id)
+        if future is not None:
+            try:
+                future.result()
+            except Exception:
+                pass
+        return self.render(content_id, file_path, title)
+
+    def schedule(self, content_id: int, file_path: str, title: str) -> None:
+        """Ставит отрисовку превью в фоновый пул (для поддерживаемых форматов)"""
+        if not self.supports(file_path):
+            return
+        with self._lock:
+            if content_id in self._in_flight:
+                return
+            future = self._executor.submit(self._render_quietly, content_id, file_path, title)
+            self._in_flight[content_id] = future
+        future.add_done_callback(lambda _: self._finished(content_id))
+
+    def _finished(self, content_id: int) -> None:
+        with self._lock:
+            self._in_flight.pop(content_id, None)
+
+    def _render_quietly(self, content_id: int, file_path: str, title: str) -> None:
+        try:
+            self.render(content_id, file_path, title)
+        except Exception as e:
+            print(f"Ошибка отрисовки превью документа {content_id}: {e}")
+
+    def remove(self, content_id: int) -> None:
+        shutil.rmtree(os.path.join(self.root, str(content_id)), ignore_errors=True)
+
+
+# Глобальный экземпляр превью документов
+document_previews = DocumentPreviews()
@@ -0,0 +1,95 @@
+"""
+Отдача файлов: ETag/Last-Modified, условные запросы (304), диапазоны (206) и режим
+X-Accel-Redirect, в котором файл после проверки прав отдает nginx через sendfile
+"""
+
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import Request, Response, status
+from fastapi.responses import FileResponse
+
+# Режим X-Accel-Redirect: бэкенд отвечает только заголовками, тело отдает nginx
+# из internal location ACCEL_REDIRECT_PREFIX, которая смотрит в ACCEL_REDIRECT_ROOT
+DOWNLOAD_ACCEL_REDIRECT = os.getenv("DOWNLOAD_ACCEL_REDIRECT", "false").lower() == "true"
+ACCEL_REDIRECT_PREFIX = os.getenv("ACCEL_REDIRECT_PREFIX", "/protected-files/")
+ACCEL_REDIRECT_ROOT = os.getenv("ACCEL_REDIRECT_ROOT", "/app/files")
+
+# Файлы доступны только после проверки прав: кэш только в браузере и с обязательной
+# перепроверкой (ответ 304, если файл не изменился)
+DOWNLOAD_CACHE_CONTROL = "private, no-cache"
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    Проверяет условный GET: If-None-Match по ETag, а при его отсутствии —
+    If-Modified-Since по времени изменения (секунды, как в Last-Modified)
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """ETag по времени изменения и размеру: при атомарной замене файла (os.replace) меняется"""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _accel_redirect_uri(path: str) -> Optional[str]:
+    """URI internal location nginx для файла или None, если файл вне ACCEL_REDIRECT_ROOT"""
+    relative = os.path.relpath(os.path.realpath(path), os.path.realpath(ACCEL_REDIRECT_ROOT))
+    if relative == os.curdir or relative.startswith(os.pardir):
+        return None
+    return ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))
+
+
+def download_response(
+    request: Request,
+    path: str,
+    filename: Optional[str] = None,
+    media_type: str = "application/octet-stream",
+    cache_control: str = DOWNLOAD_CACHE_CONTROL,
+) -> Response:
+    """
+    Ответ с файлом после проверки прав.
+
+    304 — если клиентская копия актуальна; иначе FileResponse (Range/If-Range
+    обрабатывает Starlette) или, в режиме DOWNLOAD_ACCEL_REDIRECT, пустой ответ с
+    X-Accel-Redirect: nginx отдает файл сам, включая диапазоны и условные запросы.
+    """
+    stat_result = os.stat(path)
+    etag = file_etag(stat_result)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+    }
+    if not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    accel_uri = _accel_redirect_uri(path) if DOWNLOAD_ACCEL_REDIRECT else None
+    if accel_uri is not None:
+        headers["X-Accel-Redirect"] = accel_uri
+        if filename:
+            headers["Content-Disposition"] = _content_disposition(filename)
+        return Response(media_type=media_type, headers=headers)
+
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat_result)
@@ -0,0 +1,112 @@
+"""
+Потоковое сохранение загружаемых файлов: частями во временный файл с подсчетом sha256,
+затем перенос в хранилище блобов и атомарная замена файла на месте ссылкой на блоб
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import NamedTuple, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from blob_store import blob_store
+
+# Размер части при чтении загрузки и записи на диск; пиковая память на загрузку — порядка этого значения
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Сколько файлов одной пакетной загрузки пишется на диск одновременно
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "8"))
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+class StagedUpload(NamedTuple):
+    """Загрузка, полностью записанная во временный файл, но еще не опубликованная"""
+    temp_path: str
+    sha256: str
+    size: int
+
+
+async def stage_upload(upload: UploadFile, directory: str) -> StagedUpload:
+    """
+    Пишет загрузку частями во временный файл в каталоге directory, считая sha256.
+    Файл в том же каталоге (и разделе диска), что и место назначения, поэтому
+    publish_upload() переименовывает его атомарно. При ошибке файл удаляется.
+    """
+    await aiofiles.os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    os.close(fd)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as temp_file:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                await temp_file.write(chunk)
+    except BaseException:
+        discard_upload_path(temp_path)
+        raise
+    return StagedUpload(temp_path, digest.hexdigest(), size)
+
+
+async def publish_upload(staged: StagedUpload, destination: str) -> StoredUpload:
+    """
+    Переносит временный файл в хранилище блобов (одинаковое содержимое хранится
+    один раз) и атомарно ставит на место destination ссылку на блоб: читатели
+    видят старый файл или новый целиком
+    """
+    await run_in_threadpool(blob_store.store, staged.temp_path, staged.sha256, destination)
+    return StoredUpload(destination, staged.sha256, staged.size)
+
+
+def discard_upload_path(temp_path: str) -> None:
+    if os.path.exists(temp_path):
+        os.unlink(temp_path)
+
+
+def preserve_existing(destination: str) -> Optional[str]:
+    """
+    Сохраняет текущий файл destination под временным именем (жесткой ссылкой, без
+    копирования данных), чтобы публикацию можно было откатить. None — файла не было.
+    """
+    if not os.path.exists(destination):
+        return None
+    fd, backup_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix=".previous-")
+    os.close(fd)
+    os.unlink(backup_path)
+    try:
+        os.link(destination, backup_path)
+    except OSError:
+        shutil.copy2(destination, backup_path)
+    return backup_path
+
+
+def restore_previous(destination: str, backup_path: Optional[str]) -> None:
+    """Откатывает публикацию: возвращает прежний файл или удаляет новый, если прежнего не было"""
+    if backup_path is None:
+        discard_upload_path(destination)
+    else:
+        os.replace(backup_path, destination)
+
+
+async def save_upload(upload: UploadFile, destination: str) -> StoredUpload:
+    """Сохраняет загрузку в destination, не читая ее в память целиком"""
+    staged = await stage_upload(upload, os.path.dirname(destination))
+    try:
+        return await publish_upload(staged, destination)
+    except BaseException:
+        discard_upload_path(staged.temp_path)
+        raise
@@ -0,0 +1,49 @@
+"""
+Миграция: составные индексы под частые фильтры (контент пользователя, статистика
+тестов, попытки пользователя, загрузка чанков RAG, список отзывов)
+"""
+
+from database import Base, engine
+import models_db  # noqa: F401  Регистрирует модели в Base.metadata
+
+# (таблица, имя индекса) — определения индексов берутся из __table_args__ моделей
+COMPOSITE_INDEXES = [
+    ("content", "idx_content_department_access_tag"),
+    ("user_answers", "idx_user_answers_question_correct"),
+    ("user_quiz_attempts", "idx_attempts_quiz_user"),
+    ("user_quiz_attempts", "idx_attempts_user"),
+    ("user_answers", "idx_user_answers_attempt_question"),
+    ("questions", "idx_questions_quiz"),
+    ("document_chunks", "idx_chunks_department_content_index"),
+    ("feedback", "ix_feedback_created_at"),
+]
+
+
+def get_index(table_name: str, index_name: str):
+    table = Base.metadata.tables[table_name]
+    for index in table.indexes:
+        if index.name == index_name:
+            return index
+    raise LookupError(f"Индекс {index_name} не объявлен в модели таблицы {table_name}")
+
+
+def run_migration():
+    """Создает недостающие составные индексы (существующие пропускаются)"""
+    try:
+        with engine.begin() as connection:
+            for table_name, index_name in COMPOSITE_INDEXES:
+                if not engine.dialect.has_table(connection, table_name):
+                    print(f"⚠️ Таблица {table_name} отсутствует, индекс {index_name} пропущен")
+                    continue
+                # checkfirst: повторный запуск миграции не падает на существующих индексах
+                get_index(table_name, index_name).create(bind=connection, checkfirst=True)
+                print(f"✅ Индекс {index_name} на {table_name}")
+
+        print("✅ Составные индексы успешно созданы!")
+
+    except Exception as e:
+        print(f"❌ Ошибка при создании индексов: {e}")
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,95 @@
+"""
+Миграция для добавления в content столбцов file_hash и file_size и индекса по file_hash.
+
+Заполняются при загрузке файлов; для ранее загруженных остаются NULL. Ранее
+загруженные файлы переносятся в хранилище блобов (хэш считается, файл на месте
+становится ссылкой на блоб) этой командой из каталога server:
+    python -m migrations.add_content_file_hash --backfill
+"""
+
+import hashlib
+import os
+import sys
+
+from sqlalchemy import inspect, select, text, update
+
+from blob_store import blob_store
+from database import SessionLocal, engine
+from file_uploads import UPLOAD_CHUNK_SIZE
+from models_db import Content
+
+NEW_COLUMNS = {
+    "file_hash": "VARCHAR(64) NULL",
+    "file_size": "INTEGER NULL",
+}
+
+FILE_HASH_INDEX = "ix_content_file_hash"
+
+
+def run_migration():
+    """Добавляет в content столбцы хэша и размера файла и индекс по хэшу (существующие пропускаются)"""
+    try:
+        with engine.begin() as connection:
+            if not engine.dialect.has_table(connection, "content"):
+                return
+            inspector = inspect(connection)
+            existing = {column["name"] for column in inspector.get_columns("content")}
+            for name, definition in NEW_COLUMNS.items():
+                if name not in existing:
+                    connection.execute(text(f"ALTER TABLE content ADD COLUMN {name} {definition}"))
+                    print(f"✅ Столбец content.{name} добавлен")
+            indexes = {index["name"] for index in inspector.get_indexes("content")}
+            if FILE_HASH_INDEX not in indexes:
+                connection.execute(text(f"CREATE INDEX {FILE_HASH_INDEX} ON content (file_hash)"))
+                print(f"✅ Индекс {FILE_HASH_INDEX} создан")
+    except Exception as e:
+        print(f"❌ Ошибка при добавлении столбцов хэша файла: {e}")
+        raise
+
+
+def _hash_file(path: str):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def backfill_blobs(batch_size: int = 100) -> int:
+    """Переносит в хранилище блобов файлы записей без file_hash; возвращает число записей"""
+    moved = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.execute(
+                select(Content.id, Content.file_path)
+                .where(Content.id > last_id, Content.file_hash.is_(None))
+                .order_by(Content.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return moved
+            for row in rows:
+                if not row.file_path or not os.path.isfile(row.file_path):
+                    continue
+                sha256, size = _hash_file(row.file_path)
+                blob_store.adopt_existing(row.file_path, sha256)
+                db.execute(update(Content).where(Content.id == row.id).values(file_hash=sha256, file_size=size))
+                moved += 1
+            db.commit()
+            last_id = rows[-1].id
+            print(f"Перенесено файлов: {moved}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_migration()
+    if "--backfill" in sys.argv:
+        print(f"✅ Перенос завершен, записей: {backfill_blobs()}")
@@ -0,0 +1,104 @@
+"""
+Проверка планов запросов основных эндпоинтов: EXPLAIN для каждого запроса и ошибка,
+если какой-либо из них читает большую таблицу полным сканированием.
+
+Запуск из каталога server (код возврата 1 при полном сканировании):
+    python -m migrations.check_query_plans --min-rows 1000
+"""
+
+import argparse
+import sys
+from typing import List, NamedTuple
+
+from sqlalchemy import text
+
+from database import engine
+from pagination import DEFAULT_PAGE_SIZE, PageParams, encode_cursor
+from quiz import user_attempts_query
+from quiz_stats import quiz_stats_query
+from rag_index import department_chunks_query
+from routes.content_routes import content_by_tags_query, content_filter_conditions, content_page_query
+from routes.feedback_routes import feedback_page_query
+from routes.user_routes import user_content_query
+
+# Вторая и следующие страницы списков: с условием курсора, как их запрашивает клиент
+NEXT_PAGE = PageParams(cursor=encode_cursor([1]), limit=DEFAULT_PAGE_SIZE, with_total=False)
+
+# Запросы эндпоинтов, собранные теми же функциями, что и в маршрутах
+# (значения параметров не влияют на выбор индекса)
+QUERIES = {
+    "Весь контент (/content/all)": content_page_query(NEXT_PAGE),
+    "Контент отдела (/content/filter)": content_page_query(NEXT_PAGE, *content_filter_conditions(1, 1)),
+    "Контент отдела по тегу (/content/filter?tag_id)": content_page_query(NEXT_PAGE, *content_filter_conditions(1, 1, 1)),
+    "Контент пользователя (/user/user/{id}/content)": user_content_query(1, 1),
+    "Контент по тегам (/user/{id}/content/by-tags)": content_by_tags_query(1, 1),
+    "Статистика теста (/quiz/stats/{id})": quiz_stats_query(1),
+    "Попытки пользователя (/quiz/attempts/{user_id})": user_attempts_query(1, None, NEXT_PAGE),
+    "Попытки пользователя по тесту (/quiz/attempts/{user_id}?quiz_id)": user_attempts_query(1, 1, NEXT_PAGE),
+    "Чанки отдела для индекса RAG": department_chunks_query(1),
+    "Список отзывов (/feedback/list)": feedback_page_query(NEXT_PAGE),
+}
+
+
+class PlanIssue(NamedTuple):
+    query: str
+    table: str
+    rows: int
+    plan: str
+
+
+def _explain_full_scans(connection, sql: str) -> List[tuple]:
+    """Таблицы, которые план читает полным сканированием таблицы или индекса: [(таблица, строка плана)]"""
+    if connection.dialect.name == "sqlite":
+        scans = []
+        for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")):
+            detail = row[-1]
+            words = detail.split()
+            # "SCAN content" и "SCAN content USING INDEX ..." читают таблицу или индекс целиком;
+            # "SEARCH content USING INDEX ..." — поиск по индексу
+            if words and words[0] == "SCAN" and words[1:2] != ["CONSTANT"]:
+                scans.append((words[1], detail))
+        return scans
+
+    # MySQL: type = ALL — полное сканирование таблицы, index — полный обход индекса
+    scans = []
+    for row in connection.execute(text(f"EXPLAIN {sql}")).mappings():
+        if (row.get("type") or "").upper() in ("ALL", "INDEX"):
+            scans.append((row["table"], str(dict(row))))
+    return scans
+
+
+def check_query_plans(connection, min_rows: int = 1000) -> List[PlanIssue]:
+    """Возвращает полные сканирования таблиц, в которых не меньше min_rows строк"""
+    issues = []
+    table_rows = {}
+    for name, statement in QUERIES.items():
+        sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+        for table, plan in _explain_full_scans(connection, sql):
+            if table not in table_rows:
+                quoted = connection.dialect.identifier_preparer.quote(table)
+                table_rows[table] = connection.execute(text(f"SELECT COUNT(*) FROM {quoted}")).scalar()
+            # На маленьких таблицах оптимизатор законно предпочитает полное сканирование
+            if table_rows[table] >= min_rows:
+                issues.append(PlanIssue(name, table, table_rows[table], plan))
+    return issues
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-rows", type=int, default=1000, help="Минимальный размер таблицы, для которой полное сканирование считается ошибкой")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        issues = check_query_plans(connection, args.min_rows)
+
+    if not issues:
+        print(f"✅ Проверено запросов: {len(QUERIES)}, полных сканирований больших таблиц нет")
+        return 0
+    for issue in issues:
+        print(f"❌ {issue.query}: полное сканирование {issue.table} ({issue.rows} строк)\n   {issue.plan}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
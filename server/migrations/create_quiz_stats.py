@@ -0,0 +1,38 @@
+"""
+Миграция для создания сводных таблиц статистики тестов и их первоначального заполнения.
+
+Пересчитать статистику заново (например, после правок в БД в обход API)
+можно из каталога server:
+    python -m migrations.create_quiz_stats --rebuild
+"""
+
+import sys
+
+from database import Base, SessionLocal, engine
+from models_db import QuizParticipant, QuizQuestionStats, QuizStats
+from quiz_stats import rebuild_quiz_stats
+
+STATS_TABLES = [QuizStats.__table__, QuizQuestionStats.__table__, QuizParticipant.__table__]
+
+
+def run_migration(rebuild: bool = False):
+    """Создает сводные таблицы; при создании (или rebuild=True) заполняет их из попыток и ответов"""
+    try:
+        with engine.connect() as connection:
+            created = not all(engine.dialect.has_table(connection, table.name) for table in STATS_TABLES)
+        Base.metadata.create_all(bind=engine, tables=STATS_TABLES, checkfirst=True)
+
+        if created or rebuild:
+            db = SessionLocal()
+            try:
+                rebuild_quiz_stats(db)
+            finally:
+                db.close()
+            print("✅ Статистика тестов пересчитана")
+
+    except Exception as e:
+        print(f"❌ Ошибка при создании таблиц статистики тестов: {e}")
+        raise
+
+if __name__ == "__main__":
+    run_migration(rebuild="--rebuild" in sys.argv)
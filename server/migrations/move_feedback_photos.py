@@ -0,0 +1,91 @@
+"""
+Миграция фото обратной связи из столбца feedback.photo (blob) в файловое хранилище.
+
+При запуске приложения добавляются только новые столбцы (photo_hash, photo_size,
+photo_content_type). Старые blob переносятся пачками этой командой из каталога server:
+    python -m migrations.move_feedback_photos
+Не перенесенные записи переносятся по одной при первом запросе фото.
+"""
+
+from typing import Optional
+
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, engine
+from models_db import Feedback
+from photo_storage import photo_storage
+
+NEW_COLUMNS = {
+    "photo_hash": "VARCHAR(64) NULL",
+    "photo_size": "INTEGER NULL",
+    "photo_content_type": "VARCHAR(100) NULL",
+}
+
+
+def run_migration():
+    """Добавляет в feedback столбцы ссылки на файл фото (существующие пропускаются)"""
+    try:
+        with engine.begin() as connection:
+            if not engine.dialect.has_table(connection, "feedback"):
+                return
+            existing = {column["name"] for column in inspect(connection).get_columns("feedback")}
+            for name, definition in NEW_COLUMNS.items():
+                if name not in existing:
+                    connection.execute(text(f"ALTER TABLE feedback ADD COLUMN {name} {definition}"))
+                    print(f"✅ Столбец feedback.{name} добавлен")
+    except Exception as e:
+        print(f"❌ Ошибка при добавлении столбцов фото: {e}")
+        raise
+
+
+def move_legacy_photo(db: Session, feedback_id: int) -> Optional[Feedback]:
+    """
+    Переносит blob одной записи в хранилище и очищает столбец photo.
+    Возвращает обновленную запись или None, если фото в БД нет.
+    """
+    data = db.execute(select(Feedback.photo).where(Feedback.id == feedback_id)).scalar_one_or_none()
+    if not data:
+        return None
+    photo_hash, size = photo_storage.save_bytes(data)
+    db.execute(
+        update(Feedback)
+        .where(Feedback.id == feedback_id)
+        .values(
+            photo_hash=photo_hash,
+            photo_size=size,
+            photo_content_type=photo_storage.detect_content_type(photo_hash),
+            photo=None,
+        )
+    )
+    db.commit()
+    return db.get(Feedback, feedback_id, populate_existing=True)
+
+
+def move_legacy_photos(batch_size: int = 50) -> int:
+    """Переносит все blob пачками (в памяти не больше batch_size фото); возвращает число записей"""
+    moved = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = db.execute(
+                select(Feedback.id)
+                .where(Feedback.id > last_id, Feedback.photo_hash.is_(None), Feedback.photo.isnot(None))
+                .order_by(Feedback.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return moved
+            for feedback_id in ids:
+                if move_legacy_photo(db, feedback_id) is not None:
+                    moved += 1
+            last_id = ids[-1]
+            print(f"Перенесено фото: {moved}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_migration()
+    print(f"✅ Перенос завершен, записей: {move_legacy_photos()}")
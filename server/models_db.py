@@ -1,14 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, LargeBinary
-from passlib.context import CryptContext
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, LargeBinary, Index
 from sqlalchemy.sql import func
 
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from database import Base
+from passwords import pwd_context
 from pydantic import BaseModel
 import datetime
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 class User(Base):
     __tablename__ = "user"
@@ -42,11 +40,17 @@ class Access(Base):
 
 class Content(Base):
     __tablename__ = "content"
+    __table_args__ = (
+        # Выборка контента пользователя: отдел + уровень доступа (+ тег)
+        Index("idx_content_department_access_tag", "department_id", "access_level", "tag_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)  # Название контента
     description = Column(Text, nullable=True)  # Описание контента
     file_path = Column(String(255), nullable=False)  # Путь к файлу
+    file_hash = Column(String(64), nullable=True, index=True)  # sha256 файла (ключ блоба в blob_store)
+    file_size = Column(Integer, nullable=True)  # Размер файла в байтах
     access_level = Column(Integer, ForeignKey("access.id"), nullable=False)  # Уровень доступа
     department_id = Column(Integer, ForeignKey("department.id"), nullable=False)  # ID отдела
     tag_id = Column(Integer, ForeignKey("tags.id"), nullable=True)  # ID тега
@@ -87,6 +91,10 @@ class Quiz(Base):
 
 class Question(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        # Вопросы теста (статистика, попытки пользователя)
+        Index("idx_questions_quiz", "quiz_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     quiz_id = Column(Integer, ForeignKey("quizzes.id"), nullable=False)
@@ -101,6 +109,12 @@ class Question(Base):
 
 class UserQuizAttempt(Base):
     __tablename__ = "user_quiz_attempts"
+    __table_args__ = (
+        # Статистика теста и попытки пользователя по тесту
+        Index("idx_attempts_quiz_user", "quiz_id", "user_id"),
+        # Попытки пользователя по всем тестам (страницы по id)
+        Index("idx_attempts_user", "user_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
@@ -115,6 +129,12 @@ class UserQuizAttempt(Base):
 
 class UserAnswer(Base):
     __tablename__ = "user_answers"
+    __table_args__ = (
+        # Подсчет правильных ответов на вопрос
+        Index("idx_user_answers_question_correct", "question_id", "is_correct"),
+        # Ответы попытки на вопрос (список попыток пользователя)
+        Index("idx_user_answers_attempt_question", "attempt_id", "question_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     attempt_id = Column(Integer, ForeignKey("user_quiz_attempts.id"), nullable=False)
@@ -125,20 +145,55 @@ class UserAnswer(Base):
     attempt = relationship("UserQuizAttempt", back_populates="answers")
     question = relationship("Question", back_populates="user_answers")
 
+class QuizStats(Base):
+    """Сводная статистика теста/анкеты, обновляется при каждой попытке"""
+    __tablename__ = "quiz_stats"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    attempts_count = Column(Integer, nullable=False, default=0)  # Количество попыток
+    unique_users_count = Column(Integer, nullable=False, default=0)  # Количество пользователей, проходивших тест
+    scored_attempts_count = Column(Integer, nullable=False, default=0)  # Попытки с баллами (для среднего)
+    score_sum = Column(Integer, nullable=False, default=0)  # Сумма баллов
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class QuizQuestionStats(Base):
+    """Статистика ответов на вопрос, обновляется при каждой попытке"""
+    __tablename__ = "quiz_question_stats"
+
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), nullable=False, index=True)
+    correct_answers = Column(Integer, nullable=False, default=0)  # Количество правильных ответов
+    total_answers = Column(Integer, nullable=False, default=0)  # Общее количество ответов
+
+class QuizParticipant(Base):
+    """Пользователь, проходивший тест/анкету: первичный ключ не дает посчитать его дважды"""
+    __tablename__ = "quiz_participants"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+
 class Feedback(Base):
     __tablename__ = 'feedback'
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("user.id"), nullable=False)  # ID пользователя
     text = Column(String(255), nullable=False)  # Текст отзыва
-    photo = Column(LargeBinary, nullable=True)  # Фото в формате blob
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Фото в формате blob — только у старых записей, загружается лишь при явном обращении
+    photo = deferred(Column(LargeBinary, nullable=True))
+    photo_hash = Column(String(64), nullable=True)  # sha256 фото в файловом хранилище (photo_storage)
+    photo_size = Column(Integer, nullable=True)  # Размер фото в байтах
+    photo_content_type = Column(String(100), nullable=True)  # MIME-тип фото
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
 
     user = relationship("User")
 
 # Модели для RAG системы
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
+    __table_args__ = (
+        # Загрузка чанков отдела в порядке документа для индекса RAG
+        Index("idx_chunks_department_content_index", "department_id", "content_id", "chunk_index"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     content_id = Column(Integer, ForeignKey("content.id"), nullable=False)  # Связь с документом
@@ -152,6 +207,19 @@ class DocumentChunk(Base):
     content = relationship("Content")
     department = relationship("Department")
 
+class DocumentCentroid(Base):
+    __tablename__ = "document_centroids"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_id = Column(Integer, ForeignKey("content.id"), nullable=False, unique=True)  # Связь с документом
+    department_id = Column(Integer, ForeignKey("department.id"), nullable=False, index=True)  # ID отдела
+    centroid_vector = Column(JSON, nullable=False)  # Нормированный средний эмбеддинг чанков документа
+    chunks_count = Column(Integer, default=0)  # Количество чанков, по которым посчитан центроид
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=func.now())
+    
+    content = relationship("Content")
+    department = relationship("Department")
+
 class RAGSession(Base):
     __tablename__ = "rag_sessions"
     
@@ -0,0 +1,159 @@
+"""
+Курсорная (keyset) пагинация списков: непрозрачный курсор + limit.
+
+Страница выбирается условием по ключу сортировки последней отданной строки
+("id > последний id"), а не OFFSET, поэтому время и память на запрос не зависят
+от размера таблицы и номера страницы. Тело ответа остается списком, как раньше;
+курсор следующей страницы и общее количество отдаются в заголовках
+X-Next-Cursor и X-Total-Count.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, or_
+
+from content_cache import ResponseCache
+
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE_MAX", "500"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+@dataclass(frozen=True)
+class PageParams:
+    cursor: Optional[str]
+    limit: int
+    with_total: bool
+
+
+def page_params(
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor предыдущей страницы"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    with_total: bool = Query(False, description="Вернуть общее количество в заголовке X-Total-Count"),
+) -> PageParams:
+    """Зависимость FastAPI с параметрами страницы"""
+    return PageParams(cursor=cursor, limit=limit, with_total=with_total)
+
+
+@dataclass(frozen=True)
+class SortKey:
+    """Ключ сортировки: столбцы (последний — уникальный, обычно id) и направление"""
+    columns: Tuple[Any, ...]
+    descending: bool = False
+
+    def order_by(self) -> List[Any]:
+        return [column.desc() if self.descending else column.asc() for column in self.columns]
+
+    def after(self, values: Sequence[Any]):
+        """Условие "строка после values" в порядке сортировки"""
+        conditions = []
+        for position, column in enumerate(self.columns):
+            equal = [self.columns[i] == values[i] for i in range(position)]
+            beyond = column < values[position] if self.descending else column > values[position]
+            conditions.append(and_(*equal, beyond))
+        return or_(*conditions)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_key: SortKey) -> List[Any]:
+    """Значения ключа сортировки из курсора; некорректный курсор — 400"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = [_decode_value(value) for value in json.loads(payload)]
+    except (binascii.Error, ValueError, TypeError):
+        values = None
+    if not isinstance(values, list) or len(values) != len(sort_key.columns):
+        raise HTTPException(status_code=400, detail="Некорректный курсор пагинации")
+    return values
+
+
+def apply_page(statement, sort_key: SortKey, page: PageParams):
+    """Добавляет к запросу (select или Query) условие курсора, сортировку и limit + 1"""
+    if page.cursor:
+        statement = statement.filter(sort_key.after(decode_cursor(page.cursor, sort_key)))
+    return statement.order_by(*sort_key.order_by()).limit(page.limit + 1)
+
+
+def finish_page(rows: Sequence[Any], page: PageParams, key: Callable[[Any], Sequence[Any]]) -> Tuple[List[Any], Optional[str]]:
+    """
+    Отрезает лишнюю строку, запрошенную apply_page, и возвращает (строки страницы,
+    курсор следующей страницы или None). key(row) — значения ключа сортировки строки.
+    """
+    rows = list(rows)
+    if len(rows) <= page.limit:
+        return rows, None
+    rows = rows[:page.limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def set_page_headers(response: Response, next_cursor: Optional[str], total: Optional[int] = None) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+
+
+class CountCache:
+    """
+    Кэш общего количества строк для X-Total-Count, чтобы COUNT(*) по большой таблице
+    не выполнялся на каждой странице. Счетчики группируются по пространствам имен
+    ("users", "feedback", ...): запись в таблицу вызывает invalidate(namespace).
+    """
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 1024):
+        self._cache = ResponseCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def key(self, namespace: str, *filters: Hashable) -> tuple:
+        with self._lock:
+            return (namespace, self._versions.get(namespace, 0)) + filters
+
+    def get(self, key: tuple) -> Optional[int]:
+        return self._cache.get(key)
+
+    def set(self, key: tuple, total: int) -> None:
+        self._cache.set(key, total)
+
+    def count(self, namespace: str, filters: Tuple[Hashable, ...], compute: Callable[[], int]) -> int:
+        """Количество из кэша или compute() с сохранением результата"""
+        key = self.key(namespace, *filters)
+        total = self.get(key)
+        if total is None:
+            total = compute()
+            self.set(key, total)
+        return total
+
+    def invalidate(self, namespace: str) -> None:
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+
+# Глобальный экземпляр кэша счетчиков
+count_cache = CountCache(ttl_seconds=float(os.getenv("COUNT_CACHE_TTL", "60")))
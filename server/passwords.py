@@ -0,0 +1,64 @@
+"""
+Хэширование и проверка паролей (bcrypt) в отдельном ограниченном пуле потоков
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# Стоимость bcrypt (2^rounds итераций). Хэши с другой стоимостью пересчитываются при входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Потоки под bcrypt: вход в систему не должен занимать все ядра и общий пул потоков,
+# в котором работают синхронные эндпоинты контента и RAG
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Сколько операций может ждать в очереди пула; остальные получают отказ сразу
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_password_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+_password_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь пула bcrypt заполнена: операцию следует повторить позже"""
+
+
+async def _run(function, *args):
+    if not _password_slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        future = _password_executor.submit(function, *args)
+    except BaseException:
+        _password_slots.release()
+        raise
+    future.add_done_callback(lambda _: _password_slots.release())
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password(password: str) -> str:
+    """Хэш пароля с текущей стоимостью BCRYPT_ROUNDS"""
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Проверяет пароль. Возвращает (верен ли пароль, новый хэш или None);
+    новый хэш возвращается, если сохраненный посчитан с другой стоимостью.
+    """
+    if not password_hash:
+        return False, None
+    return await _run(pwd_context.verify_and_update, password, password_hash)
@@ -0,0 +1,149 @@
+"""
+Файловое хранилище фото обратной связи с адресацией по содержимому и кэшем миниатюр
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional, Tuple
+
+from PIL import Image, UnidentifiedImageError
+
+FEEDBACK_PHOTO_DIR = os.getenv("FEEDBACK_PHOTO_DIR", "/app/files/FeedbackPhotos")
+
+# Размеры миниатюр (по большей стороне), которые сервер готов генерировать и хранить
+THUMBNAIL_SIZES = (128, 256, 512)
+DEFAULT_THUMBNAIL_SIZE = 256
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_CONTENT_TYPE = "image/jpeg"
+# Тип для файлов, которые не распознаны как растровое изображение: браузер их не исполняет
+UNKNOWN_CONTENT_TYPE = "application/octet-stream"
+
+
+def safe_content_type(content_type: Optional[str]) -> str:
+    """Тип, который можно отдавать inline: только растровые форматы Pillow, иначе octet-stream"""
+    if content_type and content_type in Image.MIME.values():
+        return content_type
+    return UNKNOWN_CONTENT_TYPE
+
+
+class PhotoStorage:
+    """
+    Фото хранятся файлами с именем sha256 содержимого (root/ab/cd/<hash>), в строке
+    БД — только хэш, размер и тип. Одинаковые фото хранятся один раз; файл под
+    хэшем никогда не меняется, поэтому хэш служит и ETag.
+
+    Запись атомарная: во временный файл в том же каталоге, затем os.replace.
+    Миниатюры генерируются при первом запросе и кэшируются в root/thumbs/<размер>/.
+    """
+
+    def __init__(self, root: str = FEEDBACK_PHOTO_DIR):
+        self.root = root
+
+    def path_for(self, photo_hash: str) -> str:
+        return os.path.join(self.root, photo_hash[:2], photo_hash[2:4], photo_hash)
+
+    def thumbnail_path_for(self, photo_hash: str, size: int) -> str:
+        return os.path.join(self.root, "thumbs", str(size), photo_hash[:2], f"{photo_hash}.jpg")
+
+    @staticmethod
+    def _write_atomic(path: str, chunks) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in chunks:
+                    temp_file.write(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def save(self, source: BinaryIO) -> Tuple[str, int]:
+        """
+        Сохраняет фото из файлового объекта, читая его по частям.
+        Возвращает (sha256, размер в байтах).
+        """
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    temp_file.write(chunk)
+
+            photo_hash = digest.hexdigest()
+            path = self.path_for(photo_hash)
+            if os.path.exists(path):
+                # Такое фото уже есть
+                os.unlink(temp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+            return photo_hash, size
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def save_bytes(self, data: bytes) -> Tuple[str, int]:
+        """Сохраняет фото из памяти (перенос старых фото из БД)"""
+        photo_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(photo_hash)
+        if not os.path.exists(path):
+            self._write_atomic(path, [data])
+        return photo_hash, len(data)
+
+    def exists(self, photo_hash: str) -> bool:
+        return os.path.exists(self.path_for(photo_hash))
+
+    def detect_content_type(self, photo_hash: str) -> str:
+        """
+        MIME-тип фото только по содержимому (форматы, которые распознает Pillow).
+        Заявленному клиентом типу не доверяем: например, image/svg+xml со скриптом,
+        отданный inline с домена API, — хранимый XSS.
+        """
+        try:
+            with Image.open(self.path_for(photo_hash)) as image:
+                content_type = Image.MIME.get(image.format)
+        except (UnidentifiedImageError, OSError):
+            content_type = None
+        return safe_content_type(content_type)
+
+    def thumbnail(self, photo_hash: str, size: int = DEFAULT_THUMBNAIL_SIZE) -> str:
+        """Путь к JPEG-миниатюре фото; генерирует ее при первом обращении"""
+        if size not in THUMBNAIL_SIZES:
+            raise ValueError(f"Недопустимый размер миниатюры: {size}")
+        path = self.thumbnail_path_for(photo_hash, size)
+        if os.path.exists(path):
+            return path
+
+        with Image.open(self.path_for(photo_hash)) as image:
+            image.thumbnail((size, size))
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".jpg")
+            os.close(fd)
+            try:
+                image.save(temp_path, format="JPEG", quality=85)
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+        return path
+
+
+# Глобальный экземпляр хранилища
+photo_storage = PhotoStorage()
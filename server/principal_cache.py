@@ -0,0 +1,77 @@
+"""
+Кэш аутентифицированных пользователей (principal) для get_current_user
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from models_db import User
+
+# Поля пользователя, которые нужны маршрутам для авторизации и ответа /user/me
+PRINCIPAL_FIELDS = ("id", "login", "role_id", "department_id", "access_id", "full_name")
+
+
+class PrincipalCache:
+    """
+    Процессный кэш пользователей по ключу (user_id, iat токена) с коротким TTL.
+
+    Хранятся только поля PRINCIPAL_FIELDS; на попадании get() возвращает новый
+    отсоединенный экземпляр User без обращения к БД. Изменение, удаление
+    пользователя и смена пароля вызывают invalidate(user_id) в этом процессе;
+    в других воркерах устаревшая запись живет не дольше TTL.
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # user_id -> {iat: (время загрузки, поля)}
+        self._entries: Dict[int, Dict[Optional[int], Tuple[float, tuple]]] = {}
+        self._size = 0
+        self._versions: Dict[int, int] = {}
+
+    def version(self, user_id: int) -> int:
+        """Версия записи пользователя: снимается до чтения из БД и передается в set()"""
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def get(self, user_id: int, issued_at: Optional[int]) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(user_id, {}).get(issued_at)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl_seconds:
+            return None
+        return User(**dict(zip(PRINCIPAL_FIELDS, entry[1])))
+
+    def set(self, user: User, issued_at: Optional[int], version: int) -> None:
+        values = tuple(getattr(user, name) for name in PRINCIPAL_FIELDS)
+        with self._lock:
+            # Если пока шло чтение пользователя его изменили, не сохраняем устаревшие данные
+            if version != self._versions.get(user.id, 0):
+                return
+            if self._size >= self.max_entries:
+                self._entries.clear()
+                self._size = 0
+            by_token = self._entries.setdefault(user.id, {})
+            if issued_at not in by_token:
+                self._size += 1
+            by_token[issued_at] = (time.monotonic(), values)
+
+    def invalidate(self, user_id: int) -> None:
+        """Сбрасывает записи пользователя для всех его токенов"""
+        with self._lock:
+            self._size -= len(self._entries.pop(user_id, {}))
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+# Глобальный экземпляр кэша
+principal_cache = PrincipalCache(
+    ttl_seconds=float(os.getenv("PRINCIPAL_CACHE_TTL", "30")),
+    max_entries=int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000")),
+)
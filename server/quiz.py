@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func, Integer
+from sqlalchemy import func, select, Integer
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 import datetime
 import json
 
-from database import get_db
+from database import get_db, insert_rows
 from models_db import Quiz, Question, UserQuizAttempt, UserAnswer, User, Department, Access
 from routes.user_routes import get_current_user, require_admin, is_admin
+from quiz_stats import delete_quiz_stats, read_quiz_stats, record_attempt
+from pagination import PageParams, SortKey, apply_page, count_cache, finish_page, page_params, set_page_headers
 
 router = APIRouter(prefix="/quiz", tags=["quiz"])
 
+# Списки тестов и попыток отдаются страницами по id
+QUIZ_SORT_KEY = SortKey((Quiz.id,))
+ATTEMPT_SORT_KEY = SortKey((UserQuizAttempt.id,))
+
 # Pydantic модели для запросов и ответов
 
 class OptionBase(BaseModel):
@@ -134,22 +140,22 @@ def check_user_access(user_id: int, quiz: Quiz, db: Session) -> bool:
     
     return True
 
-def calculate_score(attempt_id: int, db: Session) -> int:
-    """Рассчитывает количество баллов за тест"""
-    attempt = db.query(UserQuizAttempt).filter(UserQuizAttempt.id == attempt_id).first()
-    if not attempt:
-        raise HTTPException(status_code=404, detail="Попытка не найдена")
-    
-    quiz = db.query(Quiz).filter(Quiz.id == attempt.quiz_id).first()
-    if not quiz.is_test:
-        return None  # Для анкет нет баллов
-    
-    correct_answers = db.query(UserAnswer).filter(
-        UserAnswer.attempt_id == attempt_id,
-        UserAnswer.is_correct == True
-    ).count()
-    
-    return correct_answers
+def grade_answer(quiz: Quiz, question: Question, answer: Any) -> Optional[bool]:
+    """Проверяет правильность ответа (только для тестов); для анкет и вопросов без ответа — None"""
+    if not quiz.is_test or question.correct_answer is None:
+        return None
+    
+    # Логика проверки зависит от типа вопроса
+    if question.question_type == "single_choice":
+        return answer == question.correct_answer
+    if question.question_type == "multiple_choice":
+        # Для множественного выбора сравниваем множества выбранных вариантов
+        return set(answer) == set(question.correct_answer)
+    if question.question_type == "text":
+        # Для текстовых ответов можно сделать проверку на точное совпадение
+        # или более сложную логику (например, регулярные выражения)
+        return answer.lower() == question.correct_answer.lower()
+    return None
 
 # Эндпоинты для работы с тестами и анкетами
 
@@ -201,6 +207,7 @@ def create_quiz(quiz_data: QuizCreate, db: Session = Depends(get_db)):
         db.add(new_question)
     
     db.commit()
+    count_cache.invalidate("quizzes")
     
     # Получаем созданный тест/анкету со всеми вопросами
     created_quiz = db.query(Quiz).filter(Quiz.id == new_quiz.id).first()
@@ -340,93 +347,70 @@ def submit_attempt(attempt_data: AttemptCreate, user_id: int, db: Session = Depe
     if not check_user_access(user_id, quiz, db):
         raise HTTPException(status_code=403, detail="У вас нет доступа к этому тесту/анкете")
     
+    # Все вопросы теста одним запросом; проверка и подсчет баллов — в памяти
+    questions = {question.id: question for question in db.query(Question).filter(Question.quiz_id == quiz.id)}
+    answer_rows = []
+    for answer_data in attempt_data.answers:
+        question = questions.get(answer_data.question_id)
+        if question is None:
+            raise HTTPException(status_code=400, detail=f"Вопрос {answer_data.question_id} не принадлежит этому тесту/анкете")
+        answer_rows.append({
+            "question_id": question.id,
+            "answer": answer_data.answer,
+            "is_correct": grade_answer(quiz, question, answer_data.answer),
+        })
+    
+    # Баллы — количество правильных ответов (только для тестов)
+    score = sum(1 for row in answer_rows if row["is_correct"]) if quiz.is_test else None
+    
     # Создаем новую попытку
+    now = datetime.datetime.utcnow()
     new_attempt = UserQuizAttempt(
         user_id=user_id,
         quiz_id=quiz.id,
-        started_at=datetime.datetime.utcnow(),
-        completed_at=datetime.datetime.utcnow()
+        started_at=now,
+        completed_at=now,
+        score=score
     )
     
     db.add(new_attempt)
     db.flush()  # Чтобы получить ID новой попытки
+    attempt_id = new_attempt.id
     
-    # Добавляем ответы пользователя
-    for answer_data in attempt_data.answers:
-        # Получаем вопрос
-        question = db.query(Question).filter(Question.id == answer_data.question_id).first()
-        if not question or question.quiz_id != quiz.id:
-            raise HTTPException(status_code=400, detail=f"Вопрос {answer_data.question_id} не принадлежит этому тесту/анкете")
-        
-        # Проверяем правильность ответа (только для тестов)
-        is_correct = None
-        if quiz.is_test and question.correct_answer is not None:
-            # Логика проверки зависит от типа вопроса
-            if question.question_type == "single_choice":
-                is_correct = answer_data.answer == question.correct_answer
-            elif question.question_type == "multiple_choice":
-                # Для множественного выбора сравниваем множества выбранных вариантов
-                user_choices = set(answer_data.answer)
-                correct_choices = set(question.correct_answer)
-                is_correct = user_choices == correct_choices
-            elif question.question_type == "text":
-                # Для текстовых ответов можно сделать проверку на точное совпадение
-                # или более сложную логику (например, регулярные выражения)
-                is_correct = answer_data.answer.lower() == question.correct_answer.lower()
-        
-        # Создаем запись об ответе
-        new_answer = UserAnswer(
-            attempt_id=new_attempt.id,
-            question_id=question.id,
-            answer=answer_data.answer,
-            is_correct=is_correct
-        )
-        
-        db.add(new_answer)
+    # Добавляем ответы пользователя одной вставкой
+    for row in answer_rows:
+        row["attempt_id"] = attempt_id
+    answer_ids = insert_rows(db, UserAnswer, answer_rows)
     
-    # Рассчитываем количество баллов (только для тестов)
-    if quiz.is_test:
-        db.flush()  # Чтобы сохранить ответы перед подсчетом баллов
-        new_attempt.score = calculate_score(new_attempt.id, db)
+    # Сводная статистика (и первая ли это попытка пользователя) — в той же транзакции, что и попытка
+    record_attempt(db, attempt_data.quiz_id, user_id, score, answer_rows)
     
     db.commit()
+    count_cache.invalidate("attempts")
     
-    # Получаем созданную попытку со всеми ответами
-    attempt = db.query(UserQuizAttempt).filter(UserQuizAttempt.id == new_attempt.id).first()
-    answers = db.query(UserAnswer).filter(UserAnswer.attempt_id == new_attempt.id).all()
-    
-    # Формируем ответ
+    # Формируем ответ из уже известных данных, без повторного чтения из БД
     result = AttemptResponse(
-        id=attempt.id,
-        user_id=attempt.user_id,
-        quiz_id=attempt.quiz_id,
-        started_at=attempt.started_at,
-        completed_at=attempt.completed_at,
-        score=attempt.score,
+        id=attempt_id,
+        user_id=user_id,
+        quiz_id=attempt_data.quiz_id,
+        started_at=now,
+        completed_at=now,
+        score=score,
         answers=[
             UserAnswerResponse(
-                id=a.id,
-                question_id=a.question_id,
-                answer=a.answer,
-                is_correct=a.is_correct
-            ) for a in answers
+                id=answer_id,
+                question_id=row["question_id"],
+                answer=row["answer"],
+                is_correct=row["is_correct"]
+            ) for answer_id, row in zip(answer_ids, answer_rows)
         ]
     )
     
     return result
 
-@router.get("/attempts/{user_id}", response_model=List[AttemptListItem])
-def get_user_attempts(user_id: int, quiz_id: Optional[int] = None, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """Получение списка попыток пользователя"""
-    if not is_admin(current_user) and current_user.id != user_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
-    # Проверяем существование пользователя
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-    
-    # Базовый запрос
-    query = db.query(
+def user_attempts_query(user_id: int, quiz_id: Optional[int], page: PageParams):
+    """Страница попыток пользователя с числом вопросов и правильных ответов (/quiz/attempts/{user_id})"""
+    query = select(
         UserQuizAttempt,
         Quiz.title.label("quiz_title"),
         func.count(Question.id).label("total_questions"),
@@ -437,7 +421,7 @@ def get_user_attempts(user_id: int, quiz_id: Optional[int] = None, db: Session =
         Question, Quiz.id == Question.quiz_id
     ).outerjoin(
         UserAnswer, (UserAnswer.attempt_id == UserQuizAttempt.id) & (UserAnswer.question_id == Question.id)
-    ).filter(
+    ).where(
         UserQuizAttempt.user_id == user_id
     ).group_by(
         UserQuizAttempt.id, Quiz.title
@@ -445,10 +429,38 @@ def get_user_attempts(user_id: int, quiz_id: Optional[int] = None, db: Session =
     
     # Фильтр по тесту/анкете
     if quiz_id:
-        query = query.filter(UserQuizAttempt.quiz_id == quiz_id)
+        query = query.where(UserQuizAttempt.quiz_id == quiz_id)
+    return apply_page(query, ATTEMPT_SORT_KEY, page)
+
+@router.get("/attempts/{user_id}", response_model=List[AttemptListItem])
+def get_user_attempts(
+    user_id: int,
+    response: Response,
+    quiz_id: Optional[int] = None,
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Получение списка попыток пользователя"""
+    if not is_admin(current_user) and current_user.id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+    # Проверяем существование пользователя
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    # Получаем результаты
-    results = query.all()
+    # Получаем страницу результатов
+    results, next_cursor = finish_page(
+        db.execute(user_attempts_query(user_id, quiz_id, page)).all(), page, lambda row: (row[0].id,)
+    )
+    
+    total = None
+    if page.with_total:
+        count_query = db.query(UserQuizAttempt).filter(UserQuizAttempt.user_id == user_id)
+        if quiz_id:
+            count_query = count_query.filter(UserQuizAttempt.quiz_id == quiz_id)
+        total = count_cache.count("attempts", (user_id, quiz_id or None), count_query.count)
+    set_page_headers(response, next_cursor, total)
     
     # Формируем ответ
     attempts = []
@@ -505,65 +517,11 @@ def get_attempt_details(attempt_id: int, user_id: int, db: Session = Depends(get
 
 @router.get("/stats/{quiz_id}")
 def get_quiz_statistics(quiz_id: int, db: Session = Depends(get_db)):
-    """Получение статистики по тесту/анкете"""
-    # Получаем тест/анкету
-    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
-    if not quiz:
+    """Получение статистики по тесту/анкете (из сводных таблиц, одним запросом)"""
+    statistics = read_quiz_stats(db, quiz_id)
+    if statistics is None:
         raise HTTPException(status_code=404, detail="Тест/анкета не найдена")
-    
-    # Получаем количество попыток
-    attempts_count = db.query(UserQuizAttempt).filter(UserQuizAttempt.quiz_id == quiz_id).count()
-    
-    # Получаем количество уникальных пользователей
-    unique_users_count = db.query(UserQuizAttempt.user_id).filter(
-        UserQuizAttempt.quiz_id == quiz_id
-    ).distinct().count()
-    
-    # Для тестов получаем среднее количество баллов
-    avg_score = None
-    if quiz.is_test:
-        avg_score_result = db.query(func.avg(UserQuizAttempt.score)).filter(
-            UserQuizAttempt.quiz_id == quiz_id,
-            UserQuizAttempt.score != None
-        ).scalar()
-        avg_score = float(avg_score_result) if avg_score_result else 0
-    
-    # Статистика по вопросам (только для тестов)
-    question_stats = []
-    if quiz.is_test:
-        questions = db.query(Question).filter(Question.quiz_id == quiz_id).all()
-        for question in questions:
-            # Количество правильных ответов на вопрос
-            correct_answers_count = db.query(UserAnswer).filter(
-                UserAnswer.question_id == question.id,
-                UserAnswer.is_correct == True
-            ).count()
-            
-            # Общее количество ответов на вопрос
-            total_answers_count = db.query(UserAnswer).filter(
-                UserAnswer.question_id == question.id
-            ).count()
-            
-            # Процент правильных ответов
-            correct_percentage = (correct_answers_count / total_answers_count * 100) if total_answers_count > 0 else 0
-            
-            question_stats.append({
-                "question_id": question.id,
-                "text": question.text,
-                "correct_answers": correct_answers_count,
-                "total_answers": total_answers_count,
-                "correct_percentage": correct_percentage
-            })
-    
-    return {
-        "quiz_id": quiz_id,
-        "title": quiz.title,
-        "is_test": quiz.is_test,
-        "attempts_count": attempts_count,
-        "unique_users_count": unique_users_count,
-        "avg_score": avg_score,
-        "question_stats": question_stats if quiz.is_test else None
-    }
+    return statistics
 
 @router.delete("/{quiz_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_quiz(quiz_id: int, user_id: Optional[int] = None, db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
@@ -574,16 +532,21 @@ def delete_quiz(quiz_id: int, user_id: Optional[int] = None, db: Session = Depen
         raise HTTPException(status_code=404, detail="Тест/анкета не найдена")
     
     # Удаляем тест/анкету (каскадное удаление вопросов и попыток настроено в моделях)
+    delete_quiz_stats(db, quiz.id)
     db.delete(quiz)
     db.commit()
+    count_cache.invalidate("quizzes")
+    count_cache.invalidate("attempts")
     
     return None
 
 @router.get("/admin/list", response_model=List[QuizListItem])
 def list_all_quizzes(
+    response: Response,
     is_test: Optional[bool] = None,
     department_id: Optional[int] = None,
     user_id: Optional[int] = None,
+    page: PageParams = Depends(page_params),
     db: Session = Depends(get_db)
 ):
     """Получение списка всех тестов и анкет для администратора без учета прав доступа"""
@@ -601,8 +564,18 @@ def list_all_quizzes(
     if department_id is not None:
         query = query.filter(Quiz.department_id == department_id)
     
-    # Получаем результаты
-    results = query.all()
+    # Получаем страницу результатов
+    results, next_cursor = finish_page(apply_page(query, QUIZ_SORT_KEY, page).all(), page, lambda row: (row[0].id,))
+    
+    total = None
+    if page.with_total:
+        count_query = db.query(Quiz)
+        if is_test is not None:
+            count_query = count_query.filter(Quiz.is_test == is_test)
+        if department_id is not None:
+            count_query = count_query.filter(Quiz.department_id == department_id)
+        total = count_cache.count("quizzes", (is_test, department_id), count_query.count)
+    set_page_headers(response, next_cursor, total)
     
     # Формируем ответ
     quizzes = []
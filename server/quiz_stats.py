@@ -0,0 +1,258 @@
+"""
+Сводные таблицы статистики тестов/анкет (quiz_stats, quiz_question_stats).
+
+Счетчики увеличиваются в той же транзакции, что и сохранение попытки, атомарным
+UPSERT (x = x + n), поэтому параллельные попытки в разных воркерах не теряют
+обновлений. Для СУБД без UPSERT в SQLAlchemy — UPDATE, а при отсутствии строки
+INSERT. Уникальные пользователи учитываются через quiz_participants: попытка
+первая, если ее вставка (quiz_id, user_id) не натолкнулась на уже существующий
+ключ. rebuild_quiz_stats() пересчитывает таблицы из исходных данных
+группировками (для первоначального заполнения и сверки).
+"""
+
+import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import Integer, and_, case, delete, distinct, func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models_db import Question, Quiz, QuizParticipant, QuizQuestionStats, QuizStats, UserAnswer, UserQuizAttempt
+
+
+def _increment_portable(db: Session, table, key_columns: list, counters: list, rows: list) -> None:
+    """
+    UPDATE x = x + n по ключу, а если строки еще нет — INSERT. Если параллельная транзакция
+    вставила строку между ними, INSERT падает на первичном ключе и повторяется UPDATE
+    (INSERT в точке сохранения, чтобы не откатывать всю попытку).
+    """
+    for row in rows:
+        updates = {name: table.c[name] + row[name] for name in counters}
+        if "updated_at" in row:
+            updates["updated_at"] = row["updated_at"]
+        update = table.update().where(and_(*(table.c[name] == row[name] for name in key_columns))).values(updates)
+        if db.execute(update).rowcount:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(table.insert().values(row))
+        except IntegrityError:
+            db.execute(update)
+
+
+def _increment(db: Session, model, key_columns: Iterable[str], rows: list) -> None:
+    """INSERT строк с увеличением счетчиков (все столбцы кроме ключевых) при конфликте ключа"""
+    if not rows:
+        return
+    table = model.__table__
+    key_columns = list(key_columns)
+    counters = [name for name in rows[0] if name not in key_columns and name != "quiz_id"]
+    now = datetime.datetime.utcnow()
+    rows = [{**row, "updated_at": now} if "updated_at" in table.c else row for row in rows]
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql_insert(table).values(rows)
+        updates = {name: table.c[name] + statement.inserted[name] for name in counters}
+        if "updated_at" in table.c:
+            updates["updated_at"] = statement.inserted["updated_at"]
+        statement = statement.on_duplicate_key_update(updates)
+    elif dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        statement = insert(table).values(rows)
+        updates = {name: table.c[name] + statement.excluded[name] for name in counters}
+        if "updated_at" in table.c:
+            updates["updated_at"] = statement.excluded["updated_at"]
+        statement = statement.on_conflict_do_update(index_elements=key_columns, set_=updates)
+    else:
+        _increment_portable(db, table, key_columns, counters, rows)
+        return
+    db.execute(statement)
+
+
+def _add_participant(db: Session, quiz_id: int, user_id: int) -> bool:
+    """
+    Запоминает, что пользователь проходил тест; True, если это его первая попытка.
+    Параллельная первая попытка того же пользователя ждет на ключе и получает False.
+    """
+    table = QuizParticipant.__table__
+    row = {"quiz_id": quiz_id, "user_id": user_id}
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql_insert(table).values(row).prefix_with("IGNORE")
+    elif dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        statement = insert(table).values(row).on_conflict_do_nothing(index_elements=["quiz_id", "user_id"])
+    else:
+        try:
+            with db.begin_nested():
+                db.execute(table.insert().values(row))
+        except IntegrityError:
+            return False
+        return True
+    return db.execute(statement).rowcount == 1
+
+
+def record_attempt(
+    db: Session,
+    quiz_id: int,
+    user_id: int,
+    score: Optional[int],
+    answers: Iterable[Dict[str, Any]],
+) -> None:
+    """
+    Учитывает новую попытку в сводных таблицах (коммит — вместе с попыткой).
+    answers — строки ответов с ключами question_id и is_correct.
+    """
+    first_attempt_by_user = _add_participant(db, quiz_id, user_id)
+    _increment(db, QuizStats, ["quiz_id"], [{
+        "quiz_id": quiz_id,
+        "attempts_count": 1,
+        "unique_users_count": 1 if first_attempt_by_user else 0,
+        "scored_attempts_count": 1 if score is not None else 0,
+        "score_sum": score or 0,
+    }])
+
+    per_question: Dict[int, Dict[str, int]] = {}
+    for answer in answers:
+        counters = per_question.setdefault(answer["question_id"], {"correct_answers": 0, "total_answers": 0})
+        counters["total_answers"] += 1
+        if answer["is_correct"]:
+            counters["correct_answers"] += 1
+    _increment(db, QuizQuestionStats, ["question_id"], [
+        {"question_id": question_id, "quiz_id": quiz_id, **counters}
+        for question_id, counters in sorted(per_question.items())
+    ])
+
+
+def delete_quiz_stats(db: Session, quiz_id: int) -> None:
+    db.execute(delete(QuizParticipant).where(QuizParticipant.quiz_id == quiz_id))
+    db.execute(delete(QuizQuestionStats).where(QuizQuestionStats.quiz_id == quiz_id))
+    db.execute(delete(QuizStats).where(QuizStats.quiz_id == quiz_id))
+
+
+def rebuild_quiz_stats(db: Session, quiz_id: Optional[int] = None) -> None:
+    """
+    Пересчитывает сводные таблицы (для одного теста или всех) двумя группировками:
+    попытки по тесту и ответы, соединенные с вопросами, по вопросу; участников —
+    выборкой различных пар (тест, пользователь) из попыток.
+    """
+    attempts = select(
+        UserQuizAttempt.quiz_id,
+        func.count(UserQuizAttempt.id),
+        func.count(distinct(UserQuizAttempt.user_id)),
+        func.count(UserQuizAttempt.score),
+        func.coalesce(func.sum(UserQuizAttempt.score), 0),
+    ).group_by(UserQuizAttempt.quiz_id)
+
+    answers = select(
+        Question.id,
+        Question.quiz_id,
+        func.sum(case((UserAnswer.is_correct == True, 1), else_=0)).cast(Integer),  # noqa: E712
+        func.count(UserAnswer.id),
+    ).join(UserAnswer, UserAnswer.question_id == Question.id).group_by(Question.id, Question.quiz_id)
+
+    participants = select(UserQuizAttempt.quiz_id, UserQuizAttempt.user_id).distinct()
+
+    if quiz_id is not None:
+        attempts = attempts.where(UserQuizAttempt.quiz_id == quiz_id)
+        answers = answers.where(Question.quiz_id == quiz_id)
+        participants = participants.where(UserQuizAttempt.quiz_id == quiz_id)
+        delete_quiz_stats(db, quiz_id)
+    else:
+        db.execute(delete(QuizParticipant))
+        db.execute(delete(QuizQuestionStats))
+        db.execute(delete(QuizStats))
+
+    now = datetime.datetime.utcnow()
+    quiz_rows = [
+        {
+            "quiz_id": row_quiz_id,
+            "attempts_count": attempts_count,
+            "unique_users_count": unique_users_count,
+            "scored_attempts_count": scored_attempts_count,
+            "score_sum": int(score_sum or 0),
+            "updated_at": now,
+        }
+        for row_quiz_id, attempts_count, unique_users_count, scored_attempts_count, score_sum in db.execute(attempts)
+    ]
+    question_rows = [
+        {
+            "question_id": question_id,
+            "quiz_id": row_quiz_id,
+            "correct_answers": int(correct_answers or 0),
+            "total_answers": total_answers,
+        }
+        for question_id, row_quiz_id, correct_answers, total_answers in db.execute(answers)
+    ]
+    db.execute(QuizParticipant.__table__.insert().from_select(["quiz_id", "user_id"], participants))
+    if quiz_rows:
+        db.execute(QuizStats.__table__.insert(), quiz_rows)
+    if question_rows:
+        db.execute(QuizQuestionStats.__table__.insert(), question_rows)
+    db.commit()
+
+
+def quiz_stats_query(quiz_id: int):
+    """Тест, его счетчики и счетчики вопросов одним запросом (/quiz/stats/{id})"""
+    return (
+        select(
+            Quiz.title,
+            Quiz.is_test,
+            QuizStats.attempts_count,
+            QuizStats.unique_users_count,
+            QuizStats.scored_attempts_count,
+            QuizStats.score_sum,
+            Question.id,
+            Question.text,
+            QuizQuestionStats.correct_answers,
+            QuizQuestionStats.total_answers,
+        )
+        .select_from(Quiz)
+        .outerjoin(QuizStats, QuizStats.quiz_id == Quiz.id)
+        .outerjoin(Question, Question.quiz_id == Quiz.id)
+        .outerjoin(QuizQuestionStats, QuizQuestionStats.question_id == Question.id)
+        .where(Quiz.id == quiz_id)
+        .order_by(Question.id)
+    )
+
+
+def read_quiz_stats(db: Session, quiz_id: int) -> Optional[dict]:
+    """Статистика теста из сводных таблиц одним запросом; None, если теста нет"""
+    rows = db.execute(quiz_stats_query(quiz_id)).all()
+    if not rows:
+        return None
+
+    first = rows[0]
+    avg_score = None
+    if first.is_test:
+        avg_score = float(first.score_sum) / first.scored_attempts_count if first.scored_attempts_count else 0
+
+    question_stats = None
+    if first.is_test:
+        question_stats = []
+        for row in rows:
+            if row.id is None:
+                continue
+            correct_answers = row.correct_answers or 0
+            total_answers = row.total_answers or 0
+            question_stats.append({
+                "question_id": row.id,
+                "text": row.text,
+                "correct_answers": correct_answers,
+                "total_answers": total_answers,
+                "correct_percentage": (correct_answers / total_answers * 100) if total_answers > 0 else 0,
+            })
+
+    return {
+        "quiz_id": quiz_id,
+        "title": first.title,
+        "is_test": first.is_test,
+        "attempts_count": first.attempts_count or 0,
+        "unique_users_count": first.unique_users_count or 0,
+        "avg_score": avg_score,
+        "question_stats": question_stats,
+    }
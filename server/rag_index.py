@@ -0,0 +1,404 @@
+"""
+Векторный индекс отделов для RAG: матрица эмбеддингов в памяти и ранжирование
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models_db import DocumentCentroid, DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Нормирует строки матрицы (нулевые строки остаются нулевыми)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_n(scores: np.ndarray, n: int) -> np.ndarray:
+    """Индексы n наибольших значений в порядке убывания (без полной сортировки)"""
+    if n <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if n < scores.size:
+        candidates = np.argpartition(-scores, n - 1)[:n]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def mmr_select(vectors: np.ndarray, relevance: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """
+    Жадный выбор k элементов по maximal marginal relevance.
+
+    vectors — нормированные векторы кандидатов (n × d), relevance — их сходство с запросом.
+    На каждом шаге выбирается кандидат с максимальным
+    lambda * relevance - (1 - lambda) * max_sim(кандидат, уже выбранные);
+    max_sim обновляется одним матрично-векторным произведением, итого O(k·n·d).
+    """
+    n = int(relevance.shape[0])
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    selected: List[int] = []
+    available = np.ones(n, dtype=bool)
+    max_sim = np.zeros(n, dtype=np.float32)
+
+    for step in range(k):
+        if step == 0:
+            scores = relevance.astype(np.float32, copy=True)
+        else:
+            scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_sim, vectors @ vectors[best], out=max_sim)
+
+    return selected
+
+
+def reciprocal_rank_fusion(scores: np.ndarray, depth: int, k: int = 60) -> np.ndarray:
+    """
+    Reciprocal rank fusion по столбцам матрицы сходств (кандидаты × запросы).
+
+    Каждый запрос дает ранжирование своих depth лучших кандидатов; итоговая оценка
+    кандидата — сумма 1 / (k + ранг) по запросам, где он попал в top-depth.
+    """
+    fused = np.zeros(scores.shape[0], dtype=np.float32)
+    for column in range(scores.shape[1]):
+        ranked = top_n(scores[:, column], depth)
+        fused[ranked] += 1.0 / (k + np.arange(1, ranked.size + 1, dtype=np.float32))
+    return fused
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Скалярное квантование int8 с масштабом по каждому измерению.
+
+    Возвращает (codes, scales): vectors ≈ codes * scales, codes в диапазоне [-127, 127].
+    """
+    scales = np.abs(vectors).max(axis=0) / 127.0 if vectors.size else np.ones(vectors.shape[1], dtype=np.float32)
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def document_centroid(vectors: np.ndarray) -> np.ndarray:
+    """Центроид документа: нормированное среднее нормированных эмбеддингов его чанков"""
+    return normalize_rows(normalize_rows(vectors).mean(axis=0, keepdims=True))[0]
+
+
+def department_chunks_query(department_id: int):
+    """Чанки отдела с эмбеддингами в порядке документов (загрузка индекса отдела)"""
+    return select(
+        DocumentChunk.id,
+        DocumentChunk.content_id,
+        DocumentChunk.chunk_index,
+        DocumentChunk.embedding_vector,
+    ).where(
+        DocumentChunk.department_id == department_id,
+        DocumentChunk.embedding_vector.isnot(None),
+    ).order_by(DocumentChunk.content_id, DocumentChunk.chunk_index)
+
+
+class SearchStats(NamedTuple):
+    """Как прошел поиск: с отбором документов по центроидам, по квантованной матрице, сколько оценено"""
+    two_stage: bool
+    quantized: bool
+    rows_scored: int  # Чанков, оцененных по матрице (int8 в режиме квантования)
+    rows_rescored: int  # Кандидатов с точной переоценкой (только в режиме квантования)
+
+
+class DepartmentIndex:
+    """
+    Нормированная матрица эмбеддингов чанков отдела и идентификаторы строк.
+
+    Строки упорядочены по (content_id, chunk_index), поэтому чанки каждого документа
+    занимают непрерывный диапазон [doc_starts[i], doc_ends[i]), а doc_centroids[i] —
+    центроид этого документа для двухэтапного поиска.
+
+    В режиме квантования в памяти хранятся только int8-коды и масштабы (в ~4 раза меньше
+    float32). Кандидаты отбираются по приближенным оценкам, а лучшие rescore_candidates
+    переоцениваются точно по float-векторам из memory-mapped файла на диске.
+    """
+
+    # Блок строк, который разом переводится из int8 в float32 при приближенной оценке
+    SCAN_BLOCK_ROWS = 8192
+    RECALL_SAMPLE_QUERIES = 64
+
+    def __init__(
+        self,
+        department_id: int,
+        version_key: Tuple[Any, ...],
+        chunk_ids: np.ndarray,
+        content_ids: np.ndarray,
+        chunk_indexes: np.ndarray,
+        vectors: np.ndarray,
+        stored_centroids: Optional[Dict[int, List[float]]] = None,
+        quantize: bool = False,
+        rescore_candidates: int = 200,
+        storage_dir: Optional[str] = None,
+    ):
+        self.department_id = department_id
+        self.version_key = version_key
+        self.chunk_ids = chunk_ids
+        self.content_ids = content_ids
+        self.chunk_indexes = chunk_indexes
+        self.vectors = vectors
+        self._build_documents(stored_centroids or {})
+
+        self.quantized = False
+        self.codes: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.rescore_candidates = rescore_candidates
+        self.recall_at_5: Optional[float] = None
+        self._vectors_path: Optional[str] = None
+        if quantize and self.size > 0:
+            self._quantize(storage_dir or tempfile.gettempdir())
+
+    def _quantize(self, storage_dir: str) -> None:
+        """Переводит индекс на int8-коды, а float-векторы выносит в memory-mapped файл"""
+        self.codes, self.scales = quantize_int8(self.vectors)
+        self.quantized = True
+        self.recall_at_5 = self._measure_recall(k=5)
+
+        os.makedirs(storage_dir, exist_ok=True)
+        path = os.path.join(storage_dir, f"department_{self.department_id}_{uuid.uuid4().hex}.npy")
+        np.save(path, self.vectors)
+        self._vectors_path = path
+        self.vectors = np.load(path, mmap_mode="r")
+
+    def _measure_recall(self, k: int) -> float:
+        """Recall@k квантованного поиска с переоценкой относительно точного (запросы — зашумленные чанки)"""
+        rng = np.random.default_rng(self.department_id)
+        sample = rng.choice(self.size, size=min(self.RECALL_SAMPLE_QUERIES, self.size), replace=False)
+        noise = rng.standard_normal((sample.size, self.dimension)).astype(np.float32) * 0.05
+        queries = normalize_rows(self.vectors[sample] + noise)
+
+        hits = 0
+        for query in queries:
+            exact = set(top_n(self.vectors @ query, k).tolist())
+            rows, scores = self.search(query)
+            hits += len(exact & set(rows[top_n(scores, k)].tolist()))
+        return round(hits / (k * sample.size), 4)
+
+    def release(self) -> None:
+        """Удаляет файл с float-векторами (открытые отображения остаются валидными до закрытия)"""
+        if self._vectors_path:
+            try:
+                os.remove(self._vectors_path)
+            except OSError as e:
+                logger.warning(f"RAG: не удалось удалить файл индекса {self._vectors_path}: {e}")
+            self._vectors_path = None
+
+    def _build_documents(self, stored_centroids: Dict[int, List[float]]) -> None:
+        """Диапазоны строк документов и их центроиды (сохраненные при индексации или вычисленные)"""
+        if self.size == 0:
+            self.doc_content_ids = np.empty(0, dtype=np.int64)
+            self.doc_starts = np.empty(0, dtype=np.int64)
+            self.doc_ends = np.empty(0, dtype=np.int64)
+            self.doc_centroids = np.empty((0, self.dimension), dtype=np.float32)
+            return
+
+        self.doc_content_ids, self.doc_starts = np.unique(self.content_ids, return_index=True)
+        self.doc_ends = np.append(self.doc_starts[1:], self.size)
+
+        # Для документов без сохраненного центроида (проиндексированных до его появления) считаем на лету
+        computed = normalize_rows(np.add.reduceat(self.vectors, self.doc_starts, axis=0))
+        centroids = computed.astype(np.float32, copy=False)
+        for i, content_id in enumerate(self.doc_content_ids.tolist()):
+            stored = stored_centroids.get(content_id)
+            if stored is not None and len(stored) == self.dimension:
+                centroids[i] = stored
+        self.doc_centroids = normalize_rows(centroids)
+
+    @property
+    def size(self) -> int:
+        return int(self.chunk_ids.shape[0])
+
+    @property
+    def dimension(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    def vectors_for(self, rows: np.ndarray) -> np.ndarray:
+        """Точные нормированные float-векторы указанных строк"""
+        return np.asarray(self.vectors[rows], dtype=np.float32)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Объем памяти индекса и точность квантования"""
+        float_bytes = self.size * self.dimension * 4
+        resident_bytes = (
+            self.chunk_ids.nbytes + self.content_ids.nbytes + self.chunk_indexes.nbytes
+            + self.doc_centroids.nbytes + self.doc_starts.nbytes + self.doc_ends.nbytes
+        )
+        if self.quantized:
+            resident_bytes += self.codes.nbytes + self.scales.nbytes
+        else:
+            resident_bytes += self.vectors.nbytes
+        return {
+            "chunks": self.size,
+            "documents": int(self.doc_content_ids.size),
+            "dimension": self.dimension,
+            "quantized": self.quantized,
+            "rescore_candidates": self.rescore_candidates if self.quantized else None,
+            "vectors_bytes": int(self.codes.nbytes if self.quantized else self.vectors.nbytes),
+            "float_vectors_bytes": float_bytes,
+            "resident_bytes": int(resident_bytes),
+            "recall_at_5": self.recall_at_5,
+        }
+
+    @classmethod
+    def load(cls, db: Session, department_id: int, version_key: Tuple[Any, ...], **options) -> "DepartmentIndex":
+        """Загружает эмбеддинги отдела одним запросом и собирает матрицу float32"""
+        rows = db.execute(department_chunks_query(department_id)).all()
+        stored_centroids = dict(db.query(
+            DocumentCentroid.content_id,
+            DocumentCentroid.centroid_vector,
+        ).filter(DocumentCentroid.department_id == department_id).all())
+
+        # Размерность определяем по большинству: векторы-заглушки другой длины пропускаем
+        lengths: Dict[int, int] = {}
+        for row in rows:
+            if row.embedding_vector:
+                lengths[len(row.embedding_vector)] = lengths.get(len(row.embedding_vector), 0) + 1
+        dimension = max(lengths, key=lengths.get) if lengths else 0
+        rows = [row for row in rows if row.embedding_vector and len(row.embedding_vector) == dimension]
+
+        vectors = np.array([row.embedding_vector for row in rows], dtype=np.float32).reshape(len(rows), dimension)
+        return cls(
+            department_id=department_id,
+            version_key=version_key,
+            chunk_ids=np.array([row.id for row in rows], dtype=np.int64),
+            content_ids=np.array([row.content_id for row in rows], dtype=np.int64),
+            chunk_indexes=np.array([row.chunk_index for row in rows], dtype=np.int64),
+            vectors=normalize_rows(vectors),
+            stored_centroids=stored_centroids,
+            **options,
+        )
+
+    def score(self, queries: np.ndarray, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """
+        Сходство нормированных запросов (m × d) с чанками строк [start, end): матрица (строки × m).
+
+        Без квантования — точный косинус; с квантованием — приближенная оценка по int8-кодам.
+        """
+        end = self.size if end is None else end
+        if not self.quantized:
+            return self.vectors[start:end] @ queries.T
+
+        scaled_queries = (queries * self.scales).T
+        scores = np.empty((end - start, queries.shape[0]), dtype=np.float32)
+        for block_start in range(start, end, self.SCAN_BLOCK_ROWS):
+            block_end = min(block_start + self.SCAN_BLOCK_ROWS, end)
+            block = self.codes[block_start:block_end].astype(np.float32)
+            scores[block_start - start:block_end - start] = block @ scaled_queries
+        return scores
+
+    def search(self, query_vector: np.ndarray, top_documents: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Поиск по одному нормированному запросу: (строки, сходства)"""
+        rows, scores = self.search_many(query_vector.reshape(1, -1), top_documents=top_documents)
+        return rows, scores[:, 0]
+
+    def search_many(self, queries: np.ndarray, top_documents: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Возвращает (строки, сходства) оцененных чанков для нескольких запросов сразу;
+        сходства — матрица (строки × запросы), считается одним матричным произведением.
+        Подробности — в search_with_stats().
+        """
+        rows, scores, _ = self.search_with_stats(queries, top_documents=top_documents)
+        return rows, scores
+
+    def search_with_stats(
+        self, queries: np.ndarray, top_documents: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray, SearchStats]:
+        """
+        Как search_many(), плюс статистика самого поиска.
+
+        Без top_documents оцениваются все чанки отдела. С top_documents сначала выбираются
+        документы с наибольшим сходством центроида (максимум по запросам), и оцениваются
+        только их чанки. В режиме квантования возвращаются только лучшие кандидаты
+        каждого запроса с точными оценками.
+        """
+        two_stage = bool(top_documents) and top_documents < self.doc_content_ids.size
+        if not two_stage:
+            rows, scores = np.arange(self.size), self.score(queries)
+        else:
+            documents = top_n((self.doc_centroids @ queries.T).max(axis=1), top_documents)
+            rows = np.concatenate([np.arange(self.doc_starts[i], self.doc_ends[i]) for i in documents])
+            scores = np.concatenate([
+                self.score(queries, self.doc_starts[i], self.doc_ends[i]) for i in documents
+            ])
+
+        if self.quantized:
+            best = np.concatenate([top_n(scores[:, j], self.rescore_candidates) for j in range(scores.shape[1])])
+            candidates = np.unique(rows[best])
+            stats = SearchStats(two_stage, True, int(rows.size), int(candidates.size))
+            return candidates, self.vectors_for(candidates) @ queries.T, stats
+        return rows, scores, SearchStats(two_stage, False, int(rows.size), 0)
+
+
+class RAGIndexCache:
+    """
+    Процессный кэш индексов отделов.
+
+    Индекс перечитывается, если изменился ключ версии (время последнего обновления
+    и число чанков RAG сессии) или отдел был явно инвалидирован.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes: Dict[int, DepartmentIndex] = {}
+        # Квантование int8 с точной переоценкой лучших кандидатов
+        self.quantize = os.getenv('RAG_QUANTIZE', 'false').lower() == 'true'
+        self.rescore_candidates = int(os.getenv('RAG_QUANTIZE_RESCORE', '200'))
+        self.storage_dir = os.getenv('RAG_INDEX_DIR', os.path.join(tempfile.gettempdir(), 'rag_index'))
+
+    def get(self, db: Session, department_id: int, version_key: Tuple[Any, ...]) -> DepartmentIndex:
+        with self._lock:
+            index = self._indexes.get(department_id)
+        if index is not None and index.version_key == version_key:
+            return index
+
+        index = DepartmentIndex.load(
+            db,
+            department_id,
+            version_key,
+            quantize=self.quantize,
+            rescore_candidates=self.rescore_candidates,
+            storage_dir=self.storage_dir,
+        )
+        logger.info(
+            f"RAG: загружен индекс отдела {department_id}: {index.size} чанков, размерность {index.dimension}"
+            + (f", int8, recall@5={index.recall_at_5}" if index.quantized else "")
+        )
+        with self._lock:
+            previous = self._indexes.get(department_id)
+            self._indexes[department_id] = index
+        if previous is not None and previous is not index:
+            previous.release()
+        return index
+
+    def invalidate(self, department_id: Optional[int] = None) -> None:
+        with self._lock:
+            if department_id is None:
+                released = list(self._indexes.values())
+                self._indexes.clear()
+            else:
+                released = [index for index in [self._indexes.pop(department_id, None)] if index is not None]
+        for index in released:
+            index.release()
+
+
+# Глобальный экземпляр кэша индексов
+rag_index_cache = RAGIndexCache()
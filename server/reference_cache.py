@@ -0,0 +1,82 @@
+"""
+Кэш справочников (отделы, уровни доступа, теги) для подстановки названий в ответы
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from models_db import Access, Department, Tag
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    departments: Dict[int, str]
+    access_levels: Dict[int, str]
+    tags: Dict[int, str]
+
+    def department_name(self, department_id: Optional[int], default: str = "Неизвестный отдел") -> str:
+        return self.departments.get(department_id, default)
+
+    def access_name(self, access_id: Optional[int], default: str = "Неизвестный доступ") -> str:
+        return self.access_levels.get(access_id, default)
+
+    def tag_name(self, tag_id: Optional[int]) -> Optional[str]:
+        return self.tags.get(tag_id) if tag_id else None
+
+
+class ReferenceCache:
+    """
+    Процессный read-through кэш справочников Department, Access и Tag.
+
+    Справочники меняются редко, поэтому загружаются целиком (по запросу на таблицу)
+    и раздаются из памяти. Изменения тегов через API вызывают invalidate();
+    TTL — страховка на случай правок в БД в обход приложения.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._data: Optional[ReferenceData] = None
+        self._loaded_at = 0.0
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self, db: Session) -> ReferenceData:
+        """Возвращает справочники, загружая их, если кэш пуст или устарел"""
+        with self._lock:
+            data = self._data
+            fresh = data is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+            version = self._version
+        if fresh:
+            return data
+
+        loaded = ReferenceData(
+            departments=dict(db.query(Department.id, Department.department_name).all()),
+            access_levels=dict(db.query(Access.id, Access.access_name).all()),
+            tags=dict(db.query(Tag.id, Tag.tag_name).all()),
+        )
+
+        with self._lock:
+            # Если пока шла загрузка кэш инвалидировали, не сохраняем устаревшие данные
+            if version == self._version:
+                self._data = loaded
+                self._loaded_at = time.monotonic()
+        return loaded
+
+    def invalidate(self) -> None:
+        """Сбрасывает кэш и увеличивает версию"""
+        with self._lock:
+            self._data = None
+            self._version += 1
+
+
+# Глобальный экземпляр кэша
+reference_cache = ReferenceCache(ttl_seconds=float(os.getenv("REFERENCE_CACHE_TTL", "300")))
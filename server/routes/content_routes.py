@@ -1,12 +1,35 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form, Request, status
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import os
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_async_db, insert_rows
 from models_db import Access, Content, User, Tag
 from routes.user_routes import get_current_user, require_admin, is_admin
+from blob_store import blob_store
+from content_cache import content_metadata_cache
+from directory_manifest import directory_manifests
+from document_previews import document_previews
+from file_downloads import download_response
+from file_uploads import (
+    UPLOAD_CONCURRENCY,
+    StagedUpload,
+    discard_upload_path,
+    preserve_existing,
+    publish_upload,
+    restore_previous,
+    save_upload,
+    stage_upload,
+)
+from reference_cache import reference_cache
+from search_index import content_search_index
+from zip_export import iter_zip
+from pagination import PageParams, SortKey, apply_page, count_cache, finish_page, page_params, set_page_headers
 from pydantic import BaseModel
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
-from typing import List
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from typing import List, Optional
 import re
 import requests
 import shutil
@@ -19,14 +42,73 @@ router = APIRouter(prefix="/content", tags=["content"])
 # Получаем глобальный rate limiter
 limiter = get_limiter()
 
+# Списки контента отдаются страницами по id
+CONTENT_SORT_KEY = SortKey((Content.id,))
+
+
+# Запросы эндпоинтов собираются функциями: те же запросы проверяет migrations.check_query_plans
+def content_filter_conditions(access_level: int, department_id: int, tag_id: Optional[int] = None) -> list:
+    conditions = [
+        Content.access_level == access_level,
+        Content.department_id == department_id
+    ]
+    if tag_id is not None:
+        conditions.append(Content.tag_id == tag_id)  # Фильтрация по тегу
+    return conditions
+
+
+def content_page_query(page: PageParams, *conditions):
+    """Страница контента по CONTENT_SORT_KEY (/content/all, /content/filter)"""
+    return apply_page(select(Content).where(*conditions), CONTENT_SORT_KEY, page)
+
+
+def content_by_tags_query(access_level: int, department_id: int):
+    """Весь доступный контент вместе с названиями тегов, упорядоченный по тегу (/user/{id}/content/by-tags)"""
+    return select(
+        Content.id,
+        Content.title,
+        Content.description,
+        Content.file_path,
+        Content.tag_id,
+        Tag.tag_name,
+    ).outerjoin(Tag, Tag.id == Content.tag_id).where(
+        Content.access_level == access_level,
+        Content.department_id == department_id
+    ).order_by(Tag.id, Content.id)
+
+# Базовая директория для загружаемых файлов
+UPLOAD_BASE_DIR = "/app/files"
+
+
+def _department_path(department_id: int) -> str:
+    return os.path.join(UPLOAD_BASE_DIR, f"ContentForDepartment/{department_id}")
+
+
+def _format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size} Б"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} КБ"
+    if size < 1024 * 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} МБ"
+    return f"{size / (1024 * 1024 * 1024):.1f} ГБ"
+
+
+def _save_content(db: Session, content: Content) -> None:
+    db.add(content)
+    db.commit()
+    db.refresh(content)
+
 @router.get("/document-viewer/{content_id}")
-async def get_document_viewer_page(
+def get_document_viewer_page(
     content_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """
-    Возвращает HTML страницу для просмотра документа через Google Docs Viewer
+    Возвращает HTML страницу просмотра документа: превью, отрисованное на сервере
+    и закэшированное на диске (DOCX, XLSX, PDF, TXT)
     """
     try:
         # Получаем контент из базы данных
@@ -43,96 +125,12 @@ async def get_document_viewer_page(
         # Получаем расширение файла
         file_extension = content.file_path.lower().split('.')[-1] if '.' in content.file_path else ''
         
-        # Определяем URL для скачивания файла
-        download_url = f"http://localhost:8081/content/download-file/{content_id}"
-        
-        # Поддерживаемые форматы для Google Docs Viewer
-        supported_formats = ['doc', 'docx', 'pdf', 'ppt', 'pptx', 'xls', 'xlsx', 'txt', 'rtf']
-        
-        if file_extension in supported_formats:
-            # Используем Google Docs Viewer для поддерживаемых форматов
-            google_docs_url = f"https://docs.google.com/viewer?url={download_url}&embedded=true"
-            
-            html_content = f"""
-            <!DOCTYPE html>
-            <html lang="ru">
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>{content.title} - Просмотр документа</title>
-                <style>
-                    body {{
-                        margin: 0;
-                        padding: 0;
-                        font-family: Arial, sans-serif;
-                        background-color: #f5f5f5;
-                    }}
-                    .header {{
-                        background: #f8f9fa;
-                        padding: 15px 20px;
-                        border-bottom: 1px solid #dee2e6;
-                        display: flex;
-                        justify-content: space-between;
-                        align-items: center;
-                    }}
-                    .header h1 {{
-                        margin: 0;
-                        font-size: 18px;
-                        color: #333;
-                    }}
-                    .header .controls {{
-                        display: flex;
-                        gap: 10px;
-                    }}
-                    .btn {{
-                        padding: 8px 16px;
-                        border: none;
-                        border-radius: 4px;
-                        cursor: pointer;
-                        text-decoration: none;
-                        font-size: 14px;
-                    }}
-                    .btn-primary {{
-                        background: #007bff;
-                        color: white;
-                    }}
-                    .btn-secondary {{
-                        background: #6c757d;
-                        color: white;
-                    }}
-                    .google-docs-info {{
-                        background: #fff3cd;
-                        border: 1px solid #ffeaa7;
-                        color: #856404;
-                        padding: 10px;
-                        border-radius: 4px;
-                        margin: 10px 20px;
-                    }}
-                    #viewer {{
-                        width: 100%;
-                        height: calc(100vh - 80px);
-                        border: none;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="header">
-                    <h1>{content.title}</h1>
-                    <div class="controls">
-                        <a href="/content/download-file/{content_id}" class="btn btn-primary">Скачать</a>
-                        <a href="javascript:history.back()" class="btn btn-secondary">Назад</a>
-                    </div>
-                </div>
-                <div class="google-docs-info">
-                    <strong>Внимание:</strong> Google Docs Viewer может не работать с файлами на localhost. 
-                    Для корректной работы убедитесь, что файл доступен по публичному URL.
-                </div>
-                <iframe id="viewer" src="{google_docs_url}"></iframe>
-            </body>
-            </html>
-            """
-            
-            return HTMLResponse(content=html_content)
+        if document_previews.supports(content.file_path):
+            if not os.path.exists(content.file_path):
+                raise HTTPException(status_code=404, detail="Файл не найден")
+            # Обычно превью уже отрисовано фоновым пулом после загрузки
+            preview_path = document_previews.get_or_render(content.id, content.file_path, content.title)
+            return download_response(request, preview_path, media_type="text/html; charset=utf-8")
         else:
             # Для неподдерживаемых форматов показываем сообщение
             html_content = f"""
@@ -193,6 +191,8 @@ async def get_document_viewer_page(
             
             return HTMLResponse(content=html_content)
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при создании страницы просмотра: {str(e)}")
 
@@ -218,42 +218,57 @@ async def upload_content(
     if not is_admin(current_user) and department_id != current_user.department_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав для загрузки в другой отдел")
 
-    # Создаем базовую директорию /app/files/, если она не существует
-    os.makedirs("/app/files/", exist_ok=True)
-    
     # Автоматически формируем путь на основе ID отдела с новой структурой
+    # (директория создается при сохранении файла)
     department_directory = f"ContentForDepartment/AllTypesOfFiles/{department_id}"
-    target_dir = f"/app/files/{department_directory}"
-    
-    # Создаем директорию для отдела, если она не существует
-    os.makedirs(target_dir, exist_ok=True)
+    target_dir = os.path.join(UPLOAD_BASE_DIR, department_directory)
     
     # Формируем полный путь к файлу
     file_location = f"{target_dir}/{file.filename}"
-    
-    try:
-        with open(file_location, "wb") as f:
-            f.write(await file.read())
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при сохранении файла: {str(e)}")
 
-    # Проверка существования уровня доступа
-    access = db.query(Access).filter(Access.id == access_id).first()
+    # Проверка существования уровня доступа (до записи файла, чтобы не оставлять его на диске)
+    access = await run_in_threadpool(lambda: db.query(Access).filter(Access.id == access_id).first())
     if access is None:
         raise HTTPException(status_code=400, detail="Уровень доступа не найден")
 
+    try:
+        # Файл пишется частями с подсчетом sha256, без чтения загрузки в память целиком;
+        # прежний файл с тем же именем сохраняется для отката
+        backup_path = await run_in_threadpool(preserve_existing, file_location)
+        try:
+            stored = await save_upload(file, file_location)
+        except BaseException:
+            if backup_path is not None:
+                discard_upload_path(backup_path)
+            raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при сохранении файла: {str(e)}")
+
     # Создание записи в базе данных
     new_content = Content(
         title=title,
         description=description,
         file_path=file_location,
+        file_hash=stored.sha256,
+        file_size=stored.size,
         access_level=access_id,
         department_id=department_id,
         tag_id=tag_id  # Указываем тег, если он есть
     )
-    db.add(new_content)
-    db.commit()
-    db.refresh(new_content)
+    try:
+        await run_in_threadpool(_save_content, db, new_content)
+    except Exception as e:
+        await run_in_threadpool(db.rollback)
+        # Запись не сохранена: возвращаем прежний файл и освобождаем блоб без ссылок
+        restore_previous(file_location, backup_path)
+        await run_in_threadpool(blob_store.release, db, [stored.sha256])
+        raise HTTPException(status_code=500, detail=f"Ошибка при сохранении контента: {str(e)}")
+    if backup_path is not None:
+        discard_upload_path(backup_path)
+    content_metadata_cache.invalidate([department_id])
+    directory_manifests.invalidate(target_dir)
+    content_search_index.upsert(new_content)
+    document_previews.schedule(new_content.id, file_location, title)
 
     return {"message": f"Контент успешно загружен в {file_location}"}
 
@@ -267,60 +282,120 @@ async def upload_files(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """
+    Пакетная загрузка файлов в отдел.
+
+    Файлы пишутся во временные файлы параллельно (до UPLOAD_CONCURRENCY) и ставятся
+    на место, затем все записи Content вставляются одним INSERT в одной транзакции.
+    Если вставка не удалась, публикация откатывается (прежние файлы с теми же именами
+    возвращаются), поэтому записи без файла не остаются. Результат сообщается по
+    каждому файлу.
+    """
     # Проверки прав на массовую загрузку
     if not is_admin(current_user) and department_id != current_user.department_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав для загрузки в другой отдел")
-    # Базовая директория для всех файлов
-    base_dir = "/app/files"
-    print(f"DEBUG: Создаем базовую директорию: {base_dir}")
-    os.makedirs(base_dir, exist_ok=True)
-    print(f"DEBUG: Базовая директория создана/существует: {os.path.exists(base_dir)}")
-    
     # Автоматически формируем путь на основе ID отдела
     department_directory = f"ContentForDepartment/{department_id}"
-    target_dir = os.path.join(base_dir, department_directory)
-    print(f"DEBUG: Целевая директория: {target_dir}")
-    
-    # Создаем директорию для отдела, если она не существует
-    os.makedirs(target_dir, exist_ok=True)
-    print(f"DEBUG: Директория отдела создана/существует: {os.path.exists(target_dir)}")
-    
-    # Список для хранения информации о загруженных файлах
-    uploaded_files_info = []
+    target_dir = os.path.join(UPLOAD_BASE_DIR, department_directory)
 
-    for file in files:
-        # Сохранение файла в указанной директории
-        file_location = os.path.join(target_dir, file.filename)
-        
+    # Повтор имени в пакете указывал бы на тот же файл из двух записей — такие файлы
+    # (кроме первого) не загружаются
+    seen_names = set()
+    duplicates = set()
+    for index, file in enumerate(files):
+        if file.filename in seen_names:
+            duplicates.add(index)
+        seen_names.add(file.filename)
+
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def stage(index: int, file: UploadFile):
+        if index in duplicates:
+            raise ValueError("Файл с таким именем уже есть в пакете")
+        async with semaphore:
+            return await stage_upload(file, target_dir)
+
+    # По индексу файла: StagedUpload, затем итог в виде словаря, либо исключение
+    results = await asyncio.gather(*(stage(index, file) for index, file in enumerate(files)), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, Exception):
+            for staged in results:
+                if isinstance(staged, StagedUpload):
+                    discard_upload_path(staged.temp_path)
+            raise result
+
+    # Файлы ставятся на место до вставки записей; прежние файлы с теми же именами
+    # сохраняются жесткими ссылками для отката
+    published = []  # (индекс файла, путь, резервная ссылка на прежний файл)
+    for index, result in enumerate(results):
+        if isinstance(result, Exception):
+            continue
+        destination = os.path.join(target_dir, files[index].filename)
+        backup_path = None
         try:
-            with open(file_location, "wb") as f:
-                f.write(await file.read())
-            
-            # Сохраняем относительный путь в БД (относительно /app/files/)
-            relative_path = os.path.relpath(file_location, base_dir)
-            db_file_path = os.path.join(base_dir, relative_path)
-            
-            # Добавление информации о файле в базу данных
-            new_content = Content(
-                title=file.filename,
-                description="Загруженный файл",
-                file_path=db_file_path,  # Сохраняем полный путь
-                access_level=access_level,
-                department_id=department_id,
-                tag_id=None
-            )
-            db.add(new_content)
+            backup_path = await run_in_threadpool(preserve_existing, destination)
+            await publish_upload(result, destination)
+        except Exception as e:
+            discard_upload_path(result.temp_path)
+            if backup_path is not None:
+                discard_upload_path(backup_path)
+            results[index] = e
+            continue
+        published.append((index, destination, backup_path))
+
+    # Записи для опубликованных файлов (полный путь, как и раньше)
+    rows = [
+        {
+            "title": files[index].filename,
+            "description": "Загруженный файл",
+            "file_path": destination,
+            "file_hash": results[index].sha256,
+            "file_size": results[index].size,
+            "access_level": access_level,
+            "department_id": department_id,
+            "tag_id": None,
+        }
+        for index, destination, _ in published
+    ]
+
+    def save_contents():
+        try:
+            content_ids = insert_rows(db, Content, rows)
             db.commit()
-            db.refresh(new_content)
+            return content_ids
+        except Exception:
+            db.rollback()
+            raise
 
-            uploaded_files_info.append({
-                "filename": file.filename,
-                "file_path": db_file_path
-            })
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Ошибка при сохранении файла {file.filename}: {str(e)}")
+    try:
+        content_ids = await run_in_threadpool(save_contents)
+    except Exception as e:
+        for _, destination, backup_path in published:
+            restore_previous(destination, backup_path)
+        await run_in_threadpool(blob_store.release, db, [row["file_hash"] for row in rows])
+        raise HTTPException(status_code=500, detail=f"Ошибка при сохранении файлов: {str(e)}")
 
-    return {"message": f"Файлы успешно загружены в {target_dir}", "files": uploaded_files_info}
+    for (index, _, backup_path), row, content_id in zip(published, rows, content_ids):
+        if backup_path is not None:
+            discard_upload_path(backup_path)
+        content_search_index.upsert(Content(id=content_id, **row))
+        document_previews.schedule(content_id, row["file_path"], row["title"])
+        results[index] = {"status": "ok", "content_id": content_id, "file_path": row["file_path"]}
+    content_metadata_cache.invalidate([department_id])
+    # Каталог отдела мог быть создан этой загрузкой — сбрасываем и список отделов
+    directory_manifests.invalidate(target_dir, os.path.dirname(target_dir))
+
+    uploaded_files_info = [
+        {"filename": file.filename, "status": "error", "error": str(result)}
+        if isinstance(result, Exception) else {"filename": file.filename, **result}
+        for file, result in zip(files, results)
+    ]
+    failed = sum(1 for result in results if isinstance(result, Exception))
+    if failed:
+        message = f"Загружено файлов: {len(files) - failed} из {len(files)} в {target_dir}"
+    else:
+        message = f"Файлы успешно загружены в {target_dir}"
+    return {"message": message, "files": uploaded_files_info}
 
 # Модель для обновления контента
 class ContentUpdate(BaseModel):
@@ -331,7 +406,7 @@ class ContentUpdate(BaseModel):
     tag_id: int = None
 
 @router.put("/{content_id}")
-async def update_content(
+def update_content(
     content_id: int,
     content_data: ContentUpdate,
     db: Session = Depends(get_db),
@@ -344,6 +419,7 @@ async def update_content(
     content = db.query(Content).filter(Content.id == content_id).first()
     if content is None:
         raise HTTPException(status_code=404, detail="Контент не найден")
+    previous_department_id = content.department_id
 
     # Обновляем поля, если они были переданы
     if content_data.title is not None:
@@ -363,6 +439,8 @@ async def update_content(
 
     db.commit()
     db.refresh(content)
+    content_metadata_cache.invalidate([previous_department_id, content.department_id])
+    content_search_index.upsert(content)
 
     return {"message": "Контент успешно обновлен", "content": content}
 
@@ -379,8 +457,10 @@ class ContentBase(BaseModel):
 async def get_content_by_access_and_department(
     access_level: int,
     department_id: int,
+    response: Response,
     tag_id: int = None,  # Новый параметр для фильтрации по тегу
-    db: Session = Depends(get_db),
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
 ):
     # Ограничиваем доступ: пользователь должен соответствовать запрошенным access/department или быть админом
@@ -389,18 +469,19 @@ async def get_content_by_access_and_department(
     )):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещён")
     try:
-        query = db.query(Content).filter(
-            Content.access_level == access_level,
-            Content.department_id == department_id
-        )
-        
-        if tag_id is not None:
-            query = query.filter(Content.tag_id == tag_id)  # Фильтрация по тегу
+        conditions = content_filter_conditions(access_level, department_id, tag_id)
+        query = content_page_query(page, *conditions)
+        # Пустая страница — обычный ответ [] (в том числе после последней страницы)
+        contents, next_cursor = finish_page((await db.execute(query)).scalars().all(), page, lambda content: (content.id,))
 
-        contents = query.all()
-
-        if not contents:
-            raise HTTPException(status_code=404, detail="Контент не найден")
+        total = None
+        if page.with_total:
+            key = count_cache.key("content", content_metadata_cache.version, access_level, department_id, tag_id)
+            total = count_cache.get(key)
+            if total is None:
+                total = (await db.execute(select(func.count(Content.id)).where(*conditions))).scalar_one()
+                count_cache.set(key, total)
+        set_page_headers(response, next_cursor, total)
 
         return [
             {
@@ -413,12 +494,14 @@ async def get_content_by_access_and_department(
                 "tag_id": content.tag_id  # Возвращаем ID тега
             } for content in contents
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении контента: {str(e)}")
     
     
 @router.get("/content/{content_id}")
-async def get_content_by_id(
+def get_content_by_id(
     content_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -448,7 +531,7 @@ async def get_content_by_id(
         raise HTTPException(status_code=500, detail=f"Ошибка при получении контента: {str(e)}")
 
 @router.delete("/content/{content_id}")
-async def delete_content(
+def delete_content(
     content_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -467,10 +550,15 @@ async def delete_content(
 
         # Сохраняем путь к файлу
         file_path = content.file_path
+        file_hash = content.file_hash
+        department_id = content.department_id
         
         # Удаляем контент из базы данных
         db.delete(content)
         db.commit()
+        content_metadata_cache.invalidate([department_id])
+        content_search_index.remove([content_id])
+        document_previews.remove(content_id)
         
         # Удаляем файл с сервера, если он существует
         if os.path.exists(file_path):
@@ -478,6 +566,9 @@ async def delete_content(
                 os.remove(file_path)
             except Exception as e:
                 print(f"Ошибка при удалении файла {file_path}: {e}")
+        directory_manifests.invalidate(os.path.dirname(file_path))
+        # Блоб удаляется, только если на него больше не ссылается ни одна запись
+        blob_store.release(db, [file_hash])
         
         return {"message": "Контент успешно удален"}
     except Exception as e:
@@ -487,11 +578,24 @@ async def delete_content(
 
 @router.get("/all")
 async def get_all_content(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_admin),
 ):
     try:
-        contents = db.query(Content).all()
+        query = content_page_query(page)
+        contents, next_cursor = finish_page((await db.execute(query)).scalars().all(), page, lambda content: (content.id,))
+
+        total = None
+        if page.with_total:
+            key = count_cache.key("content", content_metadata_cache.version)
+            total = count_cache.get(key)
+            if total is None:
+                total = (await db.execute(select(func.count(Content.id)))).scalar_one()
+                count_cache.set(key, total)
+        set_page_headers(response, next_cursor, total)
+
         return [
             {
                 "id": content.id,
@@ -503,13 +607,16 @@ async def get_all_content(
                 "tag_id": content.tag_id
             } for content in contents
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении контента: {str(e)}")
     
     
 @router.get("/download-file/{content_id}")
-async def download_file(
+def download_file(
     content_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -538,13 +645,13 @@ async def download_file(
         else:
             raise HTTPException(status_code=404, detail="Файл не найден")
 
-    # Возвращаем файл как ответ
-    return FileResponse(file_path, media_type='application/octet-stream', filename=os.path.basename(file_path))
+    # Возвращаем файл как ответ (ETag/304, Range, при включенном режиме — через nginx)
+    return download_response(request, file_path, filename=os.path.basename(file_path))
 
 
 
 @router.get("/user/{user_id}/content/by-tags/{tag_id}")
-async def get_user_content_by_tags_and_tag_id(
+def get_user_content_by_tags_and_tag_id(
     user_id: int,
     tag_id: int,
     db: Session = Depends(get_db),
@@ -582,9 +689,11 @@ async def get_user_content_by_tags_and_tag_id(
         raise HTTPException(status_code=500, detail=f"Ошибка при получении контента: {str(e)}")
 
 @router.get("/search-documents")
-async def search_documents(
+def search_documents(
     user_id: int,
     search_query: str = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -597,27 +706,12 @@ async def search_documents(
         if user is None:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
-        # Базовый запрос с учетом прав доступа пользователя
-        query = db.query(Content).filter(
-            Content.access_level == user.access_id,
-            Content.department_id == user.department_id
+        # Поиск по полнотекстовому индексу с учетом прав доступа пользователя,
+        # результаты упорядочены по релевантности
+        total, contents = content_search_index.search(
+            db, user.department_id, user.access_id, search_query, limit=limit, offset=offset
         )
         
-        # Если указан поисковый запрос, добавляем условия поиска
-        if search_query:
-            from sqlalchemy import or_
-            # Поиск по названию, описанию или пути файла
-            query = query.filter(
-                or_(
-                    Content.title.ilike(f"%{search_query}%"),  # Поиск по названию
-                    Content.description.ilike(f"%{search_query}%"),  # Поиск по описанию
-                    Content.file_path.ilike(f"%{search_query}%")  # Поиск по пути файла (включая имя файла)
-                )
-            )
-        
-        # Выполняем запрос
-        contents = query.all()
-        
         # Формируем результат
         documents = [
             {
@@ -630,12 +724,14 @@ async def search_documents(
             for content in contents
         ]
         
-        return {"documents": documents}
+        return {"documents": documents, "total": total, "limit": limit, "offset": offset}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при поиске документов: {str(e)}")
 
 @router.post("/create-tag")
-async def create_tag(
+def create_tag(
     tag_name: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
@@ -645,12 +741,13 @@ async def create_tag(
         db.add(new_tag)
         db.commit()
         db.refresh(new_tag)
+        reference_cache.invalidate()
         return {"message": "Тег успешно создан", "tag": new_tag}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при создании тега: {str(e)}")
 
 @router.put("/update-tag/{tag_id}")
-async def update_tag(
+def update_tag(
     tag_id: int,
     tag_name: str,
     db: Session = Depends(get_db),
@@ -663,12 +760,13 @@ async def update_tag(
         tag.tag_name = tag_name
         db.commit()
         db.refresh(tag)
+        reference_cache.invalidate()
         return {"message": "Тег успешно обновлен", "tag": tag}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при обновлении тега: {str(e)}")
 
 @router.delete("/delete-tag/{tag_id}")
-async def delete_tag(
+def delete_tag(
     tag_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
@@ -683,23 +781,25 @@ async def delete_tag(
         
         db.delete(tag)
         db.commit()
+        reference_cache.invalidate()
         return {"message": "Тег успешно удален"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при удалении тега: {str(e)}")
 
 @router.get("/list-files/{department_id}")
-async def list_department_files(
+def list_department_files(
     department_id: int,
     current_user: User = Depends(require_admin),
 ):
     """
-    Возвращает список файлов в директории отдела.
+    Возвращает список файлов в директории отдела (из кэша манифестов каталогов).
     """
     try:
         # Формируем путь к директории отдела
-        department_path = f"/app/files/ContentForDepartment/{department_id}"
+        department_path = _department_path(department_id)
+        manifest = directory_manifests.get(department_path)
         
-        if not os.path.exists(department_path):
+        if manifest is None:
             return {
                 "department_id": department_id,
                 "path": department_path,
@@ -708,42 +808,87 @@ async def list_department_files(
                 "message": f"Директория для отдела {department_id} не существует"
             }
         
-        # Получаем список файлов
-        files = []
-        for filename in os.listdir(department_path):
-            file_path = os.path.join(department_path, filename)
-            if os.path.isfile(file_path):
-                file_size = os.path.getsize(file_path)
-                # Форматируем размер файла
-                if file_size < 1024:
-                    size_formatted = f"{file_size} Б"
-                elif file_size < 1024 * 1024:
-                    size_formatted = f"{file_size / 1024:.1f} КБ"
-                elif file_size < 1024 * 1024 * 1024:
-                    size_formatted = f"{file_size / (1024 * 1024):.1f} МБ"
-                else:
-                    size_formatted = f"{file_size / (1024 * 1024 * 1024):.1f} ГБ"
-                
-                files.append({
-                    "name": filename,
-                    "size": file_size,
-                    "size_formatted": size_formatted
-                })
+        files = [
+            {"name": file.name, "size": file.size, "size_formatted": _format_size(file.size)}
+            for file in manifest.files
+        ]
         
         return {
             "department_id": department_id,
             "path": department_path,
             "exists": True,
             "files": files,
-            "total_files": len(files),
-            "message": f"Найдено {len(files)} файлов в директории отдела {department_id}"
+            "total_files": manifest.file_count,
+            "total_size": manifest.total_size,
+            "total_size_formatted": _format_size(manifest.total_size),
+            "message": f"Найдено {manifest.file_count} файлов в директории отдела {department_id}"
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении списка файлов: {str(e)}")
 
+@router.get("/export/{department_id}.zip")
+def export_department_files(
+    department_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Выгружает файлы отдела одним ZIP-архивом, который формируется на лету.
+
+    Администратор получает все файлы отдела; пользователь — только файлы своего
+    отдела со своим уровнем доступа (как при скачивании по одному).
+    """
+    if not is_admin(current_user) and current_user.department_id != department_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав для выгрузки файлов отдела")
+
+    # Пакетные загрузки лежат в директории отдела, одиночные (upload-content) — в
+    # AllTypesOfFiles/{id}; их файлы кладутся в архив в отдельную папку, чтобы
+    # одинаковые имена из двух директорий не совпали
+    directories = [
+        ("", _department_path(department_id)),
+        ("AllTypesOfFiles/", os.path.join(UPLOAD_BASE_DIR, "ContentForDepartment", "AllTypesOfFiles", str(department_id))),
+    ]
+    manifests = [(prefix, path, directory_manifests.get(path)) for prefix, path in directories]
+    if all(manifest is None for _, _, manifest in manifests):
+        raise HTTPException(status_code=404, detail=f"Директория для отдела {department_id} не существует")
+
+    entries = [
+        (prefix + file.name, os.path.join(path, file.name))
+        for prefix, path, manifest in manifests
+        if manifest is not None
+        for file in manifest.files
+    ]
+    if not is_admin(current_user):
+        allowed = {
+            os.path.realpath(path)
+            for path in db.execute(
+                select(Content.file_path).where(
+                    Content.department_id == department_id,
+                    Content.access_level == current_user.access_id,
+                )
+            ).scalars()
+            if path
+        }
+        entries = [(name, path) for name, path in entries if os.path.realpath(path) in allowed]
+    # Соединение с БД больше не нужно: выгрузка больших отделов может идти долго
+    db.close()
+
+    if not entries:
+        raise HTTPException(status_code=404, detail=f"В директории отдела {department_id} нет доступных файлов")
+
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="department_{department_id}.zip"',
+            # nginx не буферизует архив во временный файл, а сразу передает клиенту
+            "X-Accel-Buffering": "no",
+        },
+    )
+
 @router.delete("/delete-file/{department_id}/{filename}")
-async def delete_department_file(
+def delete_department_file(
     department_id: int,
     filename: str,
     current_user: User = Depends(require_admin),
@@ -753,7 +898,7 @@ async def delete_department_file(
     """
     try:
         # Формируем путь к файлу
-        department_path = f"/app/files/ContentForDepartment/{department_id}"
+        department_path = _department_path(department_id)
         file_path = os.path.join(department_path, filename)
         
         # Проверяем, существует ли директория
@@ -766,6 +911,7 @@ async def delete_department_file(
         
         # Удаляем файл
         os.remove(file_path)
+        directory_manifests.invalidate(department_path)
         
         # Также удаляем запись из базы данных, если она существует
         from database import get_db
@@ -778,8 +924,14 @@ async def delete_department_file(
             ).first()
             
             if content:
+                content_id = content.id
+                file_hash = content.file_hash
                 db.delete(content)
                 db.commit()
+                content_metadata_cache.invalidate([department_id])
+                content_search_index.remove([content_id])
+                document_previews.remove(content_id)
+                blob_store.release(db, [file_hash])
         except Exception as db_error:
             print(f"Ошибка при удалении записи из БД: {db_error}")
         finally:
@@ -793,7 +945,7 @@ async def delete_department_file(
         raise HTTPException(status_code=500, detail=f"Ошибка при удалении файла: {str(e)}")
 
 @router.delete("/delete-all-files/{department_id}")
-async def delete_all_department_files(
+def delete_all_department_files(
     department_id: int,
     current_user: User = Depends(require_admin),
 ):
@@ -802,7 +954,7 @@ async def delete_all_department_files(
     """
     try:
         # Формируем путь к директории отдела
-        department_path = f"/app/files/ContentForDepartment/{department_id}"
+        department_path = _department_path(department_id)
         
         # Проверяем, существует ли директория
         if not os.path.exists(department_path):
@@ -826,6 +978,7 @@ async def delete_all_department_files(
                 deleted_count += 1
             except Exception as e:
                 print(f"Ошибка при удалении файла {filename}: {e}")
+        directory_manifests.invalidate(department_path)
         
         # Также удаляем записи из базы данных
         from database import get_db
@@ -833,9 +986,16 @@ async def delete_all_department_files(
         db = next(get_db())
         try:
             contents = db.query(Content).filter(Content.department_id == department_id).all()
+            content_ids = [content.id for content in contents]
+            file_hashes = [content.file_hash for content in contents]
             for content in contents:
                 db.delete(content)
             db.commit()
+            content_metadata_cache.invalidate([department_id])
+            content_search_index.remove(content_ids)
+            for content_id in content_ids:
+                document_previews.remove(content_id)
+            blob_store.release(db, file_hashes)
         except Exception as db_error:
             print(f"Ошибка при удалении записей из БД: {db_error}")
         finally:
@@ -849,14 +1009,15 @@ async def delete_all_department_files(
         raise HTTPException(status_code=500, detail=f"Ошибка при удалении файлов: {str(e)}")
 
 @router.get("/list-all-departments")
-async def list_all_departments(current_user: User = Depends(require_admin)):
+def list_all_departments(current_user: User = Depends(require_admin)):
     """
-    Возвращает список всех отделов с файлами.
+    Возвращает список всех отделов с файлами (из кэша манифестов каталогов).
     """
     try:
-        base_path = "/app/files/ContentForDepartment"
+        base_path = os.path.join(UPLOAD_BASE_DIR, "ContentForDepartment")
+        base_manifest = directory_manifests.get(base_path)
         
-        if not os.path.exists(base_path):
+        if base_manifest is None:
             return {
                 "base_path": base_path,
                 "exists": False,
@@ -865,16 +1026,17 @@ async def list_all_departments(current_user: User = Depends(require_admin)):
             }
         
         departments = []
-        for item in os.listdir(base_path):
+        for item in base_manifest.directories:
             item_path = os.path.join(base_path, item)
-            if os.path.isdir(item_path):
-                # Подсчитываем файлы в директории
-                file_count = len([f for f in os.listdir(item_path) if os.path.isfile(os.path.join(item_path, f))])
-                departments.append({
-                    "department_id": item,
-                    "file_count": file_count,
-                    "path": item_path
-                })
+            manifest = directory_manifests.get(item_path)
+            if manifest is None:
+                continue
+            departments.append({
+                "department_id": item,
+                "file_count": manifest.file_count,
+                "total_size": manifest.total_size,
+                "path": item_path
+            })
         
         return {
             "base_path": base_path,
@@ -885,4 +1047,4 @@ async def list_all_departments(current_user: User = Depends(require_admin)):
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при получении списка отделов: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении списка отделов: {str(e)}")
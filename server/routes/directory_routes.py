@@ -2,10 +2,12 @@ from fastapi import APIRouter, HTTPException
 import os
 import shutil
 
+from directory_manifest import directory_manifests
+
 router = APIRouter(prefix="/directory", tags=["directory"])
 
 @router.post("/create")
-async def create_directory(directory_path: str):
+def create_directory(directory_path: str):
     """
     Создает директорию по указанному пути.
     
@@ -26,6 +28,7 @@ async def create_directory(directory_path: str):
         # Проверяем, существует ли директория
         if not os.path.exists(full_path):
             os.makedirs(full_path)  # Создаем директорию
+            directory_manifests.invalidate(os.path.dirname(full_path.rstrip("/")))
             return {"message": f"Директория '{full_path}' успешно создана."}
         else:
             return {"message": f"Директория '{full_path}' уже существует."}
@@ -33,7 +36,7 @@ async def create_directory(directory_path: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/delete")
-async def delete_directory(directory_path: str):
+def delete_directory(directory_path: str):
     """
     Удаляет директорию по указанному пути.
     
@@ -54,6 +57,7 @@ async def delete_directory(directory_path: str):
         # Проверяем, существует ли директория
         if os.path.exists(full_path):
             shutil.rmtree(full_path)  # Удаляем директорию и её содержимое
+            directory_manifests.invalidate(full_path, os.path.dirname(full_path.rstrip("/")), refresh=False)
             return {"message": f"Директория '{full_path}' успешно удалена."}
         else:
             raise HTTPException(status_code=404, detail=f"Директория '{full_path}' не найдена.")
@@ -61,7 +65,7 @@ async def delete_directory(directory_path: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/list")
-async def list_directory(directory_path: str = "/app/files"):
+def list_directory(directory_path: str = "/app/files"):
     """
     Возвращает список файлов и директорий по указанному пути.
     
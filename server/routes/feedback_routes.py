@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form, status, Request
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form, Query, status, Request
+from fastapi.concurrency import run_in_threadpool
 import os
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from database import get_db
 from models_db import Feedback, User
 from routes.user_routes import get_current_user, require_admin, is_admin
+from pagination import PageParams, SortKey, apply_page, count_cache, finish_page, page_params, set_page_headers
+from photo_storage import DEFAULT_CONTENT_TYPE, DEFAULT_THUMBNAIL_SIZE, THUMBNAIL_SIZES, photo_storage, safe_content_type
+from file_downloads import not_modified
+from migrations.move_feedback_photos import move_legacy_photo
 from pydantic import BaseModel
 from fastapi.responses import FileResponse, Response
 from typing import List, Optional
@@ -18,6 +24,87 @@ router = APIRouter(prefix="/feedback", tags=["feedback"])
 # Получаем глобальный rate limiter
 limiter = get_limiter()
 
+# Список сообщений отдается страницами от новых к старым. Ключ — только id: он растет
+# в порядке создания и никогда не NULL (created_at допускает NULL и ломает сравнение курсора)
+FEEDBACK_SORT_KEY = SortKey((Feedback.id,), descending=True)
+
+# Файл фото под хэшем неизменен, браузер может кэшировать его надолго
+PHOTO_CACHE_CONTROL = "private, max-age=86400"
+
+
+def feedback_query():
+    """Сообщения вместе с автором одним запросом; байты фото не читаются"""
+    return select(
+        Feedback.id,
+        Feedback.user_id,
+        Feedback.text,
+        Feedback.created_at,
+        Feedback.photo_hash,
+        Feedback.photo_size,
+        Feedback.photo.isnot(None).label("has_legacy_photo"),
+        User.id.label("author_id"),
+        User.login,
+        User.full_name,
+        User.department_id,
+        User.access_id,
+    ).outerjoin(User, User.id == Feedback.user_id)
+
+
+def feedback_page_query(page: PageParams):
+    """Страница списка сообщений, новые первыми (/feedback/list)"""
+    return apply_page(feedback_query(), FEEDBACK_SORT_KEY, page)
+
+
+def _feedback_item(row, detailed: bool = False) -> dict:
+    if row.author_id is None:
+        user_info = {"id": row.user_id, "login": "Неизвестно", "full_name": "Неизвестно"}
+    else:
+        user_info = {"id": row.author_id, "login": row.login, "full_name": row.full_name}
+        if detailed:
+            user_info.update({"department_id": row.department_id, "access_id": row.access_id})
+    return {
+        "id": row.id,
+        "text": row.text,
+        "created_at": row.created_at,
+        "has_photo": row.photo_hash is not None or bool(row.has_legacy_photo),
+        "photo_size": row.photo_size,
+        "user": user_info,
+    }
+
+
+def _photo_response(request: Request, path: str, etag: str, media_type: str) -> Response:
+    """Отдает файл потоком; при совпадении If-None-Match — 304 без тела"""
+    # nosniff: браузер не угадывает тип по содержимому и не исполняет файл как HTML/SVG
+    headers = {"ETag": etag, "Cache-Control": PHOTO_CACHE_CONTROL, "X-Content-Type-Options": "nosniff"}
+    if not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def _get_photo(db: Session, feedback_id: int, current_user: User):
+    """(хэш, MIME-тип) фото сообщения с проверкой доступа (админ или автор)"""
+    row = db.query(
+        Feedback.user_id,
+        Feedback.photo_hash,
+        Feedback.photo_content_type,
+        Feedback.photo.isnot(None).label("has_legacy_photo"),
+    ).filter(Feedback.id == feedback_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Сообщение не найдено")
+    if not is_admin(current_user) and row.user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещён")
+
+    photo_hash, content_type = row.photo_hash, row.photo_content_type
+    if photo_hash is None and row.has_legacy_photo:
+        # Старая запись с blob в БД: переносим фото в хранилище при первом обращении
+        feedback = move_legacy_photo(db, feedback_id)
+        if feedback is not None:
+            photo_hash, content_type = feedback.photo_hash, feedback.photo_content_type
+    if photo_hash is None or not photo_storage.exists(photo_hash):
+        raise HTTPException(status_code=404, detail="Фото не найдено")
+    # Тип, сохраненный до проверки по содержимому, мог быть заявлен клиентом
+    return photo_hash, safe_content_type(content_type or DEFAULT_CONTENT_TYPE)
+
 class FeedbackCreate(BaseModel):
     user_id: int
     text: str
@@ -39,27 +126,32 @@ async def create_feedback(
         # Пользователь может создавать отзыв только от своего имени (или админ)
         if not (is_admin(current_user) or current_user.id == user_id):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещён")
-        # Проверяем существование пользователя
-        user = db.query(User).filter(User.id == user_id).first()
+        # Проверяем существование пользователя (запросы к БД — в пуле потоков, чтобы не блокировать event loop)
+        user = await run_in_threadpool(lambda: db.query(User).filter(User.id == user_id).first())
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
-        # Обрабатываем фото, если оно предоставлено
-        photo_data = None
-        if photo:
-            photo_data = await photo.read()
-        
         # Создаем новую запись обратной связи
         new_feedback = Feedback(
             user_id=user_id,
-            text=text,
-            photo=photo_data
+            text=text
         )
         
+        # Фото сохраняем файлом в хранилище (по частям, без чтения целиком в память), в БД — только ссылку
+        if photo:
+            photo_hash, photo_size = await run_in_threadpool(photo_storage.save, photo.file)
+            if photo_size:
+                new_feedback.photo_hash = photo_hash
+                new_feedback.photo_size = photo_size
+                new_feedback.photo_content_type = await run_in_threadpool(photo_storage.detect_content_type, photo_hash)
+        
         # Сохраняем в базу данных
-        db.add(new_feedback)
-        db.commit()
-        db.refresh(new_feedback)
+        def save_feedback():
+            db.add(new_feedback)
+            db.commit()
+            db.refresh(new_feedback)
+        await run_in_threadpool(save_feedback)
+        count_cache.invalidate("feedback")
         
         return {"message": "Сообщение обратной связи успешно создано", "feedback_id": new_feedback.id}
     
@@ -70,7 +162,9 @@ async def create_feedback(
         raise HTTPException(status_code=500, detail=f"Ошибка при создании сообщения: {str(e)}")
 
 @router.get("/list")
-async def get_feedback_list(
+def get_feedback_list(
+    response: Response,
+    page: PageParams = Depends(page_params),
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
@@ -78,75 +172,69 @@ async def get_feedback_list(
     Получает список всех сообщений обратной связи (доступно только для администраторов)
     """
     try:
-        # В реальном приложении здесь должна быть проверка прав администратора
-        # if not current_user.is_admin:
-        #     raise HTTPException(status_code=403, detail="Доступ запрещен")
-        
-        # Получаем все сообщения обратной связи
-        feedback_list = db.query(Feedback).order_by(Feedback.created_at.desc()).all()
-        
-        # Формируем ответ
-        result = []
-        for feedback in feedback_list:
-            # Получаем информацию о пользователе
-            user = db.query(User).filter(User.id == feedback.user_id).first()
-            user_info = {
-                "id": user.id,
-                "login": user.login,
-                "full_name": user.full_name
-            } if user else {"id": feedback.user_id, "login": "Неизвестно", "full_name": "Неизвестно"}
-            
-            # Добавляем информацию о сообщении
-            result.append({
-                "id": feedback.id,
-                "text": feedback.text,
-                "created_at": feedback.created_at,
-                "has_photo": feedback.photo is not None,
-                "user": user_info
-            })
+        # Страница сообщений вместе с авторами одним запросом, без чтения фото
+        rows, next_cursor = finish_page(
+            db.execute(feedback_page_query(page)).all(),
+            page,
+            lambda row: (row.id,),
+        )
+        total = count_cache.count("feedback", (), lambda: db.query(Feedback.id).count()) if page.with_total else None
+        set_page_headers(response, next_cursor, total)
         
-        return {"feedback_list": result}
+        return {"feedback_list": [_feedback_item(row) for row in rows]}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении списка сообщений: {str(e)}")
 
 @router.get("/photo/{feedback_id}")
-async def get_feedback_photo(
+def get_feedback_photo(
     feedback_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """
-    Получает фото для сообщения обратной связи по его ID
+    Получает фото для сообщения обратной связи по его ID (потоком, с ETag)
     """
     try:
-        # Доступ: админ или автор сообщения
-        if not is_admin(current_user):
-            fb = db.query(Feedback).filter(Feedback.id == feedback_id).first()
-            if not fb:
-                raise HTTPException(status_code=404, detail="Сообщение не найдено")
-            if fb.user_id != current_user.id:
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещён")
-        
-        # Находим сообщение по ID
-        feedback = db.query(Feedback).filter(Feedback.id == feedback_id).first()
-        if not feedback:
-            raise HTTPException(status_code=404, detail="Сообщение не найдено")
-        
-        # Проверяем наличие фото
-        if not feedback.photo:
-            raise HTTPException(status_code=404, detail="Фото не найдено")
-        
-        # Возвращаем фото
-        return Response(content=feedback.photo, media_type="image/jpeg")
+        photo_hash, content_type = _get_photo(db, feedback_id, current_user)
+        return _photo_response(request, photo_storage.path_for(photo_hash), f'"{photo_hash}"', content_type)
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении фото: {str(e)}")
 
+@router.get("/photo/{feedback_id}/thumbnail")
+def get_feedback_photo_thumbnail(
+    feedback_id: int,
+    request: Request,
+    size: int = Query(DEFAULT_THUMBNAIL_SIZE, description=f"Размер по большей стороне: {', '.join(map(str, THUMBNAIL_SIZES))}"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Получает JPEG-миниатюру фото (генерируется один раз и кэшируется на диске)
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Допустимые размеры миниатюры: {', '.join(map(str, THUMBNAIL_SIZES))}")
+    try:
+        photo_hash, _ = _get_photo(db, feedback_id, current_user)
+        etag = f'"{photo_hash}-{size}"'
+        if not_modified(request, etag):
+            # Миниатюра у клиента актуальна — не генерируем и не читаем файл
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": PHOTO_CACHE_CONTROL})
+        return _photo_response(request, photo_storage.thumbnail(photo_hash, size), etag, "image/jpeg")
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении миниатюры: {str(e)}")
+
 @router.get("/detail/{feedback_id}")
-async def get_feedback_detail(
+def get_feedback_detail(
     feedback_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -155,39 +243,16 @@ async def get_feedback_detail(
     Получает детальную информацию о сообщении обратной связи по его ID
     """
     try:
-        # Доступ: админ или автор сообщения
-        if not is_admin(current_user):
-            fb = db.query(Feedback).filter(Feedback.id == feedback_id).first()
-            if not fb:
-                raise HTTPException(status_code=404, detail="Сообщение не найдено")
-            if fb.user_id != current_user.id:
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещён")
-        
-        # Находим сообщение по ID
-        feedback = db.query(Feedback).filter(Feedback.id == feedback_id).first()
-        if not feedback:
+        # Сообщение вместе с автором одним запросом
+        row = db.execute(feedback_query().where(Feedback.id == feedback_id)).first()
+        if not row:
             raise HTTPException(status_code=404, detail="Сообщение не найдено")
         
-        # Получаем информацию о пользователе
-        user = db.query(User).filter(User.id == feedback.user_id).first()
-        user_info = {
-            "id": user.id,
-            "login": user.login,
-            "full_name": user.full_name,
-            "department_id": user.department_id,
-            "access_id": user.access_id
-        } if user else {"id": feedback.user_id, "login": "Неизвестно", "full_name": "Неизвестно"}
-        
-        # Формируем ответ
-        result = {
-            "id": feedback.id,
-            "text": feedback.text,
-            "created_at": feedback.created_at,
-            "has_photo": feedback.photo is not None,
-            "user": user_info
-        }
+        # Доступ: админ или автор сообщения
+        if not is_admin(current_user) and row.user_id != current_user.id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещён")
         
-        return result
+        return _feedback_item(row, detailed=True)
     
     except HTTPException:
         raise
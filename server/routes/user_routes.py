@@ -1,14 +1,19 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, status, Request
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 import secrets
-from passlib.context import CryptContext
 import os
 from datetime import datetime, timedelta
 import jwt
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from database import get_db
+from principal_cache import principal_cache
+from reference_cache import reference_cache
+from pagination import PageParams, SortKey, apply_page, count_cache, finish_page, page_params, set_page_headers
 from models_db import Access, Content, User, Department
+from passwords import PasswordHasherBusy, hash_password, verify_password
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -20,8 +25,6 @@ load_dotenv()
 
 router = APIRouter(prefix="/user", tags=["user"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Получаем глобальный rate limiter
 limiter = get_limiter()
 
@@ -42,16 +45,29 @@ except ValueError as e:
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/user/login")
 
+# Список пользователей отдается страницами по id
+USER_SORT_KEY = SortKey((User.id,))
+
+
+def password_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Сервер перегружен, повторите попытку позже",
+        headers={"Retry-After": "1"},
+    )
+
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    issued_at = datetime.utcnow()
+    expire = issued_at + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # iat входит в ключ кэша пользователей (principal_cache)
+    to_encode.update({"exp": expire, "iat": issued_at})
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
 
-async def get_current_user(
+def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db),
 ):
@@ -74,9 +90,18 @@ async def get_current_user(
     except jwt.InvalidTokenError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    # Горячий путь: пользователь из кэша, без запроса к БД
+    user_id = int(user_id)
+    issued_at = payload.get("iat")
+    user = principal_cache.get(user_id, issued_at)
+    if user is not None:
+        return user
+
+    version = principal_cache.version(user_id)
+    user = db.query(User).filter(User.id == user_id).first()
     if user is None:
         raise credentials_exception
+    principal_cache.set(user, issued_at, version)
     return user
 
 
@@ -103,12 +128,15 @@ class UserCreate(BaseModel):
 @limiter.limit("5/minute")
 async def register(request: Request, user_data: UserCreate, db: Session = Depends(get_db)):
     # Проверяем, существует ли пользователь с таким логином
-    existing_user = db.query(User).filter(User.login == user_data.login).first()
+    existing_user = await run_in_threadpool(lambda: db.query(User).filter(User.login == user_data.login).first())
     if existing_user:
         raise HTTPException(status_code=400, detail="Пользователь с таким логином уже существует")
 
-    # Хеширование пароля
-    hashed_password = pwd_context.hash(user_data.password)
+    # Хеширование пароля (в пуле bcrypt, не в общем пуле потоков)
+    try:
+        hashed_password = await hash_password(user_data.password)
+    except PasswordHasherBusy:
+        raise password_pool_busy()
     new_user = User(
         login=user_data.login,
         password=hashed_password,
@@ -118,9 +146,13 @@ async def register(request: Request, user_data: UserCreate, db: Session = Depend
         full_name=user_data.full_name
     )
 
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    def save_user():
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+
+    await run_in_threadpool(save_user)
+    count_cache.invalidate("users")
 
     return {"message": "Пользователь успешно зарегистрирован", "user_id": new_user.id}
 
@@ -135,8 +167,12 @@ def generate_auth_key() -> str:
 @router.post("/login")
 @limiter.limit("10/minute")
 async def login(request: Request, user_data: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.login == user_data.login).first()
-    if not user or not user.check_password(user_data.password):
+    user = await run_in_threadpool(lambda: db.query(User).filter(User.login == user_data.login).first())
+    try:
+        valid, new_hash = await verify_password(user_data.password, user.password if user else None)
+    except PasswordHasherBusy:
+        raise password_pool_busy()
+    if not user or not valid:
         raise HTTPException(status_code=401, detail="Неверный логин или пароль")
     
     # Генерация JWT токена
@@ -150,10 +186,16 @@ async def login(request: Request, user_data: UserLogin, db: Session = Depends(ge
         }
     )
 
-    # Для обратной совместимости можно оставить auth_key (если используется где-то ещё)
-    auth_key = generate_auth_key()
-    user.auth_key = auth_key
-    db.commit()
+    # Для обратной совместимости можно оставить auth_key (если используется где-то ещё).
+    # Ключ создается один раз, а не на каждый вход: запись в БД только при его
+    # отсутствии или при пересчете хэша пароля под новую стоимость bcrypt
+    auth_key = user.auth_key
+    if not auth_key or new_hash:
+        if not auth_key:
+            auth_key = user.auth_key = generate_auth_key()
+        if new_hash:
+            user.password = new_hash
+        await run_in_threadpool(db.commit)
 
     return {
         "access_token": access_token,
@@ -175,7 +217,7 @@ async def login(request: Request, user_data: UserLogin, db: Session = Depends(ge
 
 
 @router.get("/user/{id}")
-async def get_user(
+def get_user(
     id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -187,13 +229,10 @@ async def get_user(
     if user is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    # Получаем название отдела
-    department = db.query(Department).filter(Department.id == user.department_id).first()
-    department_name = department.department_name if department else "Неизвестный отдел"
-
-    # Получаем название доступа
-    access = db.query(Access).filter(Access.id == user.access_id).first()
-    access_name = access.access_name if access else "Неизвестный доступ"
+    # Названия отдела и доступа из кэша справочников
+    references = reference_cache.get(db)
+    department_name = references.department_name(user.department_id)
+    access_name = references.access_name(user.access_id)
 
     return {
         "login": user.login,
@@ -205,15 +244,13 @@ async def get_user(
 
 
 @router.get("/me")
-async def read_current_user(
+def read_current_user(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    department = db.query(Department).filter(Department.id == current_user.department_id).first()
-    department_name = department.department_name if department else "Неизвестный отдел"
-
-    access = db.query(Access).filter(Access.id == current_user.access_id).first()
-    access_name = access.access_name if access else "Неизвестный доступ"
+    references = reference_cache.get(db)
+    department_name = references.department_name(current_user.department_id)
+    access_name = references.access_name(current_user.access_id)
 
     return {
         "id": current_user.id,
@@ -226,8 +263,15 @@ async def read_current_user(
         "full_name": current_user.full_name,
     }
 
+def user_content_query(access_level: int, department_id: int):
+    """Контент отдела и уровня доступа пользователя (/user/user/{id}/content)"""
+    return select(Content).where(
+        Content.access_level == access_level,
+        Content.department_id == department_id
+    )
+
 @router.get("/user/{user_id}/content")
-async def get_user_content(
+def get_user_content(
     user_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -242,10 +286,7 @@ async def get_user_content(
             raise HTTPException(status_code=404, detail="Пользователь не найден")
 
         # Получаем контент из базы данных по access_level и department_id пользователя
-        contents = db.query(Content).filter(
-            Content.access_level == user.access_id,
-            Content.department_id == user.department_id
-        ).all()
+        contents = db.execute(user_content_query(user.access_id, user.department_id)).scalars().all()
 
         print(f"Access Level: {user.access_id}, Department ID: {user.department_id}")  # Отладочное сообщение
         print(f"Found contents: {len(contents)}")  # Количество найденного контента
@@ -253,15 +294,13 @@ async def get_user_content(
         if not contents:
             raise HTTPException(status_code=404, detail="Контент не найден")
 
+        # Названия отделов и уровней доступа из кэша справочников
+        references = reference_cache.get(db)
+        
         result = []
         for content in contents:
-            # Получаем название отдела
-            department = db.query(Department).filter(Department.id == content.department_id).first()
-            department_name = department.department_name if department else "Неизвестный отдел"
-            
-            # Получаем название уровня доступа
-            access = db.query(Access).filter(Access.id == content.access_level).first()
-            access_name = access.access_name if access else "Неизвестный уровень"
+            department_name = references.department_name(content.department_id)
+            access_name = references.access_name(content.access_level, "Неизвестный уровень")
             
             result.append({
                 "id": content.id,
@@ -280,22 +319,23 @@ async def get_user_content(
 
 
 @router.get("/users")
-async def get_users(
+def get_users(
+    response: Response,
+    page: PageParams = Depends(page_params),
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
     try:
-        users = db.query(User).all()  # Получаем всех пользователей из базы данных
+        # Получаем страницу пользователей из базы данных
+        users, next_cursor = finish_page(apply_page(db.query(User), USER_SORT_KEY, page).all(), page, lambda user: (user.id,))
+        total = count_cache.count("users", (), lambda: db.query(User).count()) if page.with_total else None
+        set_page_headers(response, next_cursor, total)
+        references = reference_cache.get(db)  # Названия отделов и доступов из кэша справочников
         user_list = []
         
         for user in users:
-            # Получаем название отдела
-            department = db.query(Department).filter(Department.id == user.department_id).first()
-            department_name = department.department_name if department else "Неизвестный отдел"
-
-            # Получаем название доступа
-            access = db.query(Access).filter(Access.id == user.access_id).first()
-            access_name = access.access_name if access else "Неизвестный доступ"
+            department_name = references.department_name(user.department_id)
+            access_name = references.access_name(user.access_id)
 
             user_list.append({
                 "id": user.id,
@@ -307,12 +347,14 @@ async def get_users(
             })
 
         return user_list
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении пользователей: {str(e)}")
 
 
 @router.put("/user/{user_id}")
-async def update_user(
+def update_user(
     user_id: int,
     user_data: dict,
     db: Session = Depends(get_db),
@@ -334,6 +376,7 @@ async def update_user(
         # Сохраняем изменения
         db.commit()
         db.refresh(user)
+        principal_cache.invalidate(user_id)
         
         return {"message": "Данные пользователя успешно обновлены"}
     except Exception as e:
@@ -341,7 +384,7 @@ async def update_user(
         raise HTTPException(status_code=500, detail=f"Ошибка при обновлении пользователя: {str(e)}")
 
 @router.delete("/user/{user_id}")
-async def delete_user(
+def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
@@ -355,6 +398,8 @@ async def delete_user(
         # Удаляем пользователя
         db.delete(user)
         db.commit()
+        count_cache.invalidate("users")
+        principal_cache.invalidate(user_id)
         
         return {"message": "Пользователь успешно удален"}
     except Exception as e:
@@ -373,20 +418,25 @@ async def update_password(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещён")
     try:
         # Получаем пользователя по ID
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await run_in_threadpool(lambda: db.query(User).filter(User.id == user_id).first())
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
-        # Хешируем новый пароль
-        hashed_password = pwd_context.hash(password_data["password"])
+        # Хешируем новый пароль (в пуле bcrypt)
+        hashed_password = await hash_password(password_data["password"])
         
         # Обновляем пароль пользователя
         user.password = hashed_password
         
         # Сохраняем изменения
-        db.commit()
+        await run_in_threadpool(db.commit)
+        principal_cache.invalidate(user_id)
         
         return {"message": "Пароль пользователя успешно обновлен"}
+    except HTTPException:
+        raise
+    except PasswordHasherBusy:
+        raise password_pool_busy()
     except Exception as e:
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=500, detail=f"Ошибка при обновлении пароля: {str(e)}")
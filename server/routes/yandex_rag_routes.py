@@ -6,8 +6,9 @@ import logging
 from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, status, Request
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models_db import Department, Content
 from yandex_rag_service import yandex_rag_service
 from routes.user_routes import require_admin
@@ -37,6 +38,7 @@ class RAGResponse(BaseModel):
     sources: List[Dict[str, Any]] = []
     context_used: int = 0
     department_id: int = 0
+    retrieval: Dict[str, Any] = {}
     error: Optional[str] = None
 
 class InitializeResponse(BaseModel):
@@ -50,7 +52,7 @@ class InitializeResponse(BaseModel):
 async def initialize_rag_for_department(
     request: InitializeRAGRequest, 
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(require_admin),
 ):
     """
@@ -59,12 +61,14 @@ async def initialize_rag_for_department(
     """
     try:
         # Проверяем существование отдела
-        department = db.query(Department).filter(Department.id == request.department_id).first()
+        department = await db.get(Department, request.department_id)
         if not department:
             raise HTTPException(status_code=404, detail=f"Отдел с ID {request.department_id} не найден")
         
         # Проверяем наличие документов для отдела
-        content_count = db.query(Content).filter(Content.department_id == request.department_id).count()
+        content_count = await db.scalar(
+            select(func.count(Content.id)).where(Content.department_id == request.department_id)
+        )
         if content_count == 0:
             return InitializeResponse(
                 success=False,
@@ -116,16 +120,18 @@ async def _initialize_rag_background(department_id: int, force_reload: bool):
 async def query_rag(
     req: Request,
     request: RAGQueryRequest, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Выполняет RAG запрос для получения ответа на основе документов отдела
     """
     try:
         # Проверяем существование отдела
-        department = db.query(Department).filter(Department.id == request.department_id).first()
+        department = await db.get(Department, request.department_id)
         if not department:
             raise HTTPException(status_code=404, detail=f"Отдел с ID {request.department_id} не найден")
+        # Возвращаем соединение в пул: на время генерации ответа оно не нужно
+        await db.close()
         
         # Выполняем RAG запрос
         result = await yandex_rag_service.query_rag(
@@ -138,7 +144,8 @@ async def query_rag(
             answer=result.get("answer", ""),
             sources=result.get("sources", []),
             context_used=result.get("context_used", 0),
-            department_id=request.department_id
+            department_id=request.department_id,
+            retrieval=result.get("retrieval", {})
         )
         
     except HTTPException:
@@ -155,13 +162,13 @@ async def query_rag(
         )
 
 @router.get("/status/{department_id}")
-async def get_rag_status(department_id: int, db: Session = Depends(get_db)):
+async def get_rag_status(department_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Проверяет статус RAG системы для отдела
     """
     try:
         # Проверяем существование отдела
-        department = db.query(Department).filter(Department.id == department_id).first()
+        department = await db.get(Department, department_id)
         if not department:
             raise HTTPException(status_code=404, detail=f"Отдел с ID {department_id} не найден")
         
@@ -176,10 +183,32 @@ async def get_rag_status(department_id: int, db: Session = Depends(get_db)):
         logger.error(f"Ошибка при проверке статуса RAG: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при проверке статуса RAG: {str(e)}")
 
+@router.get("/index-stats/{department_id}")
+async def get_rag_index_stats(
+    department_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(require_admin),
+):
+    """
+    Статистика векторного индекса отдела (объем памяти, квантование, recall@5)
+    """
+    try:
+        department = await db.get(Department, department_id)
+        if not department:
+            raise HTTPException(status_code=404, detail=f"Отдел с ID {department_id} не найден")
+        
+        return await yandex_rag_service.get_index_stats(department_id)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики индекса: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении статистики индекса: {str(e)}")
+
 @router.delete("/reset/{department_id}")
 async def reset_rag_for_department(
     department_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(require_admin),
 ):
     """
@@ -187,7 +216,7 @@ async def reset_rag_for_department(
     """
     try:
         # Проверяем существование отдела
-        department = db.query(Department).filter(Department.id == department_id).first()
+        department = await db.get(Department, department_id)
         if not department:
             raise HTTPException(status_code=404, detail=f"Отдел с ID {department_id} не найден")
         
@@ -214,16 +243,17 @@ async def search_documents(
     department_id: int, 
     query: str, 
     k: int = 5,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Выполняет поиск похожих документов без генерации ответа
     """
     try:
         # Проверяем существование отдела
-        department = db.query(Department).filter(Department.id == department_id).first()
+        department = await db.get(Department, department_id)
         if not department:
             raise HTTPException(status_code=404, detail=f"Отдел с ID {department_id} не найден")
+        await db.close()
         
         # Выполняем RAG запрос для получения источников
         result = await yandex_rag_service.query_rag(department_id, query)
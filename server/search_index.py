@@ -0,0 +1,514 @@
+"""
+Полнотекстовый индекс документов (названия, описания, имена файлов) для поиска
+"""
+
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models_db import Content
+
+logger = logging.getLogger(__name__)
+
+# Вес совпадения в поле документа
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "file_name": 2.0,
+    "description": 1.0,
+}
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Совпадение по префиксу ("отпуск" -> "отпуска") весит меньше точного
+PREFIX_MATCH_WEIGHT = 0.6
+MIN_PREFIX_LENGTH = 2
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Разбивает текст на токены в нижнем регистре (ё -> е)"""
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+def bm25_idf(documents_count: int, df: int) -> float:
+    return math.log(1.0 + (documents_count - df + 0.5) / (df + 0.5))
+
+
+@dataclass(frozen=True)
+class IndexedDocument:
+    id: int
+    title: str
+    description: Optional[str]
+    file_path: Optional[str]
+    access_level: int
+    department_id: int
+    tag_id: Optional[int]
+
+    @property
+    def file_name(self) -> str:
+        return os.path.basename(self.file_path) if self.file_path else ""
+
+    def term_weights(self) -> Dict[str, float]:
+        """Взвешенная частота терминов документа по всем полям"""
+        weights: Dict[str, float] = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for token in tokenize(getattr(self, field)):
+                weights[token] = weights.get(token, 0.0) + field_weight
+        return weights
+
+
+def _prefix_range(terms: List[str], prefix: str) -> Tuple[int, int]:
+    """Диапазон отсортированного словаря с терминами, начинающимися с prefix"""
+    return bisect_left(terms, prefix), bisect_left(terms, prefix + "\U0010ffff")
+
+
+class _Segment:
+    """
+    Неизменяемый сегмент индекса в массивах numpy.
+
+    Для каждого термина хранится непрерывный диапазон постингов: номера строк документов
+    и заранее посчитанный вклад BM25. Запрос сводится к векторным операциям над
+    постингами найденных терминов — без циклов Python по документам. Удаленные и
+    обновленные документы помечаются в маске alive до следующего перестроения.
+    """
+
+    def __init__(self, documents: List[Tuple[IndexedDocument, Dict[str, float]]]):
+        self.doc_ids = np.array([document.id for document, _ in documents], dtype=np.int64)
+        self.rows = {int(doc_id): row for row, doc_id in enumerate(self.doc_ids)}
+        self.alive = np.ones(len(documents), dtype=bool)
+
+        lengths = np.array([sum(weights.values()) for _, weights in documents], dtype=np.float32)
+        average_length = float(lengths.mean()) if len(documents) else 1.0
+        norms = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / (average_length or 1.0))
+
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for row, (_, weights) in enumerate(documents):
+            for term, tf in weights.items():
+                postings.setdefault(term, []).append((row, tf))
+
+        self.terms = sorted(postings)
+        self.term_df = np.array([len(postings[term]) for term in self.terms], dtype=np.int32)
+        self.ranges: Dict[str, Tuple[int, int]] = {}
+        total = sum(len(entries) for entries in postings.values())
+        self.post_rows = np.empty(total, dtype=np.int32)
+        self.post_scores = np.empty(total, dtype=np.float32)
+        position = 0
+        for term in self.terms:
+            entries = postings[term]
+            rows = np.fromiter((row for row, _ in entries), dtype=np.int32, count=len(entries))
+            tfs = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = bm25_idf(len(documents), len(entries))
+            end = position + len(entries)
+            self.post_rows[position:end] = rows
+            self.post_scores[position:end] = idf * tfs * (BM25_K1 + 1.0) / (tfs + norms[rows])
+            self.ranges[term] = (position, end)
+            position = end
+
+    @property
+    def size(self) -> int:
+        return int(self.doc_ids.size)
+
+    def df(self, term: str) -> int:
+        start, end = self.ranges.get(term, (0, 0))
+        return end - start
+
+    def prefix_terms(self, prefix: str, max_terms: int) -> List[str]:
+        """Самые частые термины (не более max_terms), начинающиеся с prefix"""
+        start, end = _prefix_range(self.terms, prefix)
+        if end - start <= max_terms:
+            return self.terms[start:end]
+        best = np.argpartition(-self.term_df[start:end], max_terms - 1)[:max_terms]
+        return [self.terms[start + i] for i in best.tolist()]
+
+    def kill(self, doc_id: int) -> None:
+        row = self.rows.get(doc_id)
+        if row is not None:
+            self.alive[row] = False
+
+    def alive_ids(self) -> np.ndarray:
+        return self.doc_ids[self.alive]
+
+    def _token_scores(self, terms: List[Tuple[str, float]], candidates: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Оценки токена для строк candidates (или для всех строк, если None).
+
+        Короткий список кандидатов ищется в постингах бинарным поиском (строки в
+        постингах отсортированы), чтобы не обходить постинги частых терминов целиком.
+        """
+        dense = None
+        sparse = np.zeros(len(candidates), dtype=np.float32) if candidates is not None else None
+        for term, match_weight in terms:
+            start, end = self.ranges.get(term, (0, 0))
+            if start == end:
+                continue
+            rows = self.post_rows[start:end]
+            if candidates is not None and len(candidates) * 16 < end - start:
+                positions = np.minimum(np.searchsorted(rows, candidates), end - start - 1)
+                hits = rows[positions] == candidates
+                sparse[hits] += match_weight * self.post_scores[start:end][positions[hits]]
+                continue
+            if dense is None:
+                dense = np.zeros(self.size, dtype=np.float32)
+            # Строки в постингах одного термина уникальны, поэтому += без np.add.at
+            dense[rows] += match_weight * self.post_scores[start:end]
+        if candidates is None:
+            return dense if dense is not None else np.zeros(self.size, dtype=np.float32)
+        if dense is not None:
+            sparse += dense[candidates]
+        return sparse
+
+    def search(self, expansions: List[List[Tuple[str, float]]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(id документов, оценки) живых документов, совпавших со всеми токенами"""
+        # Начинаем с самого редкого токена: следующие проверяются только на его кандидатах
+        expansions = sorted(expansions, key=lambda terms: sum(self.df(term) for term, _ in terms))
+        first = self._token_scores(expansions[0], None)
+        rows = np.flatnonzero((first > 0) & self.alive)
+        scores = first[rows]
+        for terms in expansions[1:]:
+            if not rows.size:
+                break
+            token_scores = self._token_scores(terms, rows)
+            matched = token_scores > 0
+            rows = rows[matched]
+            scores = scores[matched] + token_scores[matched]
+        return self.doc_ids[rows], scores
+
+
+class _DeltaSegment:
+    """Изменяемый сегмент для документов, добавленных после построения основного"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.terms: List[str] = []
+        self.doc_lengths: Dict[int, float] = {}
+        self.total_length = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.doc_lengths)
+
+    def df(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def add(self, doc_id: int, weights: Dict[str, float]) -> None:
+        for term, weight in weights.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                self.terms.insert(bisect_left(self.terms, term), term)
+            postings[doc_id] = weight
+        length = sum(weights.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def prefix_terms(self, prefix: str, max_terms: int) -> List[str]:
+        start, end = _prefix_range(self.terms, prefix)
+        terms = [term for term in self.terms[start:end] if self.postings[term]]
+        if len(terms) > max_terms:
+            terms = heapq.nlargest(max_terms, terms, key=self.df)
+        return terms
+
+    def remove(self, doc_id: int, weights: Dict[str, float]) -> None:
+        if doc_id not in self.doc_lengths:
+            return
+        for term in weights:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, expansions: List[List[Tuple[str, float]]], documents_count: int, df) -> Dict[int, float]:
+        """BM25-оценки документов сегмента; idf считается по всей партиции (df, documents_count)"""
+        if not self.doc_lengths:
+            return {}
+        average_length = self.total_length / len(self.doc_lengths) or 1.0
+        scores: Optional[Dict[int, float]] = None
+        for terms in expansions:
+            token_scores: Dict[int, float] = {}
+            for term, match_weight in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = bm25_idf(documents_count, df(term))
+                for doc_id, tf in postings.items():
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths[doc_id] / average_length)
+                    token_scores[doc_id] = token_scores.get(doc_id, 0.0) + match_weight * idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+            scores = token_scores if scores is None else {
+                doc_id: scores[doc_id] + score for doc_id, score in token_scores.items()
+            }
+            if not scores:
+                break
+        return scores or {}
+
+
+class _Partition:
+    """Документы одного (отдел, уровень доступа): основной сегмент + дельта"""
+
+    def __init__(self, base: _Segment):
+        self.base = base
+        self.delta = _DeltaSegment()
+
+    def df(self, term: str) -> int:
+        return self.base.df(term) + self.delta.df(term)
+
+    def expand(self, token: str, max_terms: int) -> List[Tuple[str, float]]:
+        """
+        Термины партиции для токена запроса: точное совпадение (вес 1) и продолжения
+        префикса (вес PREFIX_MATCH_WEIGHT, для коротких префиксов — самые частые)
+        """
+        expanded = {token: 1.0} if self.df(token) else {}
+        if len(token) < MIN_PREFIX_LENGTH:
+            return list(expanded.items())
+        segments = (self.base, self.delta) if self.delta.size else (self.base,)
+        for segment in segments:
+            for term in segment.prefix_terms(token, max_terms):
+                expanded.setdefault(term, PREFIX_MATCH_WEIGHT)
+        return list(expanded.items())
+
+    def alive_ids(self) -> List[int]:
+        return sorted(self.base.alive_ids().tolist() + list(self.delta.doc_lengths))
+
+    def search(self, tokens: List[str], max_prefix_terms: int) -> Tuple[np.ndarray, np.ndarray]:
+        expansions = []
+        for token in dict.fromkeys(tokens):
+            terms = self.expand(token, max_prefix_terms)
+            if not terms:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            expansions.append(terms)
+
+        ids, scores = self.base.search(expansions)
+        delta_scores = self.delta.search(expansions, self.base.size + self.delta.size, self.df)
+        if delta_scores:
+            ids = np.concatenate([ids, np.fromiter(delta_scores.keys(), dtype=np.int64, count=len(delta_scores))])
+            scores = np.concatenate([scores, np.fromiter(delta_scores.values(), dtype=np.float32, count=len(delta_scores))])
+        return ids, scores
+
+
+class ContentSearchIndex:
+    """
+    Процессный полнотекстовый индекс контента, разбитый по (отдел, уровень доступа).
+
+    Строится одним запросом в фоне при старте приложения (warm_up); поиск, пришедший до
+    окончания построения, ждет его, а не строит индекс повторно. Изменения контента приходят через хуки
+    upsert()/remove(): обновленные документы помечаются удаленными в основном сегменте
+    и попадают в небольшую дельту. Когда дельта вырастает или истекает ttl_seconds
+    (изменения других воркеров и правки БД в обход API), индекс перестраивается в фоне;
+    изменения, пришедшие во время перестроения, применяются к новому индексу.
+    """
+
+    def __init__(self, ttl_seconds: float = 600.0, max_prefix_terms: int = 64, max_delta_documents: int = 2000):
+        self.ttl_seconds = ttl_seconds
+        self.max_prefix_terms = max_prefix_terms
+        self.max_delta_documents = max_delta_documents
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._documents: Dict[int, Tuple[IndexedDocument, Dict[str, float]]] = {}
+        self._partitions: Dict[Tuple[int, int], _Partition] = {}
+        self._delta_documents = 0
+        self._built_at: Optional[float] = None
+        self._pending: Optional[List[Tuple[str, object]]] = None
+
+    @staticmethod
+    def _document(content) -> IndexedDocument:
+        return IndexedDocument(
+            id=content.id,
+            title=content.title or "",
+            description=content.description,
+            file_path=content.file_path,
+            access_level=content.access_level,
+            department_id=content.department_id,
+            tag_id=content.tag_id,
+        )
+
+    def _load(self, documents: List[IndexedDocument]) -> None:
+        """Строит основные сегменты партиций из полного списка документов"""
+        grouped: Dict[Tuple[int, int], List[Tuple[IndexedDocument, Dict[str, float]]]] = {}
+        self._documents = {}
+        for document in documents:
+            entry = (document, document.term_weights())
+            self._documents[document.id] = entry
+            grouped.setdefault((document.department_id, document.access_level), []).append(entry)
+        self._partitions = {key: _Partition(_Segment(entries)) for key, entries in grouped.items()}
+        self._delta_documents = 0
+
+    def _apply_upsert(self, document: IndexedDocument) -> None:
+        self._apply_remove(document.id)
+        weights = document.term_weights()
+        key = (document.department_id, document.access_level)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition(_Segment([]))
+        partition.delta.add(document.id, weights)
+        self._documents[document.id] = (document, weights)
+        self._delta_documents += 1
+
+    def _apply_remove(self, content_id: int) -> None:
+        existing = self._documents.pop(content_id, None)
+        if existing is not None:
+            document, weights = existing
+            partition = self._partitions[(document.department_id, document.access_level)]
+            partition.base.kill(content_id)
+            partition.delta.remove(content_id, weights)
+
+    def upsert(self, content) -> None:
+        """Добавляет или обновляет документ (объект Content или строка с теми же полями)"""
+        document = self._document(content)
+        with self._lock:
+            if self._built_at is not None:
+                self._apply_upsert(document)
+            if self._pending is not None:
+                self._pending.append(("upsert", document))
+            compact = self._delta_documents > self.max_delta_documents
+        if compact:
+            self._start_background_rebuild()
+
+    def remove(self, content_ids: Iterable[int]) -> None:
+        with self._lock:
+            for content_id in content_ids:
+                if self._built_at is not None:
+                    self._apply_remove(content_id)
+                if self._pending is not None:
+                    self._pending.append(("remove", content_id))
+
+    def rebuild(self, db: Session) -> None:
+        """Перестраивает индекс из БД и атомарно подменяет текущий"""
+        with self._build_lock:
+            self._rebuild_locked(db)
+
+    def _rebuild_locked(self, db: Session) -> None:
+        """Перестроение; вызывающий держит _build_lock"""
+        with self._lock:
+            self._pending = []
+        try:
+            started = time.perf_counter()
+            rows = db.query(
+                Content.id,
+                Content.title,
+                Content.description,
+                Content.file_path,
+                Content.access_level,
+                Content.department_id,
+                Content.tag_id,
+            ).all()
+
+            fresh = ContentSearchIndex(self.ttl_seconds, self.max_prefix_terms, self.max_delta_documents)
+            fresh._load([self._document(row) for row in rows])
+
+            with self._lock:
+                for operation, payload in self._pending:
+                    if operation == "upsert":
+                        fresh._apply_upsert(payload)
+                    else:
+                        fresh._apply_remove(payload)
+                self._documents = fresh._documents
+                self._partitions = fresh._partitions
+                self._delta_documents = fresh._delta_documents
+                self._built_at = time.monotonic()
+            logger.info(
+                f"Поисковый индекс перестроен: {len(rows)} документов за {time.perf_counter() - started:.2f} с"
+            )
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _rebuild_in_background(self) -> None:
+        """Фоновое перестроение; _build_lock захвачен в _start_background_rebuild и освобождается здесь"""
+        try:
+            db = SessionLocal()
+            try:
+                self._rebuild_locked(db)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Ошибка перестроения поискового индекса: {e}")
+        finally:
+            self._build_lock.release()
+
+    def _start_background_rebuild(self) -> None:
+        # Захват без ожидания: если перестроение уже идет, второе не запускаем
+        if not self._build_lock.acquire(blocking=False):
+            return
+        with self._lock:
+            if self._built_at is not None:
+                # Не запускаем повторное перестроение по TTL до окончания текущего
+                self._built_at = time.monotonic()
+        try:
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+        except Exception:
+            self._build_lock.release()
+            raise
+
+    def warm_up(self) -> None:
+        """Начинает построение индекса в фоне (при старте приложения)"""
+        self._start_background_rebuild()
+
+    def ensure_built(self, db: Session) -> None:
+        """
+        Дожидается построения индекса (если его прогрев еще идет или не удался — строит сам);
+        устаревший по TTL перестраивает в фоне
+        """
+        with self._lock:
+            built_at = self._built_at
+        if built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._rebuild_locked(db)
+        elif time.monotonic() - built_at >= self.ttl_seconds:
+            self._start_background_rebuild()
+
+    def search(
+        self,
+        db: Session,
+        department_id: int,
+        access_level: int,
+        query: Optional[str],
+        limit: int = 50,
+        offset: int = 0,
+    ) -> Tuple[int, List[IndexedDocument]]:
+        """
+        Ищет документы, доступные (отдел, уровень доступа), по всем словам запроса
+        (каждое слово — точно или как начало слова).
+
+        Возвращает (всего найдено, страница документов по убыванию релевантности).
+        Без запроса возвращаются все доступные документы по возрастанию id.
+        """
+        self.ensure_built(db)
+        tokens = tokenize(query)
+        with self._lock:
+            partition = self._partitions.get((department_id, access_level))
+            if partition is None:
+                return 0, []
+            if not tokens:
+                ids = partition.alive_ids()
+                return len(ids), [self._documents[doc_id][0] for doc_id in ids[offset:offset + limit]]
+
+            ids, scores = partition.search(tokens, self.max_prefix_terms)
+            count = min(offset + limit, ids.size)
+            if count == 0:
+                return int(ids.size), []
+            # Лучшие offset + limit без полной сортировки; при равной оценке — меньший id выше
+            best = np.argpartition(-scores, count - 1)[:count] if count < ids.size else np.arange(ids.size)
+            best = best[np.lexsort((ids[best], -scores[best]))][offset:]
+            return int(ids.size), [self._documents[int(doc_id)][0] for doc_id in ids[best]]
+
+
+# Глобальный экземпляр индекса
+content_search_index = ContentSearchIndex(ttl_seconds=float(os.getenv("SEARCH_INDEX_TTL", "600")))
@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+import pytest
+
+# Окружение приложения задается до импорта его модулей
+os.environ.setdefault("JWT_SECRET", "testsecret")
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
+os.environ.setdefault("JWT_EXPIRE_MINUTES", "60")
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test_auth.db")
+
+# Файлы, которые приложение пишет на том /app/files, в тестах складываем во временный каталог
+_files_root = tempfile.mkdtemp(prefix="test-files-")
+os.environ.setdefault("FEEDBACK_PHOTO_DIR", os.path.join(_files_root, "FeedbackPhotos"))
+os.environ.setdefault("DOCUMENT_PREVIEW_DIR", os.path.join(_files_root, "Previews"))
+os.environ.setdefault("BLOB_STORE_DIR", os.path.join(_files_root, "Blobs"))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from database import Base  # noqa: E402
+
+
+@pytest.fixture()
+def engine():
+    """Отдельная БД SQLite в памяти на тест (одно соединение на все сессии и потоки)"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture()
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture()
+def db(session_factory):
+    """Сессия для наполнения БД в тесте"""
+    session = session_factory()
+    yield session
+    session.close()
+
+
+class CurrentUser:
+    """Пользователь, которого возвращает переопределенный get_current_user"""
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self.user = None
+
+    def login_as(self, user_id: int):
+        """Делает текущим пользователя из БД (отсоединенная копия, как у реального get_current_user)"""
+        from models_db import User
+
+        with self._session_factory() as session:
+            user = session.get(User, user_id)
+            session.expunge(user)
+        self.user = user
+        return user
+
+
+@pytest.fixture()
+def current_user(session_factory):
+    return CurrentUser(session_factory)
+
+
+@pytest.fixture()
+def db_client(session_factory):
+    """TestClient приложения поверх БД теста; аутентификация настоящая, по JWT"""
+    from fastapi.testclient import TestClient
+
+    from app import app
+    from database import get_db
+
+    def override_get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture()
+def client(db_client, current_user):
+    """db_client, в котором get_current_user возвращает current_user.user (переключается через current_user.login_as)"""
+    from app import app
+    from routes.user_routes import get_current_user
+
+    app.dependency_overrides[get_current_user] = lambda: current_user.user
+    try:
+        yield db_client
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
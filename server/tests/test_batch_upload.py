@@ -0,0 +1,121 @@
+import os
+
+import pytest
+from sqlalchemy import event
+
+import file_uploads
+from models_db import Access, Content, Department, User
+from routes import content_routes
+
+
+@pytest.fixture()
+def root(tmp_path, monkeypatch, db, current_user):
+    monkeypatch.setattr(content_routes, "UPLOAD_BASE_DIR", str(tmp_path))
+    db.add_all([Department(id=1, department_name="Dept 1"), Access(id=1, access_name="Level 1")])
+    db.add(User(id=1, login="admin", password="x", role_id=1, department_id=1, access_id=1))
+    db.commit()
+    current_user.login_as(1)
+    return tmp_path
+
+
+def test_batch_is_inserted_in_one_statement_with_per_file_results(client, root, session_factory, engine, monkeypatch):
+    stage_upload = file_uploads.stage_upload
+
+    async def failing_stage(upload, directory):
+        if upload.filename == "broken.txt":
+            raise OSError("диск недоступен")
+        return await stage_upload(upload, directory)
+
+    monkeypatch.setattr(content_routes, "stage_upload", failing_stage)
+
+    inserts = []
+    listener = lambda *args: inserts.append(args[2]) if args[2].startswith("INSERT INTO content") else None  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        files = [("files", (f"doc{i}.txt", f"body {i}".encode())) for i in range(5)]
+        files.insert(2, ("files", ("broken.txt", b"x")))
+        response = client.post("/content/upload-files?department_id=1&access_level=1", files=files)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    assert len(inserts) == 1
+    results = response.json()["files"]
+    assert [(r["filename"], r["status"]) for r in results] == [
+        ("doc0.txt", "ok"), ("doc1.txt", "ok"), ("broken.txt", "error"),
+        ("doc2.txt", "ok"), ("doc3.txt", "ok"), ("doc4.txt", "ok"),
+    ]
+
+    department_dir = root / "ContentForDepartment" / "1"
+    assert sorted(os.listdir(department_dir)) == [f"doc{i}.txt" for i in range(5)]
+    db = session_factory()
+    try:
+        stored = {c.id: c for c in db.query(Content).all()}
+        for result in results:
+            if result["status"] == "ok":
+                content = stored[result["content_id"]]
+                assert content.title == result["filename"]
+                assert open(content.file_path, "rb").read() == f"body {result['filename'][3]}".encode()
+    finally:
+        db.close()
+
+
+def test_failed_publish_leaves_no_row_behind(client, root, session_factory, engine, monkeypatch):
+    publish_upload = file_uploads.publish_upload
+
+    async def failing_publish(staged, destination):
+        if destination.endswith("doc1.txt"):
+            raise OSError("нет места на диске")
+        return await publish_upload(staged, destination)
+
+    monkeypatch.setattr(content_routes, "publish_upload", failing_publish)
+    files = [("files", (f"doc{i}.txt", f"body {i}".encode())) for i in range(3)]
+    response = client.post("/content/upload-files?department_id=1&access_level=1", files=files)
+
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()["files"]] == ["ok", "error", "ok"]
+    db = session_factory()
+    try:
+        assert sorted(c.title for c in db.query(Content).all()) == ["doc0.txt", "doc2.txt"]
+    finally:
+        db.close()
+    assert sorted(os.listdir(root / "ContentForDepartment" / "1")) == ["doc0.txt", "doc2.txt"]
+
+
+def test_failed_insert_restores_previous_files(client, root, session_factory, engine, monkeypatch):
+    department_dir = root / "ContentForDepartment" / "1"
+    department_dir.mkdir(parents=True)
+    (department_dir / "doc0.txt").write_bytes(b"old body")
+
+    def failing_insert(db, model, rows):
+        raise RuntimeError("БД недоступна")
+
+    monkeypatch.setattr(content_routes, "insert_rows", failing_insert)
+    files = [("files", ("doc0.txt", b"new body")), ("files", ("doc1.txt", b"body 1"))]
+    response = client.post("/content/upload-files?department_id=1&access_level=1", files=files)
+
+    assert response.status_code == 500
+    assert os.listdir(department_dir) == ["doc0.txt"]
+    assert (department_dir / "doc0.txt").read_bytes() == b"old body"
+
+
+def test_duplicate_names_in_batch_are_rejected(client, root, session_factory):
+    files = [
+        ("files", ("doc0.txt", b"first")),
+        ("files", ("doc1.txt", b"body 1")),
+        ("files", ("doc0.txt", b"second")),
+    ]
+    response = client.post("/content/upload-files?department_id=1&access_level=1", files=files)
+
+    assert response.status_code == 200
+    results = response.json()["files"]
+    assert [(r["filename"], r["status"]) for r in results] == [
+        ("doc0.txt", "ok"), ("doc1.txt", "ok"), ("doc0.txt", "error"),
+    ]
+    assert results[2]["error"] == "Файл с таким именем уже есть в пакете"
+    assert (root / "ContentForDepartment" / "1" / "doc0.txt").read_bytes() == b"first"
+    db = session_factory()
+    try:
+        assert sorted(c.title for c in db.query(Content).all()) == ["doc0.txt", "doc1.txt"]
+    finally:
+        db.close()
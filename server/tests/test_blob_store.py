@@ -0,0 +1,98 @@
+import hashlib
+import os
+
+import pytest
+
+from blob_store import blob_store
+from models_db import Access, Content, Department, User
+from routes import content_routes
+
+
+@pytest.fixture(autouse=True)
+def setup(tmp_path, monkeypatch, db, current_user):
+    monkeypatch.setattr(content_routes, "UPLOAD_BASE_DIR", str(tmp_path / "files"))
+    monkeypatch.setattr(blob_store, "root", str(tmp_path / "Blobs"))
+    db.add_all([Department(id=1, department_name="Dept 1"), Department(id=2, department_name="Dept 2")])
+    db.add(Access(id=1, access_name="Level 1"))
+    db.add(User(id=1, login="admin", password="x", role_id=1, department_id=1, access_id=1))
+    db.commit()
+    current_user.login_as(1)
+
+
+def test_identical_uploads_share_one_blob_until_last_reference_is_deleted(client, session_factory):
+    body = b"one regulation for every department"
+    content_ids = []
+    for department_id in (1, 2):
+        response = client.post(
+            f"/content/upload-files?department_id={department_id}&access_level=1",
+            files=[("files", ("rules.txt", body))],
+        )
+        assert response.status_code == 200
+        content_ids.append(response.json()["files"][0]["content_id"])
+
+    with session_factory() as db:
+        rows = db.query(Content).order_by(Content.id).all()
+        hashes = {row.file_hash for row in rows}
+        paths = [row.file_path for row in rows]
+    assert len(hashes) == 1
+    blob_path = blob_store.path_for(hashes.pop())
+    # Один блоб на диске, файлы отделов — ссылки на него с прежним содержимым
+    assert os.stat(blob_path).st_nlink == 3
+    for path in paths:
+        assert os.path.samefile(path, blob_path)
+        with open(path, "rb") as file:
+            assert file.read() == body
+
+    assert client.delete(f"/content/content/{content_ids[0]}").status_code == 200
+    assert os.path.exists(blob_path)
+    assert not os.path.exists(paths[0])
+    with open(paths[1], "rb") as file:
+        assert file.read() == body
+
+    assert client.delete(f"/content/content/{content_ids[1]}").status_code == 200
+    assert not os.path.exists(blob_path)
+
+
+def test_rejected_single_upload_leaves_no_link_or_blob(client, tmp_path, monkeypatch):
+    params = {"title": "t", "description": "d", "department_id": 1}
+    target = tmp_path / "files" / "ContentForDepartment" / "AllTypesOfFiles" / "1" / "rules.txt"
+
+    response = client.post("/content/upload-content", params={**params, "access_id": 42}, files={"file": ("rules.txt", b"x")})
+    assert response.status_code == 400
+    assert not target.exists()
+
+    def failing_save(db, content):
+        raise RuntimeError("БД недоступна")
+
+    monkeypatch.setattr(content_routes, "_save_content", failing_save)
+    response = client.post("/content/upload-content", params={**params, "access_id": 1}, files={"file": ("rules.txt", b"x")})
+    assert response.status_code == 500
+    assert not target.exists()
+    assert not os.path.exists(blob_store.path_for(hashlib.sha256(b"x").hexdigest()))
+
+
+def test_blob_released_between_store_and_link_is_recreated(client, monkeypatch):
+    body = b"uploaded while the last copy was being deleted"
+    blob_path = blob_store.path_for(hashlib.sha256(body).hexdigest())
+    link = blob_store.link
+    calls = []
+
+    def link_after_concurrent_release(sha256, destination):
+        # Параллельное удаление последней ссылки успело удалить блоб до создания ссылки
+        if not calls:
+            os.unlink(blob_path)
+        calls.append(destination)
+        return link(sha256, destination)
+
+    monkeypatch.setattr(blob_store, "link", link_after_concurrent_release)
+    response = client.post("/content/upload-files?department_id=1&access_level=1", files=[("files", ("late.txt", body))])
+    assert response.status_code == 200
+    assert response.json()["files"][0]["status"] == "ok"
+
+    path = response.json()["files"][0]["file_path"]
+    assert len(calls) == 2
+    assert os.path.samefile(path, blob_path)
+    with open(path, "rb") as file:
+        assert file.read() == body
+    # Временный файл загрузки удален
+    assert sorted(os.listdir(os.path.dirname(path))) == ["late.txt"]
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import event
+
+from app import content_by_tags_cache
+from content_cache import content_metadata_cache
+from models_db import Access, Content, Department, Tag, User
+
+
+@pytest.fixture()
+def statements(db, engine):
+    db.add_all([
+        Department(id=1, department_name="Dept 1"),
+        Access(id=1, access_name="Level 1"),
+        Tag(id=1, tag_name="tag1"),
+        Tag(id=2, tag_name="tag2"),
+        Tag(id=3, tag_name="unused"),
+    ])
+    db.add(User(id=1, login="alex", password="x", role_id=2, department_id=1, access_id=1))
+    db.add_all([
+        Content(id=1, title="A", description="", file_path="/tmp/a", access_level=1, department_id=1, tag_id=2),
+        Content(id=2, title="B", description="", file_path="/tmp/b", access_level=1, department_id=1, tag_id=1),
+        Content(id=3, title="C", description="", file_path="/tmp/c", access_level=1, department_id=1, tag_id=None),
+        Content(id=4, title="D", description="", file_path="/tmp/d", access_level=1, department_id=1, tag_id=2),
+    ])
+    db.commit()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    content_by_tags_cache.clear()
+    yield statements
+    content_by_tags_cache.clear()
+
+
+def test_by_tags_groups_in_one_query_and_caches(client, statements):
+
+    response = client.get("/user/1/content/by-tags")
+    assert response.status_code == 200
+    body = response.json()
+    assert [(tag["id"], [c["id"] for c in tag["content"]]) for tag in body["tags"]] == [(1, [2]), (2, [1, 4])]
+    assert [c["id"] for c in body["untagged_content"]] == [3]
+    # Пользователь + контент с тегами
+    assert len(statements) == 2
+
+    statements.clear()
+    assert client.get("/user/1/content/by-tags").json() == body
+    assert len(statements) == 1  # только пользователь, ответ из кэша
+
+    content_metadata_cache.invalidate([1])
+    statements.clear()
+    client.get("/user/1/content/by-tags")
+    assert len(statements) == 2
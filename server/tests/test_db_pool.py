@@ -0,0 +1,31 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test_auth.db")
+
+from database import InstrumentedQueuePool, _pool_metrics  # noqa: E402
+
+
+def test_instrumented_pool_reports_checkouts_and_timeouts():
+    engine = create_engine(
+        "sqlite://", poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            assert _pool_metrics(engine.pool)["checked_out"] == 1
+
+            # Единственное соединение занято — второе получить нельзя
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+
+        metrics = _pool_metrics(engine.pool)
+        assert metrics["checked_out"] == 0
+        assert metrics["wait"]["checkouts"] == 2
+        assert metrics["wait"]["timeouts"] == 1
+        assert metrics["wait"]["wait_max_ms"] >= 50
+    finally:
+        engine.dispose()
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import directory_manifest
+from directory_manifest import DirectoryManifestCache, directory_manifests
+from models_db import User
+from routes import content_routes
+
+
+@pytest.fixture()
+def scans(monkeypatch):
+    calls = []
+    scan_directory = directory_manifest.scan_directory
+
+    def counting_scan(path):
+        calls.append(path)
+        return scan_directory(path)
+
+    monkeypatch.setattr(directory_manifest, "scan_directory", counting_scan)
+    return calls
+
+
+def test_manifest_is_served_from_memory_until_directory_mtime_changes(tmp_path, scans):
+    (tmp_path / "a.txt").write_bytes(b"12345")
+    (tmp_path / ".upload-tmp").write_bytes(b"partial")
+    (tmp_path / "sub").mkdir()
+    cache = DirectoryManifestCache(recheck_seconds=0)
+
+    manifest = cache.get(str(tmp_path))
+    assert [(file.name, file.size) for file in manifest.files] == [("a.txt", 5)]
+    assert manifest.directories == ("sub",)
+    assert manifest.total_size == 5
+    assert cache.get(str(tmp_path)) is manifest
+    assert len(scans) == 1
+
+    (tmp_path / "b.txt").write_bytes(b"123")
+    os.utime(tmp_path, ns=(manifest.mtime_ns + 10**9, manifest.mtime_ns + 10**9))
+    manifest = cache.get(str(tmp_path))
+    assert manifest.file_count == 2 and manifest.total_size == 8
+    assert len(scans) == 2
+
+    assert cache.get(str(tmp_path / "missing")) is None
+
+
+def test_list_files_uses_manifest_and_upload_hook_refreshes_it(client, db, current_user, tmp_path, monkeypatch, scans):
+    monkeypatch.setattr(content_routes, "UPLOAD_BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(directory_manifests, "recheck_seconds", 3600)
+    department = tmp_path / "ContentForDepartment" / "7"
+    department.mkdir(parents=True)
+    (department / "one.txt").write_bytes(b"x" * 2048)
+    db.add(User(id=1, login="admin", password="x", role_id=1, department_id=1, access_id=1))
+    db.commit()
+    current_user.login_as(1)
+
+    body = client.get("/content/list-files/7").json()
+    assert body["total_files"] == 1
+    assert body["files"] == [{"name": "one.txt", "size": 2048, "size_formatted": "2.0 КБ"}]
+    for _ in range(3):
+        client.get("/content/list-files/7")
+    assert scans.count(str(department)) == 1
+
+    departments = client.get("/content/list-all-departments").json()["departments"]
+    assert departments == [
+        {"department_id": "7", "file_count": 1, "total_size": 2048, "path": str(department)}
+    ]
+
+    # Без сброса новый файл не виден до сверки mtime; загрузки и удаления сбрасывают манифест
+    (department / "two.txt").write_bytes(b"y")
+    directory_manifests.invalidate(str(department), refresh=False)
+    assert client.get("/content/list-files/7").json()["total_files"] == 2
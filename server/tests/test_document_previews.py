@@ -0,0 +1,59 @@
+import os
+
+import docx
+import pytest
+
+from document_previews import DocumentPreviews
+from models_db import Access, Content, Department, User
+from routes import content_routes
+
+
+@pytest.fixture()
+def previews(tmp_path, monkeypatch):
+    previews = DocumentPreviews(root=str(tmp_path / "previews"))
+    monkeypatch.setattr(content_routes, "document_previews", previews)
+    return previews
+
+
+@pytest.fixture()
+def path(tmp_path, db, current_user):
+    document = docx.Document()
+    document.add_heading("Введение", level=1)
+    paragraph = document.add_paragraph("Текст с ")
+    paragraph.add_run("жирным").bold = True
+    document.add_paragraph("Пункт <1>", style="List Bullet")
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text, table.cell(0, 1).text = "A", "B"
+    path = tmp_path / "doc.docx"
+    document.save(path)
+
+    db.add_all([Department(id=1, department_name="Dept 1"), Access(id=1, access_name="Level 1")])
+    db.add(User(id=1, login="alex", password="x", role_id=2, department_id=1, access_id=1))
+    db.add(Content(id=7, title="Регламент", file_path=str(path), access_level=1, department_id=1))
+    db.commit()
+    current_user.login_as(1)
+    return path
+
+
+def test_preview_is_rendered_once_and_served_from_disk(client, previews, path):
+    previews.schedule(7, str(path), "Регламент")
+    response = client.get("/content/document-viewer/7")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    page = response.text
+    assert '<h1 class="docx-heading">Введение</h1>' in page
+    assert "<strong>жирным</strong>" in page
+    assert '<li class="docx-list-item">Пункт &lt;1&gt;</li>' in page
+    assert '<td class="docx-cell">A</td>' in page
+    assert "docs.google.com" not in page
+
+    cached = previews.cached(7, str(path), "Регламент")
+    assert cached is not None
+    assert client.get("/content/document-viewer/7", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+    # Новая версия файла — новый отпечаток; старое превью удаляется
+    stat_result = os.stat(path)
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**9))
+    assert client.get("/content/document-viewer/7").status_code == 200
+    assert not os.path.exists(cached)
+    assert len(os.listdir(os.path.dirname(cached))) == 1
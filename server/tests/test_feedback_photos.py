@@ -0,0 +1,92 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+from sqlalchemy import event
+
+from models_db import Feedback, User
+from photo_storage import photo_storage
+
+
+def make_png(width: int = 800, height: int = 400) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture()
+def statements(engine, db, current_user):
+    db.add(User(id=1, login="admin", password="x", role_id=1, department_id=1, access_id=1))
+    db.add(Feedback(id=1, user_id=1, text="legacy", photo=make_png()))
+    db.commit()
+    current_user.login_as(1)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_uploaded_photo_is_stored_as_file_and_served_with_etag(client, session_factory, statements):
+    data = make_png()
+
+    response = client.post("/feedback/create", data={"user_id": 1, "text": "hi"}, files={"photo": ("a.png", data, "image/png")})
+    assert response.status_code == 200
+    feedback_id = response.json()["feedback_id"]
+
+    db = session_factory()
+    feedback = db.get(Feedback, feedback_id)
+    assert feedback.photo_size == len(data) and feedback.photo_content_type == "image/png"
+    assert db.query(Feedback.photo).filter(Feedback.id == feedback_id).scalar() is None
+    db.close()
+    with open(photo_storage.path_for(feedback.photo_hash), "rb") as f:
+        assert f.read() == data
+
+    response = client.get(f"/feedback/photo/{feedback_id}")
+    assert response.status_code == 200 and response.content == data
+    assert response.headers["content-type"] == "image/png"
+    etag = response.headers["etag"]
+    assert client.get(f"/feedback/photo/{feedback_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    thumbnail = client.get(f"/feedback/photo/{feedback_id}/thumbnail", params={"size": 128})
+    assert thumbnail.status_code == 200
+    assert Image.open(io.BytesIO(thumbnail.content)).size == (128, 64)
+    assert os.path.exists(photo_storage.thumbnail_path_for(feedback.photo_hash, 128))
+    assert client.get(f"/feedback/photo/{feedback_id}/thumbnail", params={"size": 100}).status_code == 400
+
+
+def test_list_never_reads_photo_bytes_and_legacy_blob_moves_on_access(client, session_factory, statements):
+    statements.clear()
+    body = client.get("/feedback/list").json()
+    assert body["feedback_list"][0]["has_photo"] is True
+    # Один запрос с автором; столбец photo только проверяется на NULL
+    assert len(statements) == 1
+    assert "feedback.photo IS NOT NULL" in statements[0]
+    assert "feedback.photo," not in statements[0]
+
+    response = client.get("/feedback/photo/1")
+    assert response.status_code == 200 and response.content == make_png()
+
+    db = session_factory()
+    feedback = db.get(Feedback, 1)
+    assert feedback.photo_hash is not None and feedback.photo is None
+    db.close()
+
+
+def test_unrecognized_photo_is_never_served_with_declared_type(client, session_factory, statements):
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+
+    response = client.post("/feedback/create", data={"user_id": 1, "text": "svg"}, files={"photo": ("a.svg", svg, "image/svg+xml")})
+    feedback_id = response.json()["feedback_id"]
+    db = session_factory()
+    assert db.get(Feedback, feedback_id).photo_content_type == "application/octet-stream"
+    # Запись, сохраненная раньше с типом от клиента
+    db.add(Feedback(id=99, user_id=1, text="old", photo_hash=db.get(Feedback, feedback_id).photo_hash,
+                    photo_size=len(svg), photo_content_type="image/svg+xml"))
+    db.commit()
+    db.close()
+
+    for photo_id in (feedback_id, 99):
+        response = client.get(f"/feedback/photo/{photo_id}")
+        assert response.headers["content-type"] == "application/octet-stream"
+        assert response.headers["x-content-type-options"] == "nosniff"
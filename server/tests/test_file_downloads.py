@@ -0,0 +1,44 @@
+import pytest
+
+import file_downloads
+from models_db import Access, Content, Department, User
+
+
+@pytest.fixture(autouse=True)
+def document(tmp_path, db, current_user):
+    document = tmp_path / "ContentForDepartment" / "1" / "Отчет.pdf"
+    document.parent.mkdir(parents=True)
+    document.write_bytes(b"0123456789" * 100)
+
+    db.add_all([Department(id=1, department_name="Dept 1"), Access(id=1, access_name="Level 1")])
+    db.add(User(id=1, login="alex", password="x", role_id=2, department_id=1, access_id=1))
+    db.add(Content(id=1, title="Отчет", file_path=str(document), access_level=1, department_id=1))
+    db.commit()
+    current_user.login_as(1)
+    return document
+
+
+def test_download_supports_conditional_get_and_ranges(client):
+    full = client.get("/content/download-file/1")
+    assert full.status_code == 200
+    assert len(full.content) == 1000
+    etag, last_modified = full.headers["etag"], full.headers["last-modified"]
+
+    assert client.get("/content/download-file/1", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/content/download-file/1", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    partial = client.get("/content/download-file/1", headers={"Range": "bytes=10-19", "If-Range": etag})
+    assert partial.status_code == 206
+    assert partial.content == b"0123456789"
+    assert partial.headers["content-range"] == "bytes 10-19/1000"
+
+
+def test_download_can_be_delegated_to_nginx(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_downloads, "DOWNLOAD_ACCEL_REDIRECT", True)
+    monkeypatch.setattr(file_downloads, "ACCEL_REDIRECT_ROOT", str(tmp_path))
+
+    response = client.get("/content/download-file/1")
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["x-accel-redirect"] == "/protected-files/ContentForDepartment/1/%D0%9E%D1%82%D1%87%D0%B5%D1%82.pdf"
+    assert response.headers["content-disposition"].startswith("attachment; filename*=utf-8''")
@@ -0,0 +1,46 @@
+import asyncio
+import hashlib
+import io
+import os
+import tracemalloc
+
+import pytest
+from fastapi import UploadFile
+
+import file_uploads
+from file_uploads import save_upload
+
+
+def test_upload_is_streamed_hashed_and_replaced_atomically(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_uploads, "UPLOAD_CHUNK_SIZE", 64 * 1024)
+    data = os.urandom(8 * 1024 * 1024 + 123)
+    destination = tmp_path / "dept" / "report.pdf"
+    destination.parent.mkdir()
+    destination.write_bytes(b"old version")
+
+    tracemalloc.start()
+    try:
+        stored = asyncio.run(save_upload(UploadFile(io.BytesIO(data), filename="report.pdf"), str(destination)))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert stored == (str(destination), hashlib.sha256(data).hexdigest(), len(data))
+    assert destination.read_bytes() == data
+    # Память — порядка нескольких частей, а не размера файла
+    assert peak < 1024 * 1024
+    assert os.listdir(destination.parent) == ["report.pdf"]
+
+
+def test_failed_upload_leaves_no_partial_file(tmp_path):
+    class BrokenStream(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell() > 0:
+                raise OSError("соединение разорвано")
+            return super().read(size)
+
+    destination = tmp_path / "report.pdf"
+    upload = UploadFile(BrokenStream(b"x" * (3 * 1024 * 1024)), filename="report.pdf")
+    with pytest.raises(OSError):
+        asyncio.run(save_upload(upload, str(destination)))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,90 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import app
+from database import Base, get_async_db
+from models_db import Feedback, User
+from pagination import count_cache
+
+
+@pytest.fixture(autouse=True)
+def setup(db, current_user):
+    # Первый пользователь — администратор, он и смотрит списки
+    db.add_all([
+        User(id=i, login=f"user{i}", password="x", role_id=1 if i == 1 else 2, department_id=1, access_id=1)
+        for i in range(1, 8)
+    ])
+    created_at = datetime.datetime(2024, 1, 1)
+    # Два сообщения с одинаковой датой: порядок на границе страниц решает id
+    db.add_all([
+        Feedback(id=i, user_id=1, text=f"text {i}", created_at=created_at + datetime.timedelta(minutes=min(i, 3)))
+        for i in range(1, 5)
+    ])
+    db.commit()
+    current_user.login_as(1)
+    count_cache.invalidate("users")
+    count_cache.invalidate("feedback")
+
+
+def test_users_are_paged_by_cursor_with_cached_total(client, db):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 3, "with_total": True}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/user/users", params=params)
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "7"
+        ids += [user["id"] for user in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert ids == list(range(1, 8))
+
+    # Счетчик берется из кэша, пока пользователи не меняются через API
+    db.add(User(id=8, login="user8", password="x", role_id=2, department_id=1, access_id=1))
+    db.commit()
+    assert client.get("/user/users", params={"with_total": True}).headers["X-Total-Count"] == "7"
+    count_cache.invalidate("users")
+    assert client.get("/user/users", params={"with_total": True}).headers["X-Total-Count"] == "8"
+
+    assert client.get("/user/users", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_feedback_pages_newest_first_across_equal_and_missing_dates(client, db):
+    db.add(Feedback(id=5, user_id=1, text="без даты", created_at=None))
+    db.commit()
+
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/feedback/list", params=params)
+        ids += [f["id"] for f in response.json()["feedback_list"]]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert ids == [5, 4, 3, 2, 1]
+
+
+def test_content_filter_returns_empty_page_instead_of_404(client, tmp_path):
+    url = f"sqlite:///{tmp_path / 'filter.db'}"
+    Base.metadata.create_all(bind=create_engine(url))
+    async_session = async_sessionmaker(create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"), poolclass=NullPool))
+
+    async def override_get_async_db():
+        async with async_session() as session:
+            yield session
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    try:
+        response = client.get("/content/content/filter", params={"access_level": 1, "department_id": 1})
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+    assert response.status_code == 200
+    assert response.json() == []
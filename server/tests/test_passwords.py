@@ -0,0 +1,33 @@
+import pytest
+from passlib.context import CryptContext
+
+from models_db import User
+from passwords import BCRYPT_ROUNDS
+
+
+@pytest.fixture(autouse=True)
+def user(db):
+    # Хэш со стоимостью, отличной от текущей BCRYPT_ROUNDS
+    old_rounds = 4 if BCRYPT_ROUNDS != 4 else 5
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=old_rounds).hash("alexpass")
+    db.add(User(id=1, login="alex", password=old_hash, role_id=2, department_id=1, access_id=1))
+    db.commit()
+
+
+def test_login_rehashes_with_current_cost_and_keeps_auth_key(db_client, session_factory):
+    assert db_client.post("/user/login", json={"login": "alex", "password": "wrong"}).status_code == 401
+
+    first = db_client.post("/user/login", json={"login": "alex", "password": "alexpass"})
+    assert first.status_code == 200
+    db = session_factory()
+    try:
+        user = db.get(User, 1)
+        assert user.password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+        assert user.auth_key == first.json()["auth_key"]
+    finally:
+        db.close()
+
+    # Повторный вход не меняет ни хэш, ни auth_key
+    second = db_client.post("/user/login", json={"login": "alex", "password": "alexpass"})
+    assert second.status_code == 200
+    assert second.json()["auth_key"] == first.json()["auth_key"]
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import event
+
+from models_db import Department, User
+from principal_cache import principal_cache
+from routes.user_routes import create_access_token
+
+
+@pytest.fixture(autouse=True)
+def users(db):
+    db.add_all([Department(id=1, department_name="Dept 1"), Department(id=2, department_name="Dept 2")])
+    db.add_all([
+        User(id=1, login="admin", password="x", role_id=1, department_id=1, access_id=1),
+        User(id=2, login="alex", password="x", role_id=2, department_id=1, access_id=1, full_name="Alex"),
+    ])
+    db.commit()
+    principal_cache.clear()
+    yield
+    principal_cache.clear()
+
+
+def test_principal_is_cached_and_invalidated_on_user_changes(db_client, engine):
+    admin = {"Authorization": f"Bearer {create_access_token({'sub': '1'})}"}
+    alex = {"Authorization": f"Bearer {create_access_token({'sub': '2'})}"}
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert db_client.get("/user/me", headers=alex).json()["department_id"] == 1
+        user_lookups = len([s for s in statements if "FROM user" in s])
+        assert user_lookups == 1
+        me = db_client.get("/user/me", headers=alex).json()
+        assert len([s for s in statements if "FROM user" in s]) == user_lookups
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert (me["login"], me["full_name"], me["role_id"]) == ("alex", "Alex", 2)
+
+    # Изменение отдела видно сразу, без ожидания TTL
+    assert db_client.put("/user/user/2", json={"department_id": 2}, headers=admin).status_code == 200
+    assert db_client.get("/user/me", headers=alex).json()["department_id"] == 2
+
+    # Удаленный пользователь больше не проходит аутентификацию
+    assert db_client.delete("/user/user/2", headers=admin).status_code == 200
+    assert db_client.get("/user/me", headers=alex).status_code == 401
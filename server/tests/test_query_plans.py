@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import text
+
+from migrations.check_query_plans import QUERIES, _explain_full_scans, check_query_plans
+
+
+@pytest.fixture()
+def connection(engine):
+    with engine.connect() as connection:
+        yield connection
+
+
+def test_hot_queries_use_composite_indexes(connection):
+    assert check_query_plans(connection, min_rows=0) == []
+
+
+def test_full_scan_is_reported_only_for_large_tables(connection):
+    connection.execute(text("DROP INDEX idx_content_department_access_tag"))
+
+    issues = check_query_plans(connection, min_rows=0)
+    assert issues and {issue.table for issue in issues} == {"content"}
+    # Маленькие таблицы не считаются ошибкой
+    assert check_query_plans(connection, min_rows=1) == []
+
+
+def test_full_index_scan_is_reported(connection):
+    # Без индекса по quiz_id вопросы теста ищутся обходом всего индекса по id
+    connection.execute(text("DROP INDEX idx_questions_quiz"))
+
+    issues = check_query_plans(connection, min_rows=0)
+    assert {issue.table for issue in issues} == {"questions"}
+    assert any("USING INDEX" in issue.plan for issue in issues)
+
+
+def test_checked_content_list_is_the_keyset_page_query():
+    sql = str(QUERIES["Весь контент (/content/all)"].compile(compile_kwargs={"literal_binds": True}))
+    assert "WHERE content.id > 1" in sql and "ORDER BY content.id ASC" in sql and "LIMIT" in sql
+
+
+class _MySQLExplain:
+    """Соединение, отдающее заранее заданный результат EXPLAIN MySQL"""
+
+    class dialect:
+        name = "mysql"
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def execute(self, statement):
+        rows = self._rows
+
+        class Result:
+            def mappings(self):
+                return rows
+
+        return Result()
+
+
+def test_mysql_full_table_and_full_index_scans_are_reported():
+    rows = [
+        {"table": "content", "type": "range"},
+        {"table": "questions", "type": "index"},
+        {"table": "feedback", "type": "ALL"},
+        {"table": "quizzes", "type": "const"},
+    ]
+    assert [table for table, _ in _explain_full_scans(_MySQLExplain(rows), "SELECT 1")] == ["questions", "feedback"]
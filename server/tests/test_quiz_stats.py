@@ -0,0 +1,108 @@
+import pytest
+from sqlalchemy import event
+
+from models_db import Question, Quiz, User, UserAnswer, UserQuizAttempt
+from quiz_stats import read_quiz_stats, rebuild_quiz_stats, record_attempt
+
+
+@pytest.fixture(autouse=True)
+def quiz(db, current_user):
+    db.add_all([User(id=i, login=f"user{i}", password="x", role_id=1, department_id=1, access_id=1) for i in (1, 2)])
+    db.add(Quiz(id=1, title="Тест", is_test=True))
+    db.add_all([
+        Question(id=1, quiz_id=1, text="Q1", question_type="single_choice", correct_answer=1, order=0),
+        Question(id=2, quiz_id=1, text="Q2", question_type="text", correct_answer="Да", order=1),
+        Question(id=3, quiz_id=1, text="Q3", question_type="single_choice", correct_answer=2, order=2),
+    ])
+    db.commit()
+    current_user.login_as(1)
+
+
+def test_rollups_match_rebuild_and_are_read_in_one_query(client, session_factory, engine):
+    submissions = [
+        (1, [(1, 1), (2, "да")]),
+        (1, [(1, 2), (2, "нет"), (3, 2)]),
+        (2, [(1, 1), (3, 1)]),
+    ]
+    for user_id, answers in submissions:
+        response = client.post(f"/quiz/attempt?user_id={user_id}", json={
+            "quiz_id": 1,
+            "answers": [{"question_id": question_id, "answer": answer} for question_id, answer in answers],
+        })
+        assert response.status_code == 201
+        # Ответ собирается без повторного чтения: id и оценки должны совпадать с сохраненными
+        returned = {a["id"]: (a["question_id"], a["is_correct"]) for a in response.json()["answers"]}
+        db = session_factory()
+        try:
+            stored = db.query(UserAnswer).filter(UserAnswer.attempt_id == response.json()["id"]).all()
+            assert returned == {a.id: (a.question_id, a.is_correct) for a in stored}
+        finally:
+            db.close()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        stats = client.get("/quiz/stats/1").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+
+    assert stats["attempts_count"] == 3
+    assert stats["unique_users_count"] == 2
+    assert stats["avg_score"] == pytest.approx(4 / 3)
+    assert [(q["question_id"], q["correct_answers"], q["total_answers"]) for q in stats["question_stats"]] == [
+        (1, 2, 3), (2, 1, 2), (3, 1, 2),
+    ]
+
+    # Пересчет из исходных данных дает те же значения, что и инкрементальные счетчики
+    db = session_factory()
+    try:
+        rebuild_quiz_stats(db)
+        assert read_quiz_stats(db, 1) == stats
+    finally:
+        db.close()
+
+    assert client.delete("/quiz/1").status_code == 204
+    assert client.get("/quiz/stats/1").status_code == 404
+
+
+def test_rollups_fall_back_to_update_then_insert_without_upsert(db, engine, monkeypatch):
+    # СУБД без поддержки UPSERT в SQLAlchemy
+    monkeypatch.setattr(engine.dialect, "name", "oracle")
+    answers = [{"question_id": 1, "is_correct": True}, {"question_id": 2, "is_correct": False}]
+    record_attempt(db, 1, 1, 1, answers)
+    record_attempt(db, 1, 1, 0, answers[:1])
+    db.commit()
+
+    stats = read_quiz_stats(db, 1)
+    assert (stats["attempts_count"], stats["unique_users_count"], stats["avg_score"]) == (2, 1, 0.5)
+    assert [(q["question_id"], q["correct_answers"], q["total_answers"]) for q in stats["question_stats"]] == [
+        (1, 2, 2), (2, 0, 1), (3, 0, 0),
+    ]
+
+
+def test_answer_ids_without_returning(client, session_factory, engine, monkeypatch):
+    # MySQL: без RETURNING ответы вставляются по одной строке, id берутся у каждой вставки
+    monkeypatch.setattr(engine.dialect, "insert_returning", False)
+    db = session_factory()
+    try:
+        # Ответы другой попытки с большими id не должны попасть в результат
+        db.add(UserQuizAttempt(id=7, user_id=2, quiz_id=1))
+        db.add_all([UserAnswer(id=100 + i, attempt_id=7, question_id=1, answer=1) for i in range(3)])
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.post("/quiz/attempt?user_id=1", json={
+        "quiz_id": 1,
+        "answers": [{"question_id": 3, "answer": 2}, {"question_id": 1, "answer": 1}],
+    })
+    assert response.status_code == 201
+    returned = {a["id"]: a["question_id"] for a in response.json()["answers"]}
+    db = session_factory()
+    try:
+        stored = db.query(UserAnswer).filter(UserAnswer.attempt_id == response.json()["id"]).all()
+        assert returned == {a.id: a.question_id for a in stored}
+    finally:
+        db.close()
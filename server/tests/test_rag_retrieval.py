@@ -0,0 +1,173 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from models_db import Department, Access, Content, DocumentChunk, RAGSession
+from rag_index import mmr_select, normalize_rows, rag_index_cache, reciprocal_rank_fusion, top_n
+from yandex_rag_service import YandexRAGService
+
+
+@pytest.fixture(autouse=True)
+def fresh_index_cache():
+    # Сессии тестов совпадают по ключу версии, поэтому индекс отдела из другого теста не используем
+    rag_index_cache.invalidate()
+    yield
+    rag_index_cache.invalidate()
+
+
+def _seed_department(db, vectors_by_document):
+    db.add_all([Department(id=1, department_name="Dept 1"), Access(id=1, access_name="Level 1")])
+    db.flush()
+    for doc_number, vectors in enumerate(vectors_by_document, start=1):
+        content = Content(
+            id=doc_number,
+            title=f"Doc {doc_number}",
+            file_path=f"/tmp/doc{doc_number}.txt",
+            access_level=1,
+            department_id=1,
+        )
+        db.add(content)
+        db.flush()
+        for chunk_index, vector in enumerate(vectors):
+            db.add(DocumentChunk(
+                content_id=content.id,
+                department_id=1,
+                chunk_text=f"doc {doc_number} chunk {chunk_index}",
+                chunk_index=chunk_index,
+                embedding_vector=list(vector),
+            ))
+    rag_session = RAGSession(department_id=1, is_initialized=True, last_updated=datetime.datetime(2024, 1, 1))
+    db.add(rag_session)
+    db.commit()
+    return rag_session
+
+
+def test_top_n_returns_descending_order():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+    assert top_n(scores, 3).tolist() == [1, 3, 2]
+    assert top_n(scores, 10).tolist() == [1, 3, 2, 0]
+
+
+def test_mmr_prefers_diverse_candidates():
+    vectors = normalize_rows(np.array([
+        [1.0, 0.0, 0.0],
+        [0.99, 0.1, 0.0],   # почти дубликат первого
+        [0.6, 0.0, 0.8],    # менее релевантный, но другой
+    ], dtype=np.float32))
+    relevance = np.array([0.95, 0.94, 0.80], dtype=np.float32)
+
+    assert mmr_select(vectors, relevance, 2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select(vectors, relevance, 2, lambda_mult=0.5) == [0, 2]
+
+
+def test_retrieve_chunks_skips_overlapping_neighbours(db):
+    # Документ 1: три соседних почти одинаковых окна; документ 2: другая формулировка того же
+    doc1 = [[1.0, 0.05 * i, 0.0] for i in range(3)]
+    doc2 = [[0.6, 0.0, 0.8]]
+    rag_session = _seed_department(db, [doc1, doc2])
+
+    service = YandexRAGService()
+    service.top_k = 2
+    service.mmr_lambda = 0.5
+
+    top_chunks, stats = service._retrieve_chunks(db, 1, rag_session, [[1.0, 0.0, 0.2]])
+
+    assert [chunk.content_id for chunk, _ in top_chunks] == [1, 2]
+    assert stats["chunks_scored"] == 4
+    assert stats["prompt_tokens_saved"] > 0
+
+
+def test_two_stage_search_scores_only_top_documents(db):
+    doc1 = [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]]
+    doc2 = [[0.0, 1.0, 0.0], [0.0, 0.9, 0.1]]
+    doc3 = [[0.0, 0.0, 1.0]]
+    _seed_department(db, [doc1, doc2, doc3])
+
+    from rag_index import DepartmentIndex
+    index = DepartmentIndex.load(db, 1, version_key=())
+    query = normalize_rows(np.array([[0.1, 1.0, 0.0]], dtype=np.float32))[0]
+
+    rows, scores = index.search(query, top_documents=1)
+    assert set(index.content_ids[rows].tolist()) == {2}
+
+    flat_rows, flat_scores = index.search(query)
+    assert flat_rows.size == index.size
+    assert index.content_ids[flat_rows[np.argmax(flat_scores)]] == 2
+
+
+def test_quantized_index_rescores_exact_vectors(db, tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((300, 16)).astype(np.float32)
+    _seed_department(db, [vectors[i:i + 30].tolist() for i in range(0, 300, 30)])
+
+    from rag_index import DepartmentIndex
+    exact = DepartmentIndex.load(db, 1, version_key=())
+    quantized = DepartmentIndex.load(
+        db, 1, version_key=(), quantize=True, rescore_candidates=20, storage_dir=str(tmp_path)
+    )
+
+    assert quantized.memory_stats()["vectors_bytes"] * 4 == exact.memory_stats()["vectors_bytes"]
+    assert quantized.recall_at_5 >= 0.9
+
+    query = normalize_rows(vectors[:1] + 0.01)[0]
+    rows, scores = quantized.search(query)
+    assert rows.size == 20
+    np.testing.assert_allclose(scores, exact.vectors[rows] @ query, rtol=1e-5)
+    # Плоский поиск по квантованной матрице не выдается за двухэтапный
+    _, _, stats = quantized.search_with_stats(query.reshape(1, -1))
+    assert stats == (False, True, 300, 20)
+
+    quantized.release()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_query_variants_drop_question_words():
+    service = YandexRAGService()
+    service.query_variants = 3
+
+    assert service._generate_query_variants("Как оформить отпуск в отделе?") == [
+        "Как оформить отпуск в отделе?",
+        "оформить отпуск в отделе",
+        "оформить отпуск отделе",
+    ]
+    service.query_variants = 1
+    assert service._generate_query_variants("Как оформить отпуск?") == ["Как оформить отпуск?"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    # Кандидат 1 второй у обоих вариантов, кандидаты 0 и 2 — в top-2 только у одного
+    scores = np.array([
+        [0.9, 0.1],
+        [0.8, 0.8],
+        [0.1, 0.9],
+        [0.0, 0.0],
+    ], dtype=np.float32)
+    fused = reciprocal_rank_fusion(scores, depth=2, k=60)
+    assert int(np.argmax(fused)) == 1
+    assert fused[3] == 0
+
+
+def test_retrieve_chunks_fuses_query_variants(db):
+    doc1 = [[1.0, 0.0, 0.0]]
+    doc2 = [[0.0, 1.0, 0.0]]
+    doc3 = [[0.7, 0.7, 0.0]]
+    rag_session = _seed_department(db, [doc1, doc2, doc3])
+
+    service = YandexRAGService()
+    service.top_k = 1
+    service.mmr_lambda = 1.0
+    # Глубина слияния 2: каждый вариант голосует только за свои два лучших документа
+    service.mmr_pool_size = 2
+
+    # Один вариант ставит первым документ 1, другой — документ 2; документ 3 второй у обоих.
+    # Согласие выигрывает с запасом: 2/62 ≈ 0.0323 против 1/61 ≈ 0.0164, хотя по
+    # максимальному сходству документ 3 (0.71) уступает документам 1 и 2 (1.0)
+    top_chunks, stats = service._retrieve_chunks(db, 1, rag_session, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    assert [chunk.content_id for chunk, _ in top_chunks] == [3]
+    assert stats["query_variants"] == 2
+
+    top_chunks, _ = service._retrieve_chunks(
+        db, 1, rag_session, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.6, 0.6, 0.0]]
+    )
+    assert [chunk.content_id for chunk, _ in top_chunks] == [3]
@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import event
+
+from models_db import Access, Department, Tag
+from reference_cache import ReferenceCache
+
+
+@pytest.fixture()
+def statements(engine, db):
+    db.add_all([Department(id=1, department_name="Dept 1"), Access(id=1, access_name="Level 1"), Tag(id=1, tag_name="tag1")])
+    db.commit()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_reference_cache_reads_through_once_and_invalidates(db, statements):
+    cache = ReferenceCache(ttl_seconds=300)
+
+    references = cache.get(db)
+    assert references.department_name(1) == "Dept 1"
+    assert references.access_name(2) == "Неизвестный доступ"
+    assert references.tag_name(1) == "tag1" and references.tag_name(None) is None
+    loaded_queries = len(statements)
+
+    db.add(Tag(id=2, tag_name="tag2"))
+    db.commit()
+    assert cache.get(db).tag_name(2) is None
+
+    cache.invalidate()
+    assert cache.get(db).tag_name(2) == "tag2"
+    assert cache.version == 1
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 2 * loaded_queries
+
+
+def test_reference_cache_expires_after_ttl(db, statements):
+    cache = ReferenceCache(ttl_seconds=0)
+
+    cache.get(db)
+    db.add(Department(id=2, department_name="Dept 2"))
+    db.commit()
+    assert cache.get(db).department_name(2) == "Dept 2"
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from models_db import Access, Content, Department
+import search_index
+from search_index import ContentSearchIndex
+
+
+@pytest.fixture(autouse=True)
+def contents(db):
+    db.add_all([Department(id=1, department_name="Dept 1"), Access(id=1, access_name="Level 1"), Access(id=2, access_name="Level 2")])
+    db.add_all([
+        Content(id=1, title="Правила отпуска", description="Порядок оформления", file_path="/f/1/otpusk.pdf", access_level=1, department_id=1),
+        Content(id=2, title="Инструкция", description="Оформление отпуска и больничного", file_path="/f/1/instr.pdf", access_level=1, department_id=1),
+        Content(id=3, title="Отпуск руководителей", description=None, file_path="/f/1/boss.pdf", access_level=2, department_id=1),
+        Content(id=4, title="Охрана труда", description="Инструктаж", file_path="/f/1/ohrana.pdf", access_level=1, department_id=1),
+    ])
+    db.commit()
+
+
+def test_search_ranks_by_field_and_matches_prefixes(db):
+    index = ContentSearchIndex()
+
+    total, documents = index.search(db, 1, 1, "отпуск")
+    # Префикс находит "отпуска"; совпадение в названии весит больше, чем в описании
+    assert total == 2 and [d.id for d in documents] == [1, 2]
+
+    total, documents = index.search(db, 1, 1, "инструк")
+    assert total == 2 and documents[0].id == 2
+
+    # Все слова запроса должны встретиться в документе
+    assert index.search(db, 1, 1, "отпуска больничного")[0] == 1
+    assert index.search(db, 1, 1, "отпуска охрана") == (0, [])
+
+    # Документы другого уровня доступа не видны
+    assert index.search(db, 1, 2, "отпуск")[0] == 1
+
+    total, page = index.search(db, 1, 1, "", limit=2, offset=1)
+    assert total == 3 and [d.id for d in page] == [2, 4]
+
+
+def test_search_index_follows_upserts_and_removals(db):
+    index = ContentSearchIndex()
+    index.search(db, 1, 1, None)
+
+    content = db.get(Content, 4)
+    content.title = "График отпусков"
+    db.commit()
+    index.upsert(content)
+    index.upsert(Content(id=5, title="Отпуск по уходу", description=None, file_path="/f/1/uhod.pdf", access_level=1, department_id=1))
+    index.remove([1])
+
+    total, documents = index.search(db, 1, 1, "отпуск")
+    assert total == 3 and {d.id for d in documents} == {2, 4, 5}
+    assert index.search(db, 1, 1, "охрана") == (0, [])
+
+    # Перестроение берет состояние из БД: документ 1 там есть, документа 5 нет
+    index.rebuild(db)
+    assert {d.id for d in index.search(db, 1, 1, "отпуск")[1]} == {1, 2, 4}
+
+
+def test_warm_up_builds_in_background_once(db, monkeypatch):
+    index = ContentSearchIndex()
+    started = threading.Event()
+    release = threading.Event()
+    builds = []
+    rebuild_locked = index._rebuild_locked
+
+    def slow_rebuild(session):
+        builds.append(session)
+        started.set()
+        release.wait(5)
+        rebuild_locked(db)
+
+    monkeypatch.setattr(index, "_rebuild_locked", slow_rebuild)
+    monkeypatch.setattr(search_index, "SessionLocal", lambda: db)
+    monkeypatch.setattr(db, "close", lambda: None)
+
+    index.warm_up()
+    assert started.wait(5)
+    # Пока прогрев идет, повторный запуск не начинает второе перестроение
+    index.warm_up()
+    index._start_background_rebuild()
+    release.set()
+    # Поиск дожидается прогрева, а не строит индекс сам
+    assert index.search(db, 1, 1, "отпуск")[0] == 2
+    assert len(builds) == 1
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from document_loader import VecSearchResult, vec_search
+
+
+class _Doc:
+    def __init__(self, text, source):
+        self.page_content = text
+        self.metadata = {"source": source}
+
+
+class _Embeddings:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        return [[float(i)] for i in range(len(texts))]
+
+
+class _VectorStore:
+    def __init__(self):
+        self.searches = 0
+
+    def similarity_search_by_vector(self, embedding, k):
+        self.searches += 1
+        return [_Doc("Порядок оформления отпуска описан в регламенте отдела кадров. " * 2, "hr.pdf")]
+
+
+def test_vec_search_embeds_all_variants_in_one_call():
+    embeddings, store = _Embeddings(), _VectorStore()
+
+    result = vec_search(embeddings, "как оформить отпуск", store)
+
+    assert isinstance(result, VecSearchResult)
+    assert len(embeddings.calls) == 1 and len(embeddings.calls[0]) == 2
+    assert result.files == ["hr.pdf"] and len(result.chunks) == 1
+
+
+def test_vec_search_timeout_returns_same_shape_and_stops_the_task():
+    embeddings, store = _Embeddings(delay=0.3), _VectorStore()
+
+    chunks, files, details = vec_search(embeddings, "как оформить отпуск", store, timeout=0.05)
+
+    assert (chunks, files, details) == ([], [], [])
+    time.sleep(0.4)
+    # Задача остановилась на проверке дедлайна и не дошла до поиска
+    assert store.searches == 0
+
+
+def test_vec_search_honours_external_cancel():
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    result = vec_search(_Embeddings(), "отпуск", _VectorStore(), cancel_event=cancel_event)
+
+    assert result == VecSearchResult([], [], [])
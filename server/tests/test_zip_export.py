@@ -0,0 +1,91 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from models_db import Access, Content, Department, User
+from routes import content_routes
+from zip_export import iter_zip
+
+
+@pytest.fixture()
+def department_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(content_routes, "UPLOAD_BASE_DIR", str(tmp_path))
+    directory = tmp_path / "ContentForDepartment" / "1"
+    directory.mkdir(parents=True)
+    (directory / "report.txt").write_bytes(b"quarterly report " * 1000)
+    (directory / "scan.pdf").write_bytes(b"%PDF-1.4 public")
+    (directory / "secret.docx").write_bytes(b"PK secret")
+    return directory
+
+
+@pytest.fixture(autouse=True)
+def contents(department_dir, db, current_user):
+    db.add_all([Department(id=1, department_name="Dept 1"), Access(id=1, access_name="L1"), Access(id=2, access_name="L2")])
+    db.add(User(id=1, login="admin", password="x", role_id=1, department_id=1, access_id=2))
+    db.add(User(id=2, login="clerk", password="x", role_id=2, department_id=1, access_id=1))
+    for name, access_level in (("report.txt", 1), ("scan.pdf", 1), ("secret.docx", 2)):
+        db.add(Content(title=name, file_path=str(department_dir / name), department_id=1, access_level=access_level))
+    db.commit()
+    current_user.login_as(1)
+
+
+def test_admin_export_streams_whole_department(client):
+    response = client.get("/content/export/1.zip")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert "content-length" not in response.headers
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["report.txt", "scan.pdf", "secret.docx"]
+        assert archive.read("report.txt") == b"quarterly report " * 1000
+        assert archive.getinfo("report.txt").compress_type == zipfile.ZIP_DEFLATED
+        # Уже сжатые форматы кладутся без повторного сжатия
+        assert archive.getinfo("secret.docx").compress_type == zipfile.ZIP_STORED
+
+
+def test_user_export_is_limited_to_own_department_and_access_level(client, current_user):
+    current_user.login_as(2)
+    response = client.get("/content/export/1.zip")
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["report.txt", "scan.pdf"]
+
+    assert client.get("/content/export/2.zip").status_code == 403
+
+
+def test_export_includes_single_file_uploads(client, current_user):
+    for name, body, access_id in (("report.txt", b"single upload", 1), ("plan.txt", b"confidential plan", 2)):
+        response = client.post(
+            "/content/upload-content",
+            params={"title": name, "description": "d", "department_id": 1, "access_id": access_id},
+            files={"file": (name, body)},
+        )
+        assert response.status_code == 200
+
+    response = client.get("/content/export/1.zip")
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        # Одноименный файл из AllTypesOfFiles не перекрывает файл директории отдела
+        assert archive.namelist() == [
+            "report.txt", "scan.pdf", "secret.docx", "AllTypesOfFiles/plan.txt", "AllTypesOfFiles/report.txt",
+        ]
+        assert archive.read("report.txt") == b"quarterly report " * 1000
+        assert archive.read("AllTypesOfFiles/report.txt") == b"single upload"
+
+    current_user.login_as(2)
+    response = client.get("/content/export/1.zip")
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["report.txt", "scan.pdf", "AllTypesOfFiles/report.txt"]
+
+
+def test_iter_zip_yields_archive_in_parts(tmp_path):
+    path = tmp_path / "big.bin"
+    path.write_bytes(os.urandom(256 * 1024))
+    parts = list(iter_zip([("big.bin", str(path))], chunk_size=16 * 1024))
+    # Архив отдается частями по мере чтения, а не одним буфером в конце
+    assert len(parts) > 10
+    assert max(len(part) for part in parts) < 64 * 1024
+    with zipfile.ZipFile(io.BytesIO(b"".join(parts))) as archive:
+        assert archive.read("big.bin") == path.read_bytes()
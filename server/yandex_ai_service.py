@@ -1,5 +1,6 @@
 import os
-from typing import Dict, Any, Optional
+import asyncio
+from typing import Dict, Any, List, Optional
 from yandex_cloud_ml_sdk import AsyncYCloudML
 import logging
 
@@ -249,6 +250,22 @@ class YandexAIService:
             # Возвращаем пустой вектор при ошибке
             return [0.0] * 256
     
+    async def get_embeddings(self, texts: List[str], model: str = None) -> List[list]:
+        """
+        Получение эмбеддингов для нескольких текстов
+        
+        API эмбеддингов Yandex Cloud принимает один текст на вызов, поэтому запросы
+        отправляются одновременно, а не по очереди: время ответа ~ как у одного текста.
+        
+        Args:
+            texts: Тексты для создания эмбеддингов
+            model: Модель для эмбеддингов (text-search-doc, text-search-query)
+            
+        Returns:
+            Список векторов в порядке texts
+        """
+        return list(await asyncio.gather(*(self.get_embedding(text, model) for text in texts)))
+    
     async def generate_response(self, prompt: str) -> str:
         """
         Упрощенный метод для генерации ответа (возвращает только текст)
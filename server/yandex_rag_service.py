@@ -1,12 +1,17 @@
 import os
 import json
+import logging
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import get_db, SessionLocal
-from models_db import Content, Department, DocumentChunk, RAGSession
+from sqlalchemy import func, select
+from database import get_db, SessionLocal, AsyncSessionLocal
+from models_db import Content, Department, DocumentCentroid, DocumentChunk, RAGSession
 from yandex_ai_service import YandexAIService
+from content_cache import content_metadata_cache
+from rag_index import rag_index_cache, document_centroid, mmr_select, normalize_rows, reciprocal_rank_fusion, top_n
 import PyPDF2
 import docx
 from io import BytesIO
@@ -14,59 +19,90 @@ import re
 import pandas as pd
 from openpyxl import load_workbook
 
+logger = logging.getLogger(__name__)
+
 class YandexRAGService:
     def __init__(self):
         self.yandex_ai = YandexAIService()
         # Увеличиваем размер чанка для лучшего качества RAG
         self.chunk_size = int(os.getenv('RAG_CHUNK_SIZE', '2000'))  # Размер чанка в символах
         self.chunk_overlap = int(os.getenv('RAG_CHUNK_OVERLAP', '400'))  # Перекрытие между чанками
+        # Параметры отбора чанков для контекста
+        self.top_k = int(os.getenv('RAG_TOP_K', '5'))  # Количество чанков в контексте
+        self.relevance_threshold = float(os.getenv('RAG_RELEVANCE_THRESHOLD', '0.2'))  # Порог релевантности
+        # Диверсификация MMR: lambda=1.0 отключает штраф за похожесть на уже выбранные чанки
+        self.mmr_lambda = float(os.getenv('RAG_MMR_LAMBDA', '0.7'))
+        self.mmr_pool_size = int(os.getenv('RAG_MMR_POOL_SIZE', '25'))  # Размер пула кандидатов для MMR
+        self.chars_per_token = float(os.getenv('RAG_CHARS_PER_TOKEN', '4'))  # Оценка символов на токен
+        # Двухэтапный поиск: сначала top-N документов по центроидам, затем только их чанки
+        self.two_stage_enabled = os.getenv('RAG_TWO_STAGE', 'false').lower() == 'true'
+        self.two_stage_top_documents = int(os.getenv('RAG_TWO_STAGE_TOP_DOCS', '20'))
+        # Мультизапросный поиск: варианты вопроса объединяются через reciprocal rank fusion
+        self.query_variants = int(os.getenv('RAG_QUERY_VARIANTS', '3'))  # 1 отключает варианты
+        self.rrf_k = int(os.getenv('RAG_RRF_K', '60'))
         
     async def initialize_rag(self, department_id: int, force_reload: bool = False) -> Dict[str, Any]:
-        """Инициализация RAG системы для отдела"""
+        """
+        Инициализация RAG системы для отдела
+        
+        Запросы к БД (синхронная сессия) выполняются в пуле потоков, чтобы не блокировать
+        event loop на время индексации.
+        """
         db = SessionLocal()
         try:
             # Проверяем существование отдела
-            department = db.query(Department).filter(Department.id == department_id).first()
+            department = await run_in_threadpool(
+                lambda: db.query(Department).filter(Department.id == department_id).first()
+            )
             if not department:
                 return {
                     "success": False,
                     "message": f"Отдел с ID {department_id} не найден"
                 }
+            department_name = department.department_name
             
             # Получаем или создаем RAG сессию
-            rag_session = db.query(RAGSession).filter(RAGSession.department_id == department_id).first()
-            if not rag_session:
-                rag_session = RAGSession(department_id=department_id)
-                db.add(rag_session)
-                db.commit()
-                db.refresh(rag_session)
+            rag_session = await run_in_threadpool(self._get_or_create_rag_session, db, department_id)
             
-            # Получаем все документы отдела
-            documents = db.query(Content).filter(Content.department_id == department_id).all()
+            # Получаем все документы отдела (объекты истекают после commit, поэтому берем
+            # только нужные поля, чтобы не провоцировать ленивые запросы в event loop)
+            documents = await run_in_threadpool(
+                lambda: db.query(Content.id, Content.file_path, Content.file_hash)
+                .filter(Content.department_id == department_id)
+                .all()
+            )
             
             if not documents:
                 return {
                     "success": False,
-                    "message": f"Нет документов для обработки в отделе {department.department_name}"
+                    "message": f"Нет документов для обработки в отделе {department_name}"
                 }       
      
             # Если принудительная перезагрузка, удаляем существующие чанки
             if force_reload:
-                db.query(DocumentChunk).filter(DocumentChunk.department_id == department_id).delete()
-                db.commit()
+                await run_in_threadpool(self._delete_department_chunks, db, department_id)
             
             processed_docs = 0
             total_chunks = 0
             
             for document in documents:
                 # Проверяем, есть ли уже чанки для этого документа
-                existing_chunks = db.query(DocumentChunk).filter(
-                    DocumentChunk.content_id == document.id
-                ).count()
+                existing_chunks = await run_in_threadpool(
+                    lambda: db.query(DocumentChunk).filter(DocumentChunk.content_id == document.id).count()
+                )
                 
                 if existing_chunks > 0 and not force_reload:
                     continue
                 
+                # Тот же файл (блоб) уже проиндексирован в другом документе: копируем его
+                # чанки и эмбеддинги без повторного извлечения текста и обращений к API
+                copied_chunks = await run_in_threadpool(self._copy_chunks_from_same_blob, db, document, department_id)
+                if copied_chunks:
+                    total_chunks += copied_chunks
+                    processed_docs += 1
+                    await run_in_threadpool(db.commit)
+                    continue
+                
                 # Извлекаем текст из документа
                 text_content = await self._extract_text_from_file(document.file_path)
                 if not text_content:
@@ -76,6 +112,7 @@ class YandexRAGService:
                 chunks = self._split_text_into_chunks(text_content)
                 
                 # Создаем эмбеддинги для каждого чанка
+                document_embeddings = []
                 for i, chunk_text in enumerate(chunks):
                     try:
                         # Получаем эмбеддинг от Yandex
@@ -90,57 +127,87 @@ class YandexRAGService:
                             embedding_vector=embedding
                         )
                         db.add(chunk)
+                        document_embeddings.append(embedding)
                         total_chunks += 1
                         
                     except Exception as e:
                         print(f"Ошибка создания эмбеддинга для чанка {i} документа {document.id}: {e}")
                         continue
                 
+                # Сохраняем центроид документа для двухэтапного поиска
+                await run_in_threadpool(
+                    self._save_document_centroid, db, document, department_id, document_embeddings
+                )
+                
                 processed_docs += 1
-                db.commit()
+                await run_in_threadpool(db.commit)
             
             # Обновляем статус RAG сессии
             rag_session.is_initialized = True
             rag_session.documents_count = len(documents)
             rag_session.chunks_count = total_chunks
             rag_session.last_updated = func.now()
-            db.commit()
+            await run_in_threadpool(db.commit)
+            rag_index_cache.invalidate(department_id)
             
             return {
                 "success": True,
-                "message": f"RAG система инициализирована для отдела {department.department_name}",
+                "message": f"RAG система инициализирована для отдела {department_name}",
                 "documents_processed": processed_docs,
                 "chunks_created": total_chunks
             }
             
         except Exception as e:
-            db.rollback()
+            await run_in_threadpool(db.rollback)
             return {
                 "success": False,
                 "message": f"Ошибка инициализации RAG: {str(e)}"
             }
         finally:
-            db.close()  
+            await run_in_threadpool(db.close)
  
+    def _get_or_create_rag_session(self, db: Session, department_id: int) -> RAGSession:
+        rag_session = db.query(RAGSession).filter(RAGSession.department_id == department_id).first()
+        if not rag_session:
+            rag_session = RAGSession(department_id=department_id)
+            db.add(rag_session)
+            db.commit()
+            db.refresh(rag_session)
+        return rag_session
+    
+    def _delete_department_chunks(self, db: Session, department_id: int) -> int:
+        """Удаляет чанки и центроиды документов отдела, возвращает число удаленных чанков"""
+        deleted_chunks = db.query(DocumentChunk).filter(DocumentChunk.department_id == department_id).delete()
+        db.query(DocumentCentroid).filter(DocumentCentroid.department_id == department_id).delete()
+        db.commit()
+        return deleted_chunks
+    
     async def get_rag_status(self, department_id: int) -> Dict[str, Any]:
         """Получение статуса RAG системы для отдела"""
-        db = SessionLocal()
+        async with AsyncSessionLocal() as db:
+            return await self._get_rag_status(db, department_id)
+    
+    async def _get_rag_status(self, db: AsyncSession, department_id: int) -> Dict[str, Any]:
         try:
             # Получаем информацию об отделе
-            department = db.query(Department).filter(Department.id == department_id).first()
+            department = await db.get(Department, department_id)
             if not department:
                 raise Exception(f"Отдел с ID {department_id} не найден")
             
             # Получаем RAG сессию
-            rag_session = db.query(RAGSession).filter(RAGSession.department_id == department_id).first()
+            rag_session = (await db.execute(
+                select(RAGSession).where(RAGSession.department_id == department_id)
+            )).scalars().first()
             
             # Считаем документы в БД
-            documents_in_db = db.query(Content).filter(Content.department_id == department_id).count()
+            documents_in_db = await db.scalar(
+                select(func.count(Content.id)).where(Content.department_id == department_id)
+            )
             
             # Считаем чанки в векторной БД
-            chunks_in_vector_store = db.query(DocumentChunk).filter(
-                DocumentChunk.department_id == department_id
-            ).count()
+            chunks_in_vector_store = await db.scalar(
+                select(func.count(DocumentChunk.id)).where(DocumentChunk.department_id == department_id)
+            )
             
             is_initialized = rag_session.is_initialized if rag_session else False
             needs_reinitialization = False
@@ -164,11 +231,33 @@ class YandexRAGService:
             
         except Exception as e:
             raise Exception(f"Ошибка получения статуса RAG: {str(e)}")
+    
+    async def get_index_stats(self, department_id: int) -> Dict[str, Any]:
+        """Статистика векторного индекса отдела: память, квантование, recall@5"""
+        # Загрузка индекса — синхронные запросы и расчеты numpy, выполняем в пуле потоков
+        return await run_in_threadpool(self._get_index_stats, department_id)
+    
+    def _get_index_stats(self, department_id: int) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            rag_session = db.query(RAGSession).filter(RAGSession.department_id == department_id).first()
+            if not rag_session or not rag_session.is_initialized:
+                raise Exception(f"RAG система для отдела {department_id} не инициализирована")
+            
+            version_key = (rag_session.last_updated, rag_session.chunks_count)
+            index = rag_index_cache.get(db, department_id, version_key)
+            return {"department_id": department_id, **index.memory_stats()}
+            
+        except Exception as e:
+            raise Exception(f"Ошибка получения статистики индекса: {str(e)}")
         finally:
             db.close()
     
     async def reset_rag(self, department_id: int) -> Dict[str, Any]:
         """Сброс RAG системы для отдела"""
+        return await run_in_threadpool(self._reset_rag, department_id)
+    
+    def _reset_rag(self, department_id: int) -> Dict[str, Any]:
         db = SessionLocal()
         try:
             # Проверяем существование отдела
@@ -182,7 +271,10 @@ class YandexRAGService:
             # Удаляем все чанки отдела
             deleted_chunks = db.query(DocumentChunk).filter(
                 DocumentChunk.department_id == department_id
-            ).delete()
+            ).delete(synchronize_session=False)
+            db.query(DocumentCentroid).filter(DocumentCentroid.department_id == department_id).delete(
+                synchronize_session=False
+            )
             
             # Сбрасываем RAG сессию
             rag_session = db.query(RAGSession).filter(RAGSession.department_id == department_id).first()
@@ -193,6 +285,7 @@ class YandexRAGService:
                 rag_session.last_updated = func.now()
             
             db.commit()
+            rag_index_cache.invalidate(department_id)
             
             return {
                 "success": True,
@@ -210,49 +303,48 @@ class YandexRAGService:
 
     async def query_rag(self, department_id: int, question: str) -> Dict[str, Any]:
         """Выполнение RAG запроса"""
-        db = SessionLocal()
+        db = AsyncSessionLocal()
         try:
             # Проверяем, инициализирована ли RAG система
-            rag_session = db.query(RAGSession).filter(RAGSession.department_id == department_id).first()
+            rag_session = (await db.execute(
+                select(RAGSession).where(RAGSession.department_id == department_id)
+            )).scalars().first()
             if not rag_session or not rag_session.is_initialized:
                 raise Exception("RAG система не инициализирована для данного отдела")
             
-            # Получаем эмбеддинг для вопроса
-            question_embedding = await self.yandex_ai.get_embedding(question)
+            # Получаем эмбеддинги вопроса и его вариантов одним пакетом
+            query_variants = self._generate_query_variants(question)
+            question_embeddings = await self.yandex_ai.get_embeddings(query_variants)
             
-            # Получаем все чанки отдела
-            chunks = db.query(DocumentChunk).filter(
-                DocumentChunk.department_id == department_id
-            ).all()
+            # Отбираем наиболее релевантные и при этом непохожие друг на друга чанки.
+            # Отбор и кэши написаны для синхронной сессии: run_sync выполняет их поверх
+            # асинхронного соединения, не блокируя event loop на запросах
+            top_chunks, retrieval_stats = await db.run_sync(
+                self._retrieve_chunks, department_id, rag_session, question_embeddings
+            )
             
-            if not chunks:
-                raise Exception("Нет данных в векторной базе для данного отдела")
+            # Метаданные документов берем из кэша: без запросов к БД на каждый источник
+            department_contents = await db.run_sync(content_metadata_cache.get_department, department_id)
             
-            # Вычисляем сходство с каждым чанком
-            similarities = []
-            for chunk in chunks:
-                if chunk.embedding_vector:
-                    similarity = self._cosine_similarity(question_embedding, chunk.embedding_vector)
-                    similarities.append((chunk, similarity))
-            
-            # Сортируем по убыванию сходства и берем топ-5
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            top_chunks = similarities[:5]
+            # Все чтения из БД закончены: возвращаем соединение в пул до обращения к LLM
+            await db.close()
             
             # Формируем контекст из наиболее релевантных чанков
             context_parts = []
             sources = []
             unique_sources = {}  # Для отслеживания уникальных источников
             seen_content = set()  # Для отслеживания дубликатов по содержимому
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
             
-            print(f"RAG: Обработка {len(top_chunks)} чанков для формирования источников")
+            if debug_enabled:
+                logger.debug(f"RAG: Обработка {len(top_chunks)} чанков для формирования источников")
             
             for chunk, similarity in top_chunks:
-                if similarity > 0.2:  # Порог релевантности (снижен с 0.3 до 0.2)
+                if similarity > self.relevance_threshold:  # Порог релевантности
                     context_parts.append(chunk.chunk_text)
                     
                     # Получаем информацию о документе-источнике
-                    content = db.query(Content).filter(Content.id == chunk.content_id).first()
+                    content = department_contents.get(chunk.content_id)
                     if content:
                         # Создаем уникальный ключ для источника
                         source_key = f"{content.id}_{chunk.chunk_index}"
@@ -273,20 +365,23 @@ class YandexRAGService:
                                 "page_number": None  # Можно добавить позже
                             }
                             seen_content.add(content_key)
-                            print(f"RAG: Добавлен источник: {content.title} (релевантность: {similarity:.3f})")
-                        else:
-                            print(f"RAG: Пропущен дубликат: {content.title}")
+                            if debug_enabled:
+                                logger.debug(f"RAG: Добавлен источник: {content.title} (релевантность: {similarity:.3f})")
+                        elif debug_enabled:
+                            logger.debug(f"RAG: Пропущен дубликат: {content.title}")
             
             # Преобразуем уникальные источники в список
             sources = list(unique_sources.values())
-            print(f"RAG: Сформировано {len(sources)} уникальных источников")
+            if debug_enabled:
+                logger.debug(f"RAG: Сформировано {len(sources)} уникальных источников")
             
             if not context_parts:
                 return {
                     "answer": "К сожалению, не найдено релевантной информации для ответа на ваш вопрос. Попробуйте переформулировать запрос или обратитесь к другим источникам.",
                     "sources": [],
                     "context_used": 0,
-                    "no_sources_found": True
+                    "no_sources_found": True,
+                    "retrieval": retrieval_stats
                 }
             
             # Формируем промпт с контекстом
@@ -346,14 +441,177 @@ class YandexRAGService:
                 "sources": reordered_sources,
                 "context_used": len(context_parts),
                 "sources_count": len(reordered_sources),
-                "main_source_number": main_source_number
+                "main_source_number": main_source_number,
+                "retrieval": retrieval_stats
             }
             
         except Exception as e:
             raise Exception(f"Ошибка RAG запроса: {str(e)}")
         finally:
-            db.close()    
+            await db.close()    
+
+    def _generate_query_variants(self, question: str) -> List[str]:
+        """
+        Варианты вопроса для мультизапросного поиска: исходный вопрос,
+        вопрос без вопросительных слов и набор ключевых слов.
+        """
+        question_words = {'что', 'как', 'где', 'когда', 'почему', 'какой', 'какая', 'какие', 'кто', 'зачем', 'сколько'}
+        words = re.findall(r'\w+', question.lower())
+        
+        variants = [question]
+        filtered = [word for word in words if word not in question_words]
+        if filtered:
+            variants.append(' '.join(filtered))
+        keywords = [word for word in filtered if len(word) > 3]
+        if keywords:
+            variants.append(' '.join(keywords))
+        
+        # Убираем повторы, сохраняя порядок
+        unique_variants = []
+        for variant in variants:
+            if variant.strip() and variant.lower() not in (v.lower() for v in unique_variants):
+                unique_variants.append(variant)
+        return unique_variants[:max(1, self.query_variants)]
+
+    def _retrieve_chunks(self, db: Session, department_id: int, rag_session: RAGSession,
+                         question_embeddings: List[List[float]]) -> Tuple[List[Tuple[Any, float]], Dict[str, Any]]:
+        """
+        Отбор чанков для контекста: векторный скоринг всех вариантов вопроса по матрице
+        отдела одним матричным произведением, слияние ранжирований через RRF,
+        затем MMR-диверсификация пула кандидатов.
 
+        question_embeddings[0] — эмбеддинг исходного вопроса, остальные — его вариантов.
+        Возвращает список (чанк, сходство) и статистику отбора.
+        """
+        version_key = (rag_session.last_updated, rag_session.chunks_count)
+        index = rag_index_cache.get(db, department_id, version_key)
+        if index.size == 0:
+            raise Exception("Нет данных в векторной базе для данного отдела")
+        
+        queries = np.asarray(question_embeddings, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != index.dimension:
+            raise Exception("Размерность эмбеддинга вопроса не совпадает с индексом отдела")
+        # Варианты, для которых эмбеддинг не получен (нулевой вектор), не участвуют в поиске
+        queries = normalize_rows(queries[[0] + [i for i in range(1, len(queries)) if np.any(queries[i])]])
+        
+        top_documents = self.two_stage_top_documents if self.two_stage_enabled else None
+        rows, variant_scores, search_stats = index.search_with_stats(queries, top_documents=top_documents)
+        
+        # Сходство чанка — лучшее по вариантам; порядок — по слиянию ранжирований вариантов
+        pool_size = max(self.mmr_pool_size, self.top_k)
+        scores = variant_scores.max(axis=1)
+        fused = reciprocal_rank_fusion(variant_scores, pool_size, self.rrf_k)
+        
+        # Пул кандидатов: лучшие по слиянию и выше порога релевантности
+        pool = top_n(fused, pool_size)
+        pool = pool[(fused[pool] > 0) & (scores[pool] > self.relevance_threshold)]
+        pool_rows, pool_scores = rows[pool], scores[pool]
+        baseline_rows = pool_rows[:self.top_k]
+        
+        if self.mmr_lambda < 1.0 and pool.size > self.top_k:
+            picked = mmr_select(index.vectors_for(pool_rows), pool_scores, self.top_k, self.mmr_lambda)
+            selected_rows, selected_scores = pool_rows[picked], pool_scores[picked]
+        else:
+            selected_rows, selected_scores = baseline_rows, pool_scores[:self.top_k]
+        
+        # Тексты подгружаем только для выбранных чанков
+        selected_ids = [int(chunk_id) for chunk_id in index.chunk_ids[selected_rows]]
+        chunks_by_id = {}
+        if selected_ids:
+            chunk_rows = db.query(
+                DocumentChunk.id,
+                DocumentChunk.content_id,
+                DocumentChunk.chunk_index,
+                DocumentChunk.chunk_text,
+            ).filter(DocumentChunk.id.in_(selected_ids)).all()
+            chunks_by_id = {row.id: row for row in chunk_rows}
+        
+        top_chunks = [
+            (chunks_by_id[int(index.chunk_ids[row])], float(score))
+            for row, score in zip(selected_rows, selected_scores)
+            if int(index.chunk_ids[row]) in chunks_by_id
+        ]
+        
+        # Экономия токенов: перекрытия соседних окон одного документа, которые MMR исключил из контекста
+        tokens_saved = max(
+            0,
+            self._estimate_overlap_tokens(index, baseline_rows) - self._estimate_overlap_tokens(index, selected_rows)
+        )
+        retrieval_stats = {
+            "mode": "two_stage" if search_stats.two_stage else "flat",
+            "quantized": search_stats.quantized,
+            "query_variants": int(queries.shape[0]),
+            "chunks_total": index.size,
+            "chunks_scored": search_stats.rows_scored,
+            "chunks_rescored": search_stats.rows_rescored,
+            "candidate_pool": int(pool.size),
+            "mmr_lambda": self.mmr_lambda,
+            "prompt_tokens_saved": tokens_saved,
+        }
+        logger.info(
+            f"RAG: отдел {department_id}: оценено {search_stats.rows_scored} из {index.size} чанков"
+            + (f" (переоценено {search_stats.rows_rescored})" if search_stats.quantized else "")
+            + f", пул {pool.size}, "
+            f"выбрано {len(top_chunks)}, сэкономлено ~{tokens_saved} токенов промпта"
+        )
+        return top_chunks, retrieval_stats
+    
+    def _save_document_centroid(self, db: Session, document: Content, department_id: int,
+                                embeddings: List[List[float]]) -> None:
+        """Сохраняет (или обновляет) центроид эмбеддингов чанков документа"""
+        if not embeddings:
+            return
+        centroid = document_centroid(np.asarray(embeddings, dtype=np.float32))
+        record = db.query(DocumentCentroid).filter(DocumentCentroid.content_id == document.id).first()
+        if record is None:
+            record = DocumentCentroid(content_id=document.id)
+            db.add(record)
+        record.department_id = department_id
+        record.centroid_vector = [float(value) for value in centroid]
+        record.chunks_count = len(embeddings)
+    
+    def _copy_chunks_from_same_blob(self, db: Session, document, department_id: int) -> int:
+        """
+        Копирует чанки документа с тем же file_hash (одинаковое содержимое, например
+        в другом отделе) и сохраняет центроид; возвращает число скопированных чанков
+        """
+        if not document.file_hash:
+            return 0
+        source_id = db.execute(
+            select(DocumentChunk.content_id)
+            .join(Content, Content.id == DocumentChunk.content_id)
+            .where(Content.file_hash == document.file_hash, Content.id != document.id)
+            .limit(1)
+        ).scalar_one_or_none()
+        if source_id is None:
+            return 0
+        source_chunks = db.execute(
+            select(DocumentChunk.chunk_index, DocumentChunk.chunk_text, DocumentChunk.embedding_vector)
+            .where(DocumentChunk.content_id == source_id)
+            .order_by(DocumentChunk.chunk_index)
+        ).all()
+        db.add_all(
+            DocumentChunk(
+                content_id=document.id,
+                department_id=department_id,
+                chunk_text=chunk.chunk_text,
+                chunk_index=chunk.chunk_index,
+                embedding_vector=chunk.embedding_vector,
+            )
+            for chunk in source_chunks
+        )
+        embeddings = [chunk.embedding_vector for chunk in source_chunks if chunk.embedding_vector]
+        self._save_document_centroid(db, document, department_id, embeddings)
+        return len(source_chunks)
+    
+    def _estimate_overlap_tokens(self, index, rows: np.ndarray) -> int:
+        """Оценка токенов, повторяющихся в контексте из-за перекрытия соседних чанков одного документа"""
+        if rows.size < 2:
+            return 0
+        selected = set(zip(index.content_ids[rows].tolist(), index.chunk_indexes[rows].tolist()))
+        adjacent_pairs = sum(1 for content_id, chunk_index in selected if (content_id, chunk_index + 1) in selected)
+        return int(adjacent_pairs * self.chunk_overlap / self.chars_per_token)
+    
     async def _extract_text_from_file(self, file_path: str) -> str:
         """Извлечение текста из файла"""
         try:
@@ -574,16 +832,16 @@ class YandexRAGService:
         is_no_info = any(re.search(pattern, answer_lower) for pattern in no_info_patterns)
         
         # Отладочная информация
-        print(f"🔍 Отладка _fix_censored_response:")
-        print(f"   Вопрос: {question}")
-        print(f"   Ответ: {answer[:100]}...")
-        print(f"   is_censored: {is_censored}")
-        print(f"   is_no_info: {is_no_info}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Отладка _fix_censored_response: вопрос={question!r}, ответ={answer[:100]!r}..., "
+                f"is_censored={is_censored}, is_no_info={is_no_info}"
+            )
         
         # Дополнительная проверка на "нет информации" без паттернов
         if "нет информации" in answer_lower:
             is_no_info = True
-            print(f"   ⚠️ Найдено 'нет информации' в ответе")
+            logger.debug("Найдено 'нет информации' в ответе")
         
         if is_censored:
             print(f"⚠️ Обнаружен цензурный ответ, исправляем...")
@@ -712,7 +970,7 @@ class YandexRAGService:
         
         # Проверяем, что номер основного источника в допустимом диапазоне
         if main_source_number < 1 or main_source_number > len(reordered_sources):
-            print(f"Номер основного источника {main_source_number} вне диапазона, используем первый источник")
+            logger.debug(f"Номер основного источника {main_source_number} вне диапазона, используем первый источник")
             return reordered_sources
         
         # Находим индекс основного источника (main_source_number - 1, так как индексы начинаются с 0)
@@ -723,7 +981,8 @@ class YandexRAGService:
             main_source = reordered_sources.pop(main_source_index)
             reordered_sources.insert(0, main_source)
             
-            print(f"Основной источник {main_source_number} перемещен на первое место: {main_source.get('file_name', 'unknown')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Основной источник {main_source_number} перемещен на первое место: {main_source.get('file_name', 'unknown')}")
         
         return reordered_sources
 
@@ -788,7 +1047,7 @@ class YandexRAGService:
                 best_match_score = score
                 best_match_index = i
         
-        print(f"RAG: Анализ ответа - выбран источник {best_match_index + 1} с баллом {best_match_score}")
+        logger.debug(f"RAG: Анализ ответа - выбран источник {best_match_index + 1} с баллом {best_match_score}")
         
         return best_match_index + 1  # +1 потому что индексы начинаются с 1
 
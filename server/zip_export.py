@@ -0,0 +1,78 @@
+"""
+Потоковая выгрузка файлов в ZIP: архив формируется на лету частями, без временного
+файла и с постоянным расходом памяти независимо от объема выгрузки
+"""
+
+import os
+import zipfile
+from typing import Iterable, Iterator, List, Tuple
+
+# Размер части при чтении файлов; пиковая память на выгрузку — порядка этого значения
+ZIP_EXPORT_CHUNK_SIZE = int(os.getenv("ZIP_EXPORT_CHUNK_SIZE", str(1024 * 1024)))
+
+# Форматы, которые уже сжаты: повторное сжатие только тратит процессор, их кладем без сжатия
+STORED_EXTENSIONS = frozenset({
+    ".zip", ".7z", ".rar", ".gz", ".bz2", ".xz",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp",
+    ".mp3", ".mp4", ".avi", ".mkv", ".mov", ".webm",
+})
+
+
+class _ZipStream:
+    """Приемник записей ZipFile без seek/tell: ZipFile пишет в него, генератор забирает готовые части"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def compress_type_for(filename: str) -> int:
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def iter_zip(entries: Iterable[Tuple[str, str]], chunk_size: int = ZIP_EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Генерирует ZIP-архив из пар (имя в архиве, путь к файлу).
+
+    Поток не поддерживает seek, поэтому ZipFile пишет размеры и CRC после данных
+    (data descriptor), а для файлов больше 4 ГБ и архивов больше 65535 записей — ZIP64.
+    Файлы, удаленные во время выгрузки, пропускаются.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, mode="w", allowZip64=True) as archive:
+        for arcname, path in entries:
+            try:
+                source = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with source:
+                info = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+                info.compress_type = compress_type_for(arcname)
+                with archive.open(info, mode="w") as target:
+                    while True:
+                        chunk = source.read(chunk_size)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        data = stream.drain()
+                        if data:
+                            yield data
+            data = stream.drain()
+            if data:
+                yield data
+    # Центральный каталог записывается при закрытии архива
+    yield stream.drain()
@@ -0,0 +1,37 @@
+/**
+ * Утилита для списков с курсорной пагинацией
+ * (курсор следующей страницы приходит в заголовке X-Next-Cursor)
+ */
+
+// Размер страницы в админских списках (сервер принимает до 500)
+export const PAGE_SIZE = 100;
+
+/**
+ * Загружает одну страницу списка
+ * @param {Object} client - axios или экземпляр axios
+ * @param {string} url - Адрес списка
+ * @param {Object} params - Параметры запроса (фильтры)
+ * @param {string|null} cursor - Курсор страницы (null — первая страница)
+ * @param {Function} extract - Достает массив элементов из тела ответа
+ * @returns {Promise<{items: Array, nextCursor: string|null, total: number|null}>} - Элементы страницы,
+ *   курсор следующей и общее количество (если запрошено параметром with_total)
+ *
+ * @example
+ * const page = await fetchPage(axios, '/feedback/list', {}, this.feedbackCursor, data => data.feedback_list);
+ * this.feedbackList.push(...page.items);
+ * this.feedbackCursor = page.nextCursor; // null — страниц больше нет, кнопка "Загрузить еще" скрывается
+ */
+export const fetchPage = async (client, url, params = {}, cursor = null, extract = data => data) => {
+  const pageParams = { ...params, limit: PAGE_SIZE };
+  if (cursor) {
+    pageParams.cursor = cursor;
+  }
+  const response = await client.get(url, { params: pageParams });
+  return {
+    items: extract(response.data),
+    nextCursor: response.headers['x-next-cursor'] || null,
+    total: response.headers['x-total-count'] ? Number(response.headers['x-total-count']) : null
+  };
+};
+
+export default fetchPage;